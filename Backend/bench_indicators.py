@@ -0,0 +1,489 @@
+"""
+INDICATOR ENGINE BENCHMARK
+==========================
+Full-universe metrics build (the Scraper/metrics.py step that produces the
+metrics table) on synthetic OHLCV universes, CPU only, no network.  Every
+implementation of the metrics indicators is timed on the same panel:
+
+  legacy   per-symbol groupby('symbol').apply with pandas rolling / ewm
+           (the pre-indicator_engine calculate_indicators, kept below)
+  engine   indicator_engine.calculate_indicators on a [days x symbols] panel
+           (every --workers N > 1 also times the shared-memory multi-process
+           build and reports its speedup and efficiency over one process)
+  stream   indicator_stream.IndicatorState replaying the history bar by bar
+
+and reported as seconds, rows/sec and peak traced allocation (tracemalloc,
+measured in a separate untimed run; worker processes are not traced).
+
+Parity, per indicator, against the engine:
+  legacy   after the metrics-table cleanup (inf -> NaN -> 0, round 4); only
+           4th-decimal rounding ties are allowed (PARITY_TOLERANCE)
+  parallel bit-identical to the single-process build, for every worker count
+  stream   last --verify_bars bars of every symbol streamed onto a state
+           built from the rest (indicator_stream.verify_streaming), within
+           STREAM_RTOL / STREAM_ATOL
+  served   the engine's metrics-table rows fed through both consumers:
+           train.build_feature_rows + fitted scalers (training X) and the
+           stock_prices / metrics join ml_model fetches through
+           feature_pipeline.prepare_model_input (served input), on windows
+           ending at the same bar for --served_symbols symbols; bit-identical
+Any failure raises AssertionError after the report is written.
+
+How to Run:
+-----------
+# One universe
+python bench_indicators.py \
+    --symbols 1410 \
+    --days 2500 \
+    --repeats 1 \
+    --workers 1 \
+    --output logs/bench/indicators.json
+
+# Worker scaling: one universe built with 1, 2, 4 and 8 processes.  Speedup is
+# engine seconds / parallel seconds; efficiency is speedup / N.  Counts above
+# the machine's cores (reported as "cpus") cannot scale.
+python bench_indicators.py --symbols 2000 --days 2500 --skip_legacy --skip_stream --workers 1,2,4,8
+
+# Size sweep (symbols x days); legacy is skipped above --legacy_max_rows.
+# The in-memory engine peaks near 0.9 KB per row: 2000x4000 (~6.5M rows)
+# needs about 8 GB of RAM.  The JSON is rewritten after every size.
+python bench_indicators.py --sizes 10x250,100x1000,500x2000,2000x4000 --workers 2
+"""
+
+import os
+import json
+import time
+import argparse
+import logging
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from bench_inference import git_revision, peak_rss_mb
+from train_bench import build_synthetic_index
+
+logger = logging.getLogger(__name__)
+
+# A 4-decimal rounding tie flips the last digit; anything larger is a real mismatch.
+PARITY_TOLERANCE = 1.5e-4
+# Streamed rows vs the full recompute (indicator_stream.verify_streaming defaults).
+STREAM_RTOL = 1e-9
+STREAM_ATOL = 1e-9
+
+DEFAULT_SIZES = "10x250,100x1000,500x2000,2000x4000"
+
+
+# ============================================================
+# 1. Synthetic OHLCV universe
+# ============================================================
+def build_synthetic_ohlcv(num_symbols: int, num_days: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Raw stock_prices rows for a staggered-listing universe (train_bench
+    layout): random-walk closes, intraday range around them, and a few
+    missing closes / zero-volume days like the scraped data has.
+    """
+    rng = np.random.default_rng(seed)
+    sym_ids, times = build_synthetic_index(num_symbols, num_days, seed)
+    n = len(sym_ids)
+    starts = np.flatnonzero(np.r_[True, sym_ids[1:] != sym_ids[:-1]])
+    lengths = np.diff(np.r_[starts, n])
+    log_ret = rng.normal(0.0, 0.02, n)
+    log_price = np.cumsum(log_ret)
+    log_price -= np.repeat(log_price[starts] - log_ret[starts], lengths)
+    base = np.repeat(rng.uniform(5.0, 150.0, num_symbols), lengths)
+    close = np.round(base * np.exp(log_price), 2)
+    spread = rng.uniform(0.0, 0.03, n)
+    volume = rng.integers(0, 2_000_000, n).astype(np.float64)
+    volume[rng.random(n) < 0.01] = 0.0
+    close[rng.random(n) < 0.0005] = np.nan
+
+    df = pd.DataFrame({
+        'time': times,
+        'symbol': np.char.add('S', np.char.zfill(sym_ids.astype(str), 4)),
+        'open': close,
+        'high': np.round(close * (1.0 + spread), 2),
+        'low': np.round(close * (1.0 - spread), 2),
+        'close': close,
+        'volume': volume,
+    })
+    # Scraper/data.py writes one block per symbol in fetch order, not sorted by symbol.
+    block_order = rng.permutation(num_symbols)
+    rows = np.concatenate([np.arange(starts[b], starts[b] + lengths[b]) for b in block_order])
+    return df.iloc[rows].reset_index(drop=True)
+
+
+# ============================================================
+# 2. Legacy per-symbol implementation
+# ============================================================
+def legacy_calculate_indicators(group):
+    group = group.sort_values('time')
+    close = group['close']
+    high = group['high']
+    low = group['low']
+    volume = group['volume']
+
+    group['MA20'] = close.rolling(window=20).mean()
+    group['MA50'] = close.rolling(window=50).mean()
+    group['EMA20'] = close.ewm(span=20, adjust=False).mean()
+
+    delta = close.diff()
+    gain = delta.clip(lower=0)
+    loss = -1 * delta.clip(upper=0)
+    avg_gain = gain.ewm(alpha=1/14, min_periods=14, adjust=False).mean()
+    avg_loss = loss.ewm(alpha=1/14, min_periods=14, adjust=False).mean()
+    rs = np.where(avg_loss == 0, 0, avg_gain / avg_loss)
+    group['RSI'] = np.where(avg_loss == 0, 100, 100 - (100 / (1 + rs)))
+    ema12 = close.ewm(span=12, adjust=False).mean()
+    ema26 = close.ewm(span=26, adjust=False).mean()
+    group['MACD'] = ema12 - ema26
+
+    group['Rolling_Vol_20d_std'] = close.rolling(window=20).std()
+    prev_close = close.shift(1)
+    tr = pd.concat([high - low, (high - prev_close).abs(), (low - prev_close).abs()], axis=1).max(axis=1)
+    group['ATR'] = tr.ewm(alpha=1/14, min_periods=14, adjust=False).mean()
+
+    group['Volume_MA20'] = volume.rolling(window=20).mean()
+    group['Volume_Change_pct'] = volume.pct_change(fill_method=None)
+
+    group['Daily_Return_1d'] = close.pct_change(periods=1, fill_method=None)
+    group['Daily_Return_5d'] = close.pct_change(periods=5, fill_method=None)
+    first_close = close.iloc[0] if len(close) > 0 else 1
+    group['Cumulative_Return'] = np.where(first_close == 0, 0, (close / first_close) - 1)
+    group['Daily_Range'] = high - low
+
+    group['Vol_Close_Corr_20d'] = close.rolling(window=20).corr(volume)
+
+    bb_mavg = close.rolling(window=20).mean()
+    bb_std = close.rolling(window=20).std()
+    group['BB_Width'] = np.where(bb_mavg == 0, 0, ((bb_mavg + 2 * bb_std) - (bb_mavg - 2 * bb_std)) / bb_mavg)
+
+    up_move = high - high.shift(1)
+    down_move = low.shift(1) - low
+    plus_dm = pd.Series(np.where((up_move > down_move) & (up_move > 0), up_move, 0), index=close.index)
+    minus_dm = pd.Series(np.where((down_move > up_move) & (down_move > 0), down_move, 0), index=close.index)
+    safe_atr = np.where(group['ATR'] == 0, np.nan, group['ATR'])
+    plus_di14 = 100 * (plus_dm.ewm(alpha=1/14, min_periods=14, adjust=False).mean() / safe_atr)
+    minus_di14 = 100 * (minus_dm.ewm(alpha=1/14, min_periods=14, adjust=False).mean() / safe_atr)
+    di_sum = (plus_di14 + minus_di14).abs()
+    dx = np.where(di_sum == 0, 0, 100 * (plus_di14 - minus_di14).abs() / di_sum)
+    group['ADX'] = pd.Series(dx, index=close.index).ewm(alpha=1/14, min_periods=14, adjust=False).mean()
+
+    obv_change = np.where(close > prev_close, volume, np.where(close < prev_close, -volume, 0))
+    obv = pd.Series(obv_change, index=close.index).cumsum()
+    group['OBV_Slope_5d'] = obv.diff(periods=5) / 5
+
+    group['Lagged_Return_t1'] = group['Daily_Return_1d'].shift(1)
+    group['Lagged_Return_t3'] = group['Daily_Return_1d'].shift(3)
+    group['Lagged_Return_t5'] = group['Daily_Return_1d'].shift(5)
+    # Denominator updated to MA50 with the engine (one Dist_from_MA50 formula everywhere).
+    ma50 = group['MA50'].replace(0, np.nan)
+    group['Dist_from_MA50'] = (close - ma50) / (ma50 + 1e-9)
+    return group
+
+
+# ============================================================
+# 3. Benchmark
+# ============================================================
+def finalize_metrics(metrics_df: pd.DataFrame) -> pd.DataFrame:
+    """Scraper/metrics.py output cleanup: indicator columns only, inf/NaN -> 0, 4 decimals."""
+    from indicator_engine import INDICATOR_COLUMNS
+    out = metrics_df[INDICATOR_COLUMNS].replace([np.inf, -np.inf], np.nan).fillna(0)
+    return out.round(4)
+
+
+def compare_metrics(legacy: pd.DataFrame, engine: pd.DataFrame) -> dict:
+    legacy, engine = legacy.sort_index(), engine.sort_index()
+    if not legacy.index.equals(engine.index):
+        raise AssertionError("Legacy and engine metrics cover different rows")
+    diff = (legacy - engine).abs()
+    mismatches = diff > PARITY_TOLERANCE
+    return {
+        'max_abs_diff': {c: float(diff[c].max()) for c in diff.columns},
+        'mismatches_by_column': {c: int(mismatches[c].sum()) for c in diff.columns},
+        'rounding_ties': int((diff > 0).to_numpy().sum()),
+        'mismatches': int(mismatches.to_numpy().sum()),
+    }
+
+
+def compare_identical(expected: pd.DataFrame, actual: pd.DataFrame) -> dict:
+    """Bitwise comparison of the raw indicator columns (NaN == NaN)."""
+    from indicator_engine import INDICATOR_COLUMNS
+    report = {'mismatches_by_column': {}}
+    for col in INDICATOR_COLUMNS:
+        e, a = expected[col].to_numpy(), actual[col].to_numpy()
+        report['mismatches_by_column'][col] = int((~((e == a) | (np.isnan(e) & np.isnan(a)))).sum())
+    report['mismatches'] = sum(report['mismatches_by_column'].values())
+    return report
+
+
+def measure(fn, repeats: int, trace_memory: bool) -> tuple:
+    """
+    (median seconds, peak traced MB or None, result of the last timed run).
+    The traced run goes first and no two results are alive at once, so the
+    benchmark's own footprint stays at one output per implementation.
+    """
+    peak_mb = None
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            fn()
+            peak_mb = tracemalloc.get_traced_memory()[1] / (1024.0 * 1024.0)
+        finally:
+            tracemalloc.stop()
+    times, result = [], None
+    for _ in range(repeats):
+        result = None
+        t0 = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - t0)
+    return float(np.median(times)), peak_mb, result
+
+
+def _timing(rows: int, seconds: float, peak_mb) -> dict:
+    return {
+        'seconds': seconds,
+        'rows_per_s': float(rows / max(seconds, 1e-12)),
+        'peak_alloc_mb': peak_mb,
+    }
+
+
+def check_served_parity(df: pd.DataFrame, engine: pd.DataFrame, num_symbols: int, seed: int = 0) -> dict:
+    """
+    Model input built from the engine's metrics rows by training and by serving.
+
+    The rows are written as Scraper/metrics.py writes metrics.csv (next to
+    the prices), train.build_feature_rows reads both back and build_scalers
+    is fitted on the result.  The served window is the stock_prices /
+    metrics INNER join (dataset_service.get_prediction_window) of the same
+    files, PREDICTION_FETCH_ROWS bars ending at a symbol's last usable bar,
+    through prepare_model_input.  A window is usable when its first bar has
+    prices and a non-zero MA50: gaps that reach back past the window start
+    are filled from older bars in training only.
+    """
+    import tempfile
+    from feature_pipeline import (
+        FEATURE_SCHEMA, PRICE_COLUMNS, apply_training_scalers, feature_window, prepare_model_input, scaler_vectors,
+    )
+    from ml_model import LOOKBACK_WINDOW, PREDICTION_FETCH_ROWS
+    from train import build_feature_rows, build_scalers
+
+    table = pd.concat([engine[['time', 'symbol']], finalize_metrics(engine)], axis=1)
+    with tempfile.TemporaryDirectory() as tmp:
+        prices_path, metrics_path = os.path.join(tmp, 'stock_prices.csv'), os.path.join(tmp, 'metrics.csv')
+        df.to_csv(prices_path, index=False)
+        table.to_csv(metrics_path, index=False)
+        rows = build_feature_rows(metrics_path, prices_path)
+        joined = pd.read_csv(prices_path).merge(pd.read_csv(metrics_path), on=['time', 'symbol'], how='inner')
+    scaler_X, scaler_Y = build_scalers(rows['features'], np.ones(len(rows['features']), dtype=bool))
+    x_vectors, y_vectors = scaler_vectors(scaler_X), scaler_vectors(scaler_Y)
+    price_idx = [FEATURE_SCHEMA.index(c) for c in PRICE_COLUMNS]
+    ma50_idx = FEATURE_SCHEMA.index('ma50')
+
+    counts = joined['symbol'].value_counts()
+    eligible = np.sort(counts.index[counts >= PREDICTION_FETCH_ROWS].to_numpy(dtype=object))
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(eligible, size=min(num_symbols, len(eligible)), replace=False) if len(eligible) else []
+
+    mismatches = np.zeros(len(FEATURE_SCHEMA), dtype=np.int64)
+    max_abs_diff, windows, skipped = 0.0, 0, 0
+    for symbol in sample:
+        window = feature_window(joined[joined['symbol'] == symbol])
+        train_rows = np.flatnonzero(rows['symbol'] == symbol)
+        if not np.array_equal(window['time'], rows['time'][train_rows]):
+            raise AssertionError(f"Served and training rows for {symbol} cover different bars")
+        ends = [e for e in range(len(train_rows) - 1, PREDICTION_FETCH_ROWS - 2, -1)
+                if np.isfinite(window['features'][e - PREDICTION_FETCH_ROWS + 1, price_idx]).all()
+                and window['features'][e - PREDICTION_FETCH_ROWS + 1, ma50_idx] != 0]
+        if not ends:
+            skipped += 1
+            continue
+        end = ends[0]
+        served = prepare_model_input(window['features'][end - PREDICTION_FETCH_ROWS + 1:end + 1],
+                                     LOOKBACK_WINDOW, x_vectors, y_vectors)
+        expected = apply_training_scalers(rows['features'][train_rows[end - LOOKBACK_WINDOW + 1:end + 1]],
+                                          scaler_X, scaler_Y)
+        same = (served == expected) | (np.isnan(served) & np.isnan(expected))
+        mismatches += (~same).sum(axis=0)
+        max_abs_diff = max(max_abs_diff, float(np.nanmax(np.abs(served.astype(np.float64) - expected))))
+        windows += 1
+    return {
+        'windows': windows,
+        'skipped_symbols': skipped,
+        'max_abs_diff': max_abs_diff,
+        'mismatches_by_column': {c: int(n) for c, n in zip(FEATURE_SCHEMA, mismatches)},
+        'mismatches': int(mismatches.sum()),
+    }
+
+
+def run_indicator_benchmark(num_symbols, num_days, repeats, seed=0, skip_legacy=False, workers=(1,),
+                            skip_stream=False, verify_bars=20, trace_memory=True, served_symbols=0):
+    from indicator_engine import calculate_indicators
+    from indicator_stream import IndicatorState, verify_streaming
+
+    df = build_synthetic_ohlcv(num_symbols, num_days, seed)
+    rows = int(len(df))
+    logger.info("Synthetic universe: %d symbols x %d days = %d rows", num_symbols, num_days, rows)
+
+    impls, parity, failures = {}, {}, []
+    engine_s, peak, engine = measure(lambda: calculate_indicators(df), repeats, trace_memory)
+    impls['engine'] = _timing(rows, engine_s, peak)
+
+    scaling = {}
+    for n in sorted({int(w) for w in workers if int(w) > 1}):
+        seconds, peak, parallel = measure(lambda n=n: calculate_indicators(df, workers=n), repeats, trace_memory)
+        impls[f'engine_w{n}'] = dict(_timing(rows, seconds, peak), workers=n)
+        speedup = float(engine_s / max(seconds, 1e-12))
+        scaling[str(n)] = {'seconds': seconds, 'speedup': speedup, 'efficiency': speedup / n}
+        parity[f'parallel_w{n}_vs_engine'] = compare_identical(engine, parallel)
+        if parity[f'parallel_w{n}_vs_engine']['mismatches']:
+            failures.append(f'parallel_w{n}_vs_engine')
+        del parallel
+
+    report = {'symbols': num_symbols, 'days': num_days, 'rows': rows, 'cpus': os.cpu_count(),
+              'workers': sorted({1, *map(int, workers)}), 'engine_s': engine_s, 'scaling': scaling}
+
+    if not skip_legacy:
+        legacy_s, peak, legacy = measure(
+            lambda: df.groupby('symbol', group_keys=False).apply(legacy_calculate_indicators), repeats, trace_memory,
+        )
+        impls['legacy'] = _timing(rows, legacy_s, peak)
+        parity['legacy_vs_engine'] = compare_metrics(finalize_metrics(legacy), finalize_metrics(engine))
+        if parity['legacy_vs_engine']['mismatches']:
+            failures.append('legacy_vs_engine')
+        report.update(legacy_s=legacy_s, speedup=float(legacy_s / max(engine_s, 1e-12)))
+        del legacy
+
+    if served_symbols:
+        parity['served_vs_training'] = check_served_parity(df, engine, served_symbols, seed)
+        if parity['served_vs_training']['mismatches'] or not parity['served_vs_training']['windows']:
+            failures.append('served_vs_training')
+
+    # verify_streaming recomputes the engine output it compares against.
+    del engine
+    if not skip_stream:
+        seconds, peak, _ = measure(lambda: IndicatorState.from_history(df), repeats, trace_memory)
+        impls['stream'] = _timing(rows, seconds, peak)
+        stream = verify_streaming(df, verify_bars, rtol=STREAM_RTOL, atol=STREAM_ATOL)
+        parity['stream_vs_engine'] = {
+            'rows': stream['rows'],
+            'max_abs_diff': {c: r['max_abs_diff'] for c, r in stream['columns'].items()},
+            'mismatches_by_column': {c: r['mismatches'] for c, r in stream['columns'].items()},
+            'mismatches': sum(r['mismatches'] for r in stream['columns'].values()),
+        }
+        if not stream['ok']:
+            failures.append('stream_vs_engine')
+
+    report.update(implementations=impls, parity=parity, failures=failures)
+    return report
+
+
+def parse_sizes(spec: str) -> list:
+    """"10x250,2000x4000" -> [(10, 250), (2000, 4000)]"""
+    sizes = []
+    for item in spec.split(','):
+        symbols, _, days = item.strip().lower().partition('x')
+        if not symbols.isdigit() or not days.isdigit():
+            raise ValueError(f"Bad size {item!r}; expected SYMBOLSxDAYS, e.g. 100x1000")
+        sizes.append((int(symbols), int(days)))
+    return sizes
+
+
+def print_report(r: dict):
+    print(f"\nMetrics build — {r['symbols']} symbols x {r['days']} days ({r['rows']} rows)")
+    for name, t in r['implementations'].items():
+        peak = f"{t['peak_alloc_mb']:8.0f} MB" if t['peak_alloc_mb'] is not None else "       - MB"
+        print(f"  {name:<16s} {t['seconds']:9.2f} s  {t['rows_per_s']:12,.0f} rows/s  peak alloc {peak}")
+    if 'speedup' in r:
+        print(f"  engine speedup over legacy: {r['speedup']:.1f}x  "
+              f"(rounding ties={r['parity']['legacy_vs_engine']['rounding_ties']})")
+    for n, sc in r['scaling'].items():
+        print(f"  {n} workers vs 1: {sc['speedup']:.2f}x speedup, {100 * sc['efficiency']:.0f}% efficiency "
+              f"({r['cpus']} cpus)")
+    for name, p in r['parity'].items():
+        bad = {c: n for c, n in p['mismatches_by_column'].items() if n}
+        print(f"  parity {name:<20s} {'OK' if not bad else 'FAILED ' + str(bad)}")
+
+
+# ============================================================
+# 4. Entry point
+# ============================================================
+def main():
+    parser = argparse.ArgumentParser(description="Indicator engine benchmark and parity suite (CPU, synthetic data)")
+    parser.add_argument("--symbols",     type=int, default=1410,
+                        help="Universe size (1410 = output_model/symbol_mapping.json)")
+    parser.add_argument("--days",        type=int, default=2500)
+    parser.add_argument("--sizes",       type=str, default=None,
+                        help=f"Sweep of SYMBOLSxDAYS universes instead of --symbols/--days "
+                             f"(e.g. {DEFAULT_SIZES})")
+    parser.add_argument("--repeats",     type=int, default=1)
+    parser.add_argument("--seed",        type=int, default=0)
+    parser.add_argument("--workers",     type=str, default="1",
+                        help="Comma-separated engine worker counts (shared-memory panels), e.g. 1,2,4; "
+                             "each N > 1 times the parallel build against the single-process one")
+    parser.add_argument("--skip_legacy", action="store_true",
+                        help="Do not run the legacy groupby build (no legacy parity check)")
+    parser.add_argument("--legacy_max_rows", type=int, default=3_000_000,
+                        help="Skip the legacy build for universes with more rows than this")
+    parser.add_argument("--skip_stream", action="store_true",
+                        help="Do not run the streaming updater (no stream parity check)")
+    parser.add_argument("--verify_bars", type=int, default=20,
+                        help="Bars per symbol streamed for the stream parity check")
+    parser.add_argument("--served_symbols", type=int, default=20,
+                        help="Symbols whose served model input is checked against training X (0 skips)")
+    parser.add_argument("--served_max_rows", type=int, default=1_000_000,
+                        help="Skip the served/training check for universes with more rows than this")
+    parser.add_argument("--skip_memory", action="store_true",
+                        help="Do not run the extra tracemalloc pass per implementation")
+    parser.add_argument("--output",      type=str, default=None,
+                        help="JSON output path (default: logs/bench/indicators_<git sha>.json)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    np.seterr(divide='ignore', invalid='ignore')
+
+    sizes = parse_sizes(args.sizes) if args.sizes else [(args.symbols, args.days)]
+    revision = git_revision()
+    output = args.output or os.path.join('logs', 'bench', f"indicators_{revision}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+
+    def write_report(runs):
+        report = {
+            'revision': revision,
+            'metrics_build': runs[0] if len(runs) == 1 else runs,
+            'peak_rss_mb': peak_rss_mb(),
+        }
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+        return report
+
+    runs = []
+    for num_symbols, num_days in sizes:
+        approx_rows = num_symbols * num_days
+        r = run_indicator_benchmark(
+            num_symbols=num_symbols,
+            num_days=num_days,
+            repeats=args.repeats,
+            seed=args.seed,
+            skip_legacy=args.skip_legacy or approx_rows > args.legacy_max_rows,
+            workers=[int(w) for w in args.workers.split(',') if w.strip()],
+            skip_stream=args.skip_stream,
+            verify_bars=args.verify_bars,
+            trace_memory=not args.skip_memory,
+            served_symbols=args.served_symbols if approx_rows <= args.served_max_rows else 0,
+        )
+        print_report(r)
+        runs.append(r)
+        # Rewritten after every size: a sweep cut short (e.g. out of memory) keeps the finished sizes.
+        report = write_report(runs)
+
+    print(f"\n  peak RSS={report['peak_rss_mb']:.0f} MB")
+    print(f"\nWritten: {output}")
+
+    failed = [(r['symbols'], r['days'], name) for r in runs for name in r['failures']]
+    if failed:
+        raise AssertionError(f"Indicator parity failed: {failed}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+On-demand indicators at arbitrary parameters for
+/stock/{symbol}/indicator/custom.
+
+The metrics table only holds the fixed-window columns (MA20, RSI-14, ...).
+Any other window is computed here by indicator_engine on the symbol's full
+price history, so warm-up behaves exactly like the precomputed columns.
+
+Two in-process caches sit in front of the database:
+  - PRICE_ARRAYS: per-symbol time / close / high / low / volume arrays
+    (LRU over symbols, TTL-bounded so newly ingested bars show up)
+  - RESULTS: encoded JSON responses keyed on (symbol, kind, params, range)
+    and on the price arrays they were computed from, so a hit is a dict
+    lookup and no re-serialisation
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+
+import dataset_service
+from indicator_engine import (
+    diff,
+    ewm,
+    rolling_max,
+    rolling_mean,
+    rolling_min,
+    rolling_std,
+    rsi_from_averages,
+    shift,
+    true_range,
+)
+
+logger = logging.getLogger(__name__)
+
+PRICE_ARRAY_TTL = 3600 # TTL: 1 hour, same as the fixed-window indicator cache
+PRICE_ARRAY_SYMBOLS = int(os.getenv("CUSTOM_INDICATOR_SYMBOLS", "256"))
+RESULT_CACHE_SIZE = int(os.getenv("CUSTOM_INDICATOR_RESULTS", "2048"))
+MAX_CUSTOM_WINDOW = 500
+
+# kind -> parameters it takes (anything else passed to the endpoint is ignored for that kind)
+CUSTOM_INDICATORS = {
+    'sma': ('window',),
+    'ema': ('window',),
+    'rsi': ('window',),
+    'atr': ('window',),
+    'bollinger': ('window', 'num_std'),
+    'stochastic': ('window', 'smooth'),
+}
+
+
+# ============================================================
+# 1. Indicator kernels (1-D arrays -> named output series)
+# ============================================================
+def _column(x: np.ndarray) -> np.ndarray:
+    return x.reshape(-1, 1)
+
+
+def _wilder(x: np.ndarray, window: int) -> np.ndarray:
+    # window=14 reproduces the RSI / ATR columns of the metrics table.
+    return ewm(x, alpha=1.0 / window, min_periods=window)
+
+
+def compute_custom_indicator(prices: dict, kind: str, params: dict) -> dict:
+    """Named [T] output series; the first one is reported as ``value``."""
+    close, high, low = (_column(prices[c]) for c in ('close', 'high', 'low'))
+    window = params['window']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if kind == 'sma':
+            out = {'value': rolling_mean(close, window)}
+        elif kind == 'ema':
+            out = {'value': ewm(close, alpha=2.0 / (window + 1.0))}
+        elif kind == 'rsi':
+            delta = diff(close)
+            avg_gain = _wilder(np.clip(delta, 0, None), window)
+            avg_loss = _wilder(-np.clip(delta, None, 0), window)
+            out = {'value': rsi_from_averages(avg_gain, avg_loss)}
+        elif kind == 'atr':
+            out = {'value': _wilder(true_range(high, low, shift(close)), window)}
+        elif kind == 'bollinger':
+            middle = rolling_mean(close, window)
+            band = params['num_std'] * rolling_std(close, window)
+            out = {'value': middle, 'upper': middle + band, 'lower': middle - band}
+        elif kind == 'stochastic':
+            lowest = rolling_min(low, window)
+            span = rolling_max(high, window) - lowest
+            k = np.where(span == 0, 0, 100 * (close - lowest) / span)
+            out = {'value': k, 'd': rolling_mean(k, params['smooth'])}
+        else:
+            raise ValueError(f"Unknown custom indicator kind: {kind}")
+    return {name: series.ravel() for name, series in out.items()}
+
+
+def encode_series(times: np.ndarray, outputs: dict) -> bytes:
+    """[{"time", "value", ...}] rows as JSON bytes; NaN / inf warm-up values become null."""
+    stamps = np.datetime_as_string(times, unit='s').tolist()
+    columns = {
+        name: np.where(np.isfinite(series), series, np.nan).astype(object) for name, series in outputs.items()
+    }
+    for values in columns.values():
+        values[values != values] = None
+    names = list(columns)
+    rows = [
+        dict(zip(['time'] + names, values))
+        for values in zip(stamps, *(columns[n].tolist() for n in names))
+    ]
+    return json.dumps(rows).encode()
+
+
+# ============================================================
+# 2. In-process caches
+# ============================================================
+class PriceArrayCache:
+    """Per-symbol price arrays, least recently used evicted beyond ``max_symbols``."""
+
+    def __init__(self, max_symbols: int, ttl: float):
+        self.max_symbols = max_symbols
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._inflight = {}
+
+    def invalidate(self, symbol: str = None):
+        if symbol is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(symbol, None)
+
+    async def get(self, symbol: str) -> dict:
+        entry = self._entries.get(symbol)
+        if entry is not None and time.monotonic() - entry['loaded_at'] < self.ttl:
+            self._entries.move_to_end(symbol)
+            return entry
+
+        # One database fetch per symbol, however many requests miss at once.
+        pending = self._inflight.get(symbol)
+        if pending is None:
+            pending = asyncio.ensure_future(dataset_service.get_price_arrays(symbol))
+            self._inflight[symbol] = pending
+            try:
+                arrays = await pending
+            finally:
+                self._inflight.pop(symbol, None)
+            entry = dict(arrays, loaded_at=time.monotonic())
+            self._entries[symbol] = entry
+            self._entries.move_to_end(symbol)
+            while len(self._entries) > self.max_symbols:
+                self._entries.popitem(last=False)
+            return entry
+        await asyncio.shield(pending)
+        return self._entries.get(symbol) or await self.get(symbol)
+
+
+class ResultCache:
+    """Bounded LRU of encoded responses."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        body = self._entries.get(key)
+        if body is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return body
+
+    def put(self, key, body: bytes):
+        self._entries[key] = body
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, symbol: str = None):
+        if symbol is None:
+            self._entries.clear()
+            return
+        for key in [k for k in self._entries if k[0] == symbol]:
+            del self._entries[key]
+
+
+PRICE_ARRAYS = PriceArrayCache(PRICE_ARRAY_SYMBOLS, PRICE_ARRAY_TTL)
+RESULTS = ResultCache(RESULT_CACHE_SIZE)
+
+
+def invalidate_symbol(symbol: str = None):
+    """Drop cached prices and responses for `symbol` (all symbols when None)."""
+    PRICE_ARRAYS.invalidate(symbol)
+    RESULTS.invalidate(symbol)
+
+
+# ============================================================
+# 3. Request path
+# ============================================================
+def canonical_params(kind: str, **params) -> tuple:
+    """The parameters `kind` actually uses, as a hashable cache-key part."""
+    return tuple((name, params[name]) for name in CUSTOM_INDICATORS[kind])
+
+
+def _select_range(prices: dict, range_val: str) -> np.ndarray:
+    start = np.datetime64(dataset_service.get_date_threshold(range_val), 'ns')
+    idx = np.flatnonzero(prices['time'] >= start)
+    limit = dataset_service.MAX_ROWS_RETURNED * 2 if range_val.upper() == 'ALL' else dataset_service.MAX_ROWS_RETURNED
+    idx = idx[:limit]
+    # Same sampling as the fixed-window endpoint (dataset_service.downsample_rows).
+    if len(idx) > dataset_service.MAX_ROWS_RETURNED:
+        idx = idx[::len(idx) // dataset_service.MAX_ROWS_RETURNED]
+    return idx
+
+
+def _build_response(prices: dict, kind: str, params: dict, range_val: str) -> bytes:
+    outputs = compute_custom_indicator(prices, kind, params)
+    idx = _select_range(prices, range_val)
+    return encode_series(prices['time'][idx], {name: series[idx] for name, series in outputs.items()})
+
+
+async def get_custom_indicator(symbol: str, kind: str, range_val: str, **params) -> bytes:
+    dataset_service.validate_range(range_val)
+    kind = kind.lower()
+    key_params = canonical_params(kind, **params)
+
+    prices = await PRICE_ARRAYS.get(symbol)
+    key = (symbol, kind, key_params, range_val.upper(), prices['loaded_at'])
+    body = RESULTS.get(key)
+    if body is not None:
+        return body
+
+    if len(prices['time']) == 0:
+        body = b"[]"
+    else:
+        body = await run_in_threadpool(_build_response, prices, kind, dict(key_params), range_val)
+    RESULTS.put(key, body)
+    return body
@@ -36,6 +36,10 @@ sync_engine = create_engine(SYNC_DB_URL, echo=False)
 # 3. Async Redis Client (For FastAPI Caching)
 redis_client = redis.from_url(REDIS_URL, decode_responses=True)
 
+# Pub/sub channel carrying a JSON list of symbols whose data was rewritten
+# (rebuild_symbols.py); API workers drop their in-process caches for them.
+CACHE_INVALIDATION_CHANNEL = "cache:invalidate"
+
 
 async def init_db_indexes():
     """
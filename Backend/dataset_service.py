@@ -1,9 +1,11 @@
 import logging
 import time as time_module
 from datetime import datetime, timedelta, timezone
+import numpy as np
 from sqlalchemy import text, bindparam
 from fastapi import HTTPException
 from database import AsyncSessionLocal
+from feature_pipeline import FEATURE_SCHEMA
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
@@ -193,6 +195,113 @@ async def get_stock_price(symbol: str, range_val: str) -> list:
         logger.error(f"DB Error in get_stock_price for {symbol}: {str(e)}")
         raise HTTPException(status_code=500, detail="DB query failed")
 
+async def get_latest_bar_time(symbol: str):
+    """
+    Timestamp of the newest bar `symbol` can be predicted from, or None.
+
+    Taken over the same stock_prices/metrics INNER join as get_prediction_window,
+    so a price bar whose metrics row has not landed yet does not move the key.
+    Both (symbol, time DESC) indexes make this a backward index walk that stops
+    at the first joined row.
+    """
+    try:
+        async with AsyncSessionLocal() as session:
+            sql = text("""
+                SELECT p."time" AS last_time
+                FROM stock_prices p
+                INNER JOIN metrics m ON p.symbol = m.symbol AND p."time" = m."time"
+                WHERE p.symbol = :sym
+                ORDER BY p."time" DESC
+                LIMIT 1
+            """)
+            result = await session.execute(sql, {"sym": symbol})
+            last_time = result.scalar()
+        return safe_serialize_time(last_time) if last_time is not None else None
+    except Exception as e:
+        logger.error(f"DB Error in get_latest_bar_time for {symbol}: {str(e)}")
+        raise HTTPException(status_code=500, detail="DB query failed")
+
+async def get_prediction_window(symbol: str, limit: int) -> dict:
+    """
+    Fetches the latest `limit` bars of the model feature set as column arrays.
+
+    Returns {"time": datetime64[ns] [T], "features": float64 [T, F]} in
+    ascending time order with columns in FEATURE_SCHEMA order. Missing
+    metric values are NaN. Uses the same strict INNER join as training.
+    Prices stay float64: training takes its returns before the float32 cast.
+    """
+    try:
+        async with AsyncSessionLocal() as session:
+            sql = text("""
+                SELECT *
+                FROM (
+                    SELECT p."time", p.open, p.high, p.low, p.close, p.volume,
+                           m.ma20, m.ma50, m.ema20,
+                           m.rsi, m.macd,
+                           m.rolling_vol_20d_std AS volatility,
+                           m.atr,
+                           m.daily_return_1d,
+                           m.lagged_return_t1,
+                           m.lagged_return_t3,
+                           m.lagged_return_t5,
+                           m.dist_from_ma50
+                    FROM stock_prices p
+                    INNER JOIN metrics m ON p.symbol = m.symbol AND p."time" = m."time"
+                    WHERE p.symbol = :sym
+                    ORDER BY p."time" DESC
+                    LIMIT :limit
+                ) latest
+                ORDER BY latest."time" ASC
+            """)
+            result = await session.execute(sql, {"sym": symbol, "limit": int(limit)})
+            rows = result.fetchall()
+    except Exception as e:
+        logger.error(f"DB Error in get_prediction_window for {symbol}: {str(e)}")
+        raise HTTPException(status_code=500, detail="DB query failed")
+
+    if not rows:
+        return {
+            "time": np.empty(0, dtype="datetime64[ns]"),
+            "features": np.empty((0, len(FEATURE_SCHEMA)), dtype=np.float64),
+        }
+
+    # None -> NaN happens during the float conversion; no per-row dicts are built.
+    times = np.array([r[0] for r in rows], dtype="datetime64[ns]")
+    features = np.array([r[1:] for r in rows], dtype=np.float64)
+    return {"time": times, "features": features}
+
+async def get_price_arrays(symbol: str) -> dict:
+    """
+    Full OHLCV history of `symbol` as column arrays in ascending time order:
+    {"time": datetime64[ns] [T], "close" / "high" / "low" / "volume": float64 [T]}.
+    Missing values are NaN. Feeds the on-demand indicator engine.
+    """
+    try:
+        async with AsyncSessionLocal() as session:
+            sql = text("""
+                SELECT "time", close, high, low, volume
+                FROM stock_prices
+                WHERE symbol = :sym
+                ORDER BY "time" ASC
+            """)
+            result = await session.execute(sql, {"sym": symbol})
+            rows = result.fetchall()
+    except Exception as e:
+        logger.error(f"DB Error in get_price_arrays for {symbol}: {str(e)}")
+        raise HTTPException(status_code=500, detail="DB query failed")
+
+    if not rows:
+        values = np.empty((0, 4), dtype=np.float64)
+    else:
+        values = np.array([r[1:] for r in rows], dtype=np.float64)
+    return {
+        "time": np.array([r[0] for r in rows], dtype="datetime64[ns]"),
+        "close": values[:, 0].copy(),
+        "high": values[:, 1].copy(),
+        "low": values[:, 2].copy(),
+        "volume": values[:, 3].copy(),
+    }
+
 async def get_stock_indicator(symbol: str, indicator_type: str, range_val: str) -> list:
     validate_range(range_val)
     db_col = INDICATOR_MAP.get(indicator_type.lower())
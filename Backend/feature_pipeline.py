@@ -4,6 +4,8 @@ from typing import Sequence
 import numpy as np
 import pandas as pd
 
+from indicator_engine import dist_from_ma50
+
 logger = logging.getLogger(__name__)
 
 FEATURE_SCHEMA = [
@@ -16,6 +18,12 @@ FEATURE_SCHEMA = [
     "dist_from_ma50",
 ]
 
+# Channels the model contract turns into one-step returns (to_model_feature_frame).
+PRICE_COLUMNS = ["open", "high", "low", "close"]
+# Bars before a window's first row that training_contract_matrix reads: that row's
+# lagged_return_t5 is the return 5 bars back, which needs the close 6 bars back.
+CONTRACT_HISTORY_ROWS = 6
+
 # Compatibility aliases for historical artifacts that used mixed naming styles.
 _COLUMN_ALIASES = {
     "MA20": "ma20",
@@ -45,6 +53,21 @@ def _to_canonical_columns(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+def feature_window(df: pd.DataFrame) -> dict:
+    """
+    dataset_service.get_prediction_window's {"time", "features"} from a frame of
+    bars and metrics under any historical column naming: rows in time order,
+    float64 values in FEATURE_SCHEMA order, NaN for absent columns.
+    """
+    work = _to_canonical_columns(df)
+    stamps = pd.to_datetime(work["time"], utc=True)
+    order = np.argsort(stamps.to_numpy(), kind="stable")
+    return {
+        "time": stamps.dt.tz_localize(None).to_numpy(dtype="datetime64[ns]")[order],
+        "features": work.reindex(columns=FEATURE_SCHEMA).to_numpy(dtype=np.float64)[order],
+    }
+
+
 def validate_feature_schema(feature_names: Sequence[str]) -> None:
     actual = list(feature_names)
     if actual == FEATURE_SCHEMA:
@@ -92,8 +115,12 @@ def assert_sequence_integrity(df: pd.DataFrame, seq_len: int) -> None:
         raise ValueError(f"Sequence integrity failed: NaN values remain in columns {nan_cols}")
 
 
-def summarize_input_stats(feature_frame: pd.DataFrame) -> dict:
-    matrix = feature_frame[FEATURE_SCHEMA].to_numpy(dtype=np.float32)
+def summarize_input_stats(feature_frame) -> dict:
+    """Stats of a feature frame, or of a [T, F] matrix already in FEATURE_SCHEMA order."""
+    if isinstance(feature_frame, np.ndarray):
+        matrix = feature_frame
+    else:
+        matrix = feature_frame[FEATURE_SCHEMA].to_numpy(dtype=np.float32)
     return {
         "mean": float(np.mean(matrix)),
         "std": float(np.std(matrix)),
@@ -102,7 +129,7 @@ def summarize_input_stats(feature_frame: pd.DataFrame) -> dict:
     }
 
 
-def log_input_stats(feature_frame: pd.DataFrame, prefix: str = "Input stats") -> dict:
+def log_input_stats(feature_frame, prefix: str = "Input stats") -> dict:
     stats = summarize_input_stats(feature_frame)
     logger.info("%s:", prefix)
     logger.info("mean: %.6f", stats["mean"])
@@ -125,7 +152,7 @@ def to_model_feature_frame(feature_frame: pd.DataFrame) -> pd.DataFrame:
     if missing:
         raise ValueError(f"Missing feature columns required by model contract: {missing}")
 
-    price_cols = ["open", "high", "low", "close"]
+    price_cols = PRICE_COLUMNS
     work_df[price_cols] = (
         work_df[price_cols]
         .pct_change()
@@ -145,6 +172,158 @@ def to_model_feature_frame(feature_frame: pd.DataFrame) -> pd.DataFrame:
     return work_df
 
 
+# ────────────────────────────────────────────────────────────
+# NumPy inference path
+# ────────────────────────────────────────────────────────────
+# train.build_feature_rows -> apply_training_scalers for one symbol's window,
+# on [T, F] matrices in FEATURE_SCHEMA order without intermediate frames.
+# The model input is built in one float32 buffer and standardised in place;
+# it equals training X for the same dates bit for bit
+# (Backend/tests/test_feature_pipeline.py).
+
+# PRICE_COLUMNS lead FEATURE_SCHEMA, so scaler_Y's columns are a view.
+_PRICE_SLICE = slice(0, len(PRICE_COLUMNS))
+
+
+def _ffill_rows(matrix: np.ndarray) -> np.ndarray:
+    """In-place forward fill along time; leading NaNs stay NaN."""
+    valid = ~np.isnan(matrix)
+    if valid.all():
+        return matrix
+    rows = np.arange(len(matrix))[:, None]
+    src = np.maximum.accumulate(np.where(valid, rows, 0), axis=0)
+    matrix[...] = np.take_along_axis(matrix, src, axis=0)
+    return matrix
+
+
+def fill_forward_backward(matrix: np.ndarray) -> np.ndarray:
+    """In-place DataFrame.ffill().bfill() along time (all-NaN columns stay NaN)."""
+    _ffill_rows(matrix)
+    _ffill_rows(matrix[::-1])
+    return matrix
+
+
+def training_contract_matrix(features: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    """
+    train.build_feature_rows for one symbol's time-sorted [T, F] window in
+    FEATURE_SCHEMA order, raw prices in the OHLC columns and the stored
+    metrics elsewhere (dataset_service.get_prediction_window).
+
+    As in training, OHLC become one-step returns, and daily_return_1d, its
+    lags and dist_from_ma50 are re-derived from the raw close instead of
+    taken from the (rounded) metrics columns.  Those columns are computed in
+    float64 before the float32 cast; everything else is written straight
+    into ``out`` ([T, F] float32, allocated when None) and filled there.
+    ``features`` is not modified.  From row CONTRACT_HISTORY_ROWS on the
+    result equals the feature store's model_features bit for bit
+    (check_store_window_parity).  The exception is a gap (missing value,
+    ma50 == 0) that runs back past the window start: training fills it from
+    older bars, the window can only back-fill.
+    """
+    features = np.asarray(features)
+    if features.ndim != 2 or features.shape[1] != len(FEATURE_SCHEMA):
+        raise ValueError(f"Expected a [T, {len(FEATURE_SCHEMA)}] window, got shape {features.shape}")
+    if out is None:
+        out = np.empty(features.shape, dtype=np.float32)
+    col = {name: i for i, name in enumerate(FEATURE_SCHEMA)}
+    raw_close = features[:, col["close"]].astype(np.float64)
+    ma50 = features[:, col["ma50"]].astype(np.float64)
+
+    # groupby pct_change pads missing prices first; the leading NaN becomes 0, inf survives.
+    prices = _ffill_rows(features[:, _PRICE_SLICE].astype(np.float64))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = np.empty_like(prices)
+        returns[0] = np.nan
+        np.divide(prices[1:], prices[:-1], out=returns[1:])
+        returns[1:] -= 1
+        dist = dist_from_ma50(raw_close, ma50)
+    returns[np.isnan(returns)] = 0.0
+
+    out[...] = features
+    out[:, _PRICE_SLICE] = returns
+    daily = returns[:, PRICE_COLUMNS.index("close")]
+    out[:, col["daily_return_1d"]] = daily
+    for lag in (1, 3, 5):
+        out[:lag, col[f"lagged_return_t{lag}"]] = np.nan
+        out[lag:, col[f"lagged_return_t{lag}"]] = daily[:-lag]
+    out[:, col["dist_from_ma50"]] = dist
+
+    # normalize_features (ffill / bfill, float32), then inf -> NaN, ffill / bfill again.
+    # Filling commutes with the cast, so it runs on the float32 buffer.
+    fill_forward_backward(out)
+    out[np.isinf(out)] = np.nan
+    return fill_forward_backward(out)
+
+
+def scaler_vectors(scaler) -> tuple:
+    """(mean, scale) a fitted StandardScaler applies; None where it skips that step."""
+    mean = np.asarray(scaler.mean_, dtype=np.float64) if scaler.with_mean else None
+    scale = np.asarray(scaler.scale_, dtype=np.float64) if scaler.with_std else None
+    return mean, scale
+
+
+def standardize_inplace(matrix: np.ndarray, mean: np.ndarray = None, scale: np.ndarray = None) -> np.ndarray:
+    """StandardScaler.transform in place (float64 vectors, float32 result, same rounding)."""
+    if mean is not None:
+        np.subtract(matrix, mean, out=matrix)
+    if scale is not None:
+        np.divide(matrix, scale, out=matrix)
+    return matrix
+
+
+def standardize_model_input(matrix: np.ndarray, x_vectors: tuple, y_vectors: tuple) -> np.ndarray:
+    """apply_training_scalers in place, from scaler_vectors of scaler_X and scaler_Y."""
+    standardize_inplace(matrix, *x_vectors)
+    standardize_inplace(matrix[:, _PRICE_SLICE], *y_vectors)
+    return matrix
+
+
+def apply_training_scalers(matrix: np.ndarray, scaler_X, scaler_Y) -> np.ndarray:
+    """
+    train.build_scalers on model-contract rows: scaler_X over every column,
+    then scaler_Y over the price columns, which double as the return targets.
+    """
+    out = scaler_X.transform(np.asarray(matrix, dtype=np.float32))
+    out[:, _PRICE_SLICE] = scaler_Y.transform(out[:, _PRICE_SLICE])
+    return out
+
+
+def prepare_model_input(features: np.ndarray, lookback: int, x_vectors: tuple, y_vectors: tuple,
+                        out: np.ndarray = None) -> np.ndarray:
+    """
+    Scaled model input [lookback, F] from a time-sorted raw [T, F] window.
+
+    The training contract is written into ``out`` ([T, F] float32, allocated
+    when None); its last ``lookback`` rows are standardised in place with the
+    precomputed scaler_vectors of scaler_X / scaler_Y and returned as a view.
+    """
+    if len(features) < int(lookback):
+        raise ValueError(f"Sequence too short: need >= {lookback} rows, got {len(features)}")
+    out = training_contract_matrix(features, out=out)
+    return standardize_model_input(out[-int(lookback):], x_vectors, y_vectors)
+
+
+def check_store_window_parity(db_window: dict, store_window: dict, scaler_X, scaler_Y, lookback: int) -> dict:
+    """
+    Scales the last ``lookback`` bars of a database window (prepare_model_input)
+    and of the feature store's window for the same symbol (its model_features),
+    and compares them element for element.  Both windows must end on the same bars.
+    """
+    db_times = np.asarray(db_window["time"], dtype="datetime64[ns]")[-lookback:]
+    store_times = np.asarray(store_window["time"], dtype="datetime64[ns]")[-lookback:]
+    if not np.array_equal(db_times, store_times):
+        raise ValueError("Database and feature-store windows cover different bars")
+    actual = prepare_model_input(db_window["features"], lookback, scaler_vectors(scaler_X), scaler_vectors(scaler_Y))
+    expected = apply_training_scalers(store_window["model_features"][-lookback:], scaler_X, scaler_Y)
+    same = (actual == expected) | (np.isnan(actual) & np.isnan(expected))
+    return {
+        "identical": bool(same.all()),
+        "mismatches": int((~same).sum()),
+        "mismatched_columns": sorted({FEATURE_SCHEMA[j] for j in np.nonzero(~same)[1]}),
+        "max_abs_diff": float(np.nanmax(np.abs(actual.astype(np.float64) - expected))) if actual.size else 0.0,
+    }
+
+
 def enforce_scaled_anomaly_guard(
     scaled_matrix: np.ndarray,
     mean_tolerance: float = 5.0,
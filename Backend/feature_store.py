@@ -0,0 +1,325 @@
+"""
+FEATURE STORE
+=============
+The model-ready feature rows, materialised once per data version and shared
+by training and inference.
+
+train.build_feature_rows (CSV merge, per-symbol preprocessing, fills) is run
+once; its output is written as columnar .npy files.  Training memory-maps
+them instead of re-parsing the CSVs, and inference slices a symbol's last
+rows by offset instead of re-deriving the model contract from a short
+database window.  Both see the same bytes.
+
+Layout:
+  <root>/<schema_hash>/<data_version>/
+      features.npy   float32 [N, F]  model-contract rows before scaling (FEATURE_SCHEMA order)
+      prices.npy     float32 [N, 4]  raw open / high / low / close
+      time.npy       datetime64[ns] [N]
+      symbols.npy    str [S]         symbols in row order
+      offsets.npy    int64 [S + 1]   symbol i owns rows offsets[i]:offsets[i + 1]
+      meta.json
+  <root>/<schema_hash>/CURRENT        data version served to inference
+
+schema_hash covers FEATURE_STORE_VERSION, the feature contract, the
+feature_pipeline source and that of the train.py row builders; data_version
+is the sha256 of the source CSVs.
+An edit to either lands in a new directory, so readers never see a store
+written for another schema.
+
+How to Run:
+-----------
+# Materialise (or re-point CURRENT at) the store for the current CSVs
+python feature_store.py --dataset metrics.csv --prices stock_prices.csv --root feature_store/
+
+# Training memory-maps it:          python train.py ... --feature_store feature_store/
+# The API serves prediction windows from it when FEATURE_STORE_DIR is set.
+"""
+
+import os
+import ast
+import json
+import shutil
+import hashlib
+import logging
+import argparse
+import threading
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+import feature_pipeline
+from feature_pipeline import FEATURE_SCHEMA, PRICE_COLUMNS, _COLUMN_ALIASES
+
+logger = logging.getLogger(__name__)
+
+# Bump for changes the source hashes in schema_hash cannot see (e.g. a pandas upgrade).
+FEATURE_STORE_VERSION = 1
+# train.py functions that produce the stored rows.
+ROW_BUILDERS = ('_vectorised_preprocess', 'build_feature_rows')
+FEATURE_STORE_ARRAYS = ('features', 'prices', 'time')
+FEATURE_STORE_META = 'meta.json'
+CURRENT_FILE = 'CURRENT'
+
+FEATURE_STORE_DIR = os.getenv("FEATURE_STORE_DIR")
+
+
+def _file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _row_builder_sha() -> str:
+    """sha256 of the ROW_BUILDERS source, read with ast so the API need not import train (torch)."""
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'train.py')) as f:
+        source = f.read()
+    segments = [
+        ast.get_source_segment(source, node) for node in ast.parse(source).body
+        if isinstance(node, ast.FunctionDef) and node.name in ROW_BUILDERS
+    ]
+    return hashlib.sha256('\n'.join(segments).encode()).hexdigest()
+
+
+@lru_cache(maxsize=1)
+def schema_hash() -> str:
+    """Identity of the feature contract the rows were built for."""
+    with open(feature_pipeline.__file__, 'rb') as f:
+        pipeline_sha = hashlib.sha256(f.read()).hexdigest()
+    schema = {
+        'version':      FEATURE_STORE_VERSION,
+        'features':     list(FEATURE_SCHEMA),
+        'prices':       list(PRICE_COLUMNS),
+        'aliases':      dict(_COLUMN_ALIASES),
+        'pipeline_sha': pipeline_sha,
+        'rows_sha':     _row_builder_sha(),
+    }
+    return hashlib.sha256(json.dumps(schema, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def data_version(dataset_path: str, prices_path: str) -> tuple:
+    """(version, sources) for a metrics / prices CSV pair."""
+    sources = {
+        'dataset': {'path': os.path.abspath(dataset_path), 'sha256': _file_sha256(dataset_path)},
+        'prices':  {'path': os.path.abspath(prices_path),  'sha256': _file_sha256(prices_path)},
+    }
+    material = json.dumps([sources['dataset']['sha256'], sources['prices']['sha256']])
+    return hashlib.sha256(material.encode()).hexdigest()[:16], sources
+
+
+def _write_current(schema_dir: str, version: str):
+    tmp_path = os.path.join(schema_dir, f"{CURRENT_FILE}.tmp-{os.getpid()}")
+    with open(tmp_path, 'w') as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(schema_dir, CURRENT_FILE))
+
+
+def write_feature_store(root: str, version: str, sources: dict, rows: dict) -> str:
+    """
+    Write build_feature_rows output as <root>/<schema_hash>/<version>/
+    (atomic rename) and point CURRENT at it.
+    """
+    symbols = np.asarray(rows['symbol'], dtype=object)
+    if len(symbols) == 0:
+        raise ValueError("Refusing to write an empty feature store.")
+    heads = np.flatnonzero(np.r_[True, symbols[1:] != symbols[:-1]])
+    if len(set(symbols[heads])) != len(heads):
+        raise ValueError("Feature rows must be grouped by symbol (build_feature_rows sorts by symbol, time).")
+
+    schema_dir = os.path.join(root, schema_hash())
+    entry_dir = os.path.join(schema_dir, version)
+    if not os.path.isdir(entry_dir):
+        tmp_dir = f"{entry_dir}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        try:
+            np.save(os.path.join(tmp_dir, 'features.npy'), np.asarray(rows['features'], dtype=np.float32))
+            np.save(os.path.join(tmp_dir, 'prices.npy'), np.asarray(rows['prices'], dtype=np.float32))
+            np.save(os.path.join(tmp_dir, 'time.npy'), np.asarray(rows['time'], dtype='datetime64[ns]'))
+            np.save(os.path.join(tmp_dir, 'symbols.npy'), symbols[heads].astype(str))
+            np.save(os.path.join(tmp_dir, 'offsets.npy'), np.r_[heads, len(symbols)].astype(np.int64))
+            meta = {
+                'schema_hash':  os.path.basename(schema_dir),
+                'data_version': version,
+                'sources':      sources,
+                'features':     list(FEATURE_SCHEMA),
+                'rows':         int(len(symbols)),
+                'symbols':      int(len(heads)),
+                'created':      pd.Timestamp.now(tz='UTC').isoformat(),
+            }
+            with open(os.path.join(tmp_dir, FEATURE_STORE_META), 'w') as f:
+                json.dump(meta, f, indent=4)
+            os.replace(tmp_dir, entry_dir)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            if not os.path.isdir(entry_dir):  # lost a race to a concurrent writer is fine
+                raise
+        logger.info(f"Feature store written: {entry_dir} ({len(symbols)} rows)")
+    _write_current(schema_dir, version)
+    return entry_dir
+
+
+class FeatureStore:
+    """One materialised data version, memory-mapped read-only."""
+
+    def __init__(self, entry_dir: str):
+        with open(os.path.join(entry_dir, FEATURE_STORE_META)) as f:
+            self.meta = json.load(f)
+        if self.meta.get('features') != list(FEATURE_SCHEMA):
+            raise ValueError(f"Feature store {entry_dir} was written for another FEATURE_SCHEMA")
+        self.entry_dir = entry_dir
+        self.version = self.meta['data_version']
+        self.arrays = {name: np.load(os.path.join(entry_dir, f"{name}.npy"), mmap_mode='r')
+                       for name in FEATURE_STORE_ARRAYS}
+        self.symbols = np.load(os.path.join(entry_dir, 'symbols.npy')).tolist()
+        self.offsets = np.load(os.path.join(entry_dir, 'offsets.npy'))
+        self.index = {s: i for i, s in enumerate(self.symbols)}
+        if any(len(arr) != self.meta['rows'] for arr in self.arrays.values()) or self.offsets[-1] != self.meta['rows']:
+            raise ValueError(f"Feature store {entry_dir} row counts disagree")
+
+    @classmethod
+    def open(cls, root: str, version: str = None):
+        """The store for the current schema at ``version`` (CURRENT when None), or None if absent."""
+        schema_dir = os.path.join(root, schema_hash())
+        if version is None:
+            try:
+                with open(os.path.join(schema_dir, CURRENT_FILE)) as f:
+                    version = f.read().strip()
+            except OSError:
+                return None
+        entry_dir = os.path.join(schema_dir, version)
+        if not os.path.exists(os.path.join(entry_dir, FEATURE_STORE_META)):
+            return None
+        return cls(entry_dir)
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def rows(self) -> dict:
+        """build_feature_rows-shaped dict over the memory maps (train.finish_training_dataset input)."""
+        lengths = np.diff(self.offsets)
+        return dict(self.arrays, symbol=np.repeat(np.array(self.symbols, dtype=object), lengths))
+
+    def window(self, symbol: str, rows: int):
+        """
+        Last ``rows`` rows of ``symbol`` (fewer if its history is shorter), or
+        None when the store has no rows for it.  ``model_features`` are the
+        stored model-contract rows; ``features`` holds the same rows with raw
+        prices in the OHLC columns, the layout of
+        dataset_service.get_prediction_window.
+        """
+        i = self.index.get(symbol)
+        if i is None:
+            return None
+        stop = int(self.offsets[i + 1])
+        start = max(int(self.offsets[i]), stop - int(rows))
+        model_features = np.array(self.arrays['features'][start:stop])
+        features = model_features.copy()
+        features[:, [FEATURE_SCHEMA.index(c) for c in PRICE_COLUMNS]] = self.arrays['prices'][start:stop]
+        return {
+            "time": np.array(self.arrays['time'][start:stop]),
+            "features": features,
+            "model_features": model_features,
+            "data_version": self.version,
+        }
+
+
+def load_or_build(root: str, dataset_path: str, prices_path: str) -> FeatureStore:
+    """The store for these CSVs, materialising it with train.build_feature_rows on first use."""
+    version, sources = data_version(dataset_path, prices_path)
+    store = FeatureStore.open(root, version)
+    if store is None:
+        from train import build_feature_rows  # deferred: pulls in torch
+        write_feature_store(root, version, sources, build_feature_rows(dataset_path, prices_path))
+        store = FeatureStore.open(root, version)
+    else:
+        _write_current(os.path.dirname(store.entry_dir), version)
+        logger.info(f"Feature store hit: {store.entry_dir} ({len(store)} rows)")
+    return store
+
+
+# ============================================================
+# Inference-side handle (FEATURE_STORE_DIR)
+# ============================================================
+_active = {'version': None, 'store': None, 'stale': set()}
+_active_lock = threading.Lock()
+
+
+def active_store():
+    """
+    The CURRENT store under FEATURE_STORE_DIR, re-opened when CURRENT moves
+    to a new data version; None when unset or not yet built.
+    """
+    if not FEATURE_STORE_DIR:
+        return None
+    try:
+        with open(os.path.join(FEATURE_STORE_DIR, schema_hash(), CURRENT_FILE)) as f:
+            version = f.read().strip()
+    except OSError:
+        return None
+    with _active_lock:
+        if _active['version'] != version:
+            try:
+                _active['store'] = FeatureStore.open(FEATURE_STORE_DIR, version)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Feature store {version} unreadable ({e}); using the database path.")
+                _active['store'] = None
+            _active['version'] = version
+            _active['stale'] = set()
+        return _active['store']
+
+
+def invalidate_symbols(symbols):
+    """
+    Stop serving ``symbols`` from the current store: their database rows were
+    rewritten (rebuild_symbols.py), and a split leaves the newest bar as it
+    was, so the last_bar check alone would keep the pre-adjustment window.
+    Cleared when CURRENT moves to a store built from the patched CSVs.
+    """
+    active_store()
+    with _active_lock:
+        _active['stale'].update(symbols)
+
+
+def is_invalidated(symbol: str) -> bool:
+    return symbol in _active['stale']
+
+
+def prediction_window(symbol: str, rows: int, last_bar=None):
+    """
+    Store-backed counterpart of dataset_service.get_prediction_window, or None
+    (no store, unknown or invalidated symbol, or the store ends before
+    ``last_bar``, the database's newest bar, i.e. it has not been rebuilt
+    since that ingest).
+    """
+    store = active_store()
+    if is_invalidated(symbol):
+        return None
+    window = store.window(symbol, rows) if store is not None else None
+    if window is None or len(window['time']) == 0:
+        return None
+    if last_bar is not None:
+        newest = pd.Timestamp(last_bar)
+        if newest.tzinfo is not None:
+            newest = newest.tz_convert(None)
+        if window['time'][-1] < newest.to_datetime64():
+            return None
+    return window
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Materialise the model feature rows for the current data version")
+    parser.add_argument("--dataset", type=str, default="metrics.csv")
+    parser.add_argument("--prices",  type=str, default="stock_prices.csv")
+    parser.add_argument("--root",    type=str, default=FEATURE_STORE_DIR or "feature_store/")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    store = load_or_build(args.root, args.dataset, args.prices)
+    print(f"Feature store {store.entry_dir}: {len(store)} rows, {len(store.symbols)} symbols (CURRENT)")
+
+
+if __name__ == "__main__":
+    main()
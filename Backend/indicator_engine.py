@@ -0,0 +1,506 @@
+"""
+Vectorised panel indicator engine.
+
+One implementation of the technical indicators for the scraper's metrics
+build (Scraper/metrics.py), the API helper (metrics.py) and training
+feature engineering (features.py).
+
+Long (symbol, time) rows are scattered into a time-major panel of shape
+[days x symbols]: row ``t`` holds every symbol's ``t``-th bar, and shorter
+histories are NaN-padded at the end.  Rolling windows and lags then run on
+axis 0 for all symbols at once.  Recursive EWMs loop over days only, with
+each step a vector operation across symbols.  No Python code runs per symbol.
+
+Semantics match the pandas calls they replace, NaNs included:
+  rolling_*    rolling(window, min_periods).{mean,std,corr,min,max}
+  ewm          ewm(alpha, min_periods, adjust=False).mean()  (ignore_na=False)
+  pct_change   pct_change(periods, fill_method=None)
+  cumsum       Series.cumsum() (NaN rows stay NaN, the sum carries over)
+"""
+
+import concurrent.futures
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+# Output columns of compute_indicators, in metrics-table order.
+INDICATOR_COLUMNS = [
+    "MA20", "MA50", "EMA20",
+    "RSI", "MACD",
+    "Rolling_Vol_20d_std", "ATR",
+    "Volume_MA20", "Volume_Change_pct",
+    "Daily_Return_1d", "Daily_Return_5d",
+    "Cumulative_Return", "Daily_Range",
+    "Vol_Close_Corr_20d", "BB_Width", "ADX", "OBV_Slope_5d",
+    "Lagged_Return_t1", "Lagged_Return_t3", "Lagged_Return_t5",
+    "Dist_from_MA50",
+]
+
+# EMA20 and the MACD fast / slow spans; Wilder smoothing for RSI, ATR and ADX.
+EMA_SPANS = (20, 12, 26)
+WILDER_ALPHA = 1.0 / 14
+WILDER_MIN_PERIODS = 14
+
+# Raw inputs of compute_indicators, in argument order.
+OHLCV_INPUTS = ('close', 'high', 'low', 'volume')
+
+# Rows per block in the windowed second-moment loops (keeps per-lag temporaries in cache).
+_ROW_BLOCK = 64
+
+
+# ============================================================
+# 1. Panel layout
+# ============================================================
+class PanelLayout:
+    """
+    Mapping between long rows and a [days x symbols] panel.
+
+    Rows are ordered by (group, time), using a stable sort.  A row's panel
+    cell is (its position within the group, the group's column).  Input that
+    is already one time-sorted block per group skips the row sort.
+    """
+    def __init__(self, group_codes: np.ndarray, times: np.ndarray = None):
+        group_codes = np.asarray(group_codes)
+        n = len(group_codes)
+        same = group_codes[1:] == group_codes[:-1]
+        heads = np.flatnonzero(np.r_[True, ~same]) if n else np.array([], dtype=np.int64)
+        head_codes = group_codes[heads]
+        in_blocks = len(np.unique(head_codes)) == len(heads)
+        if in_blocks and times is not None:
+            times = np.asarray(times)
+            in_blocks = bool(np.all(times[1:][same] >= times[:-1][same]))
+        if in_blocks:
+            # Already one time-sorted block per group (the scraped CSV layout): reorder blocks only.
+            block_order = np.argsort(head_codes, kind='stable')
+            lengths = np.diff(np.r_[heads, n])[block_order]
+            starts = (np.cumsum(lengths) - lengths).astype(np.int64)
+            order = np.arange(n, dtype=np.int64) + np.repeat(heads[block_order] - starts, lengths)
+        else:
+            order = (np.argsort(group_codes, kind='stable') if times is None
+                     else np.lexsort((np.asarray(times), group_codes)))
+            codes = group_codes[order]
+            starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if n else np.array([], dtype=np.int64)
+            lengths = np.diff(np.r_[starts, n])
+
+        self.order = order
+        self.col = np.repeat(np.arange(len(starts), dtype=np.int64), lengths)
+        self.pos = np.arange(n, dtype=np.int64) - np.repeat(starts, lengths)
+        self.lengths = lengths
+        self.shape = (int(lengths.max()) if len(lengths) else 0, len(starts))
+        self.flat = self.pos * self.shape[1] + self.col
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, group_col: str = 'symbol', time_col: str = 'time'):
+        """Layout for a long frame; with ``group_col`` None or absent the frame is one series."""
+        if group_col is not None and group_col in df.columns:
+            # Factorize run heads only: O(rows) comparisons + O(runs) hashing for block-ordered input.
+            values = df[group_col].to_numpy()
+            heads = np.flatnonzero(np.r_[True, values[1:] != values[:-1]]) if len(values) else np.array([], dtype=np.int64)
+            head_codes = pd.factorize(values[heads], sort=True)[0]
+            codes = np.repeat(head_codes, np.diff(np.r_[heads, len(values)]))
+        else:
+            codes = np.zeros(len(df), dtype=np.int64)
+        times = df[time_col].to_numpy() if time_col in df.columns else None
+        return cls(codes, times)
+
+    def to_panel(self, values, out: np.ndarray = None) -> np.ndarray:
+        """Long values (original row order) -> float64 panel, NaN-padded (written into ``out`` if given)."""
+        panel = np.full(self.shape, np.nan) if out is None else out
+        if out is not None:
+            panel.fill(np.nan)
+        panel.ravel()[self.flat] = np.asarray(values, dtype=np.float64)[self.order]
+        return panel
+
+    def to_rows(self, panel: np.ndarray) -> np.ndarray:
+        """Panel -> long values in sorted (group, time) order."""
+        return np.take(panel, self.flat)
+
+    def to_input_rows(self, panel: np.ndarray) -> np.ndarray:
+        """Panel -> long values in the original row order."""
+        out = np.empty(len(self.order))
+        out[self.order] = self.to_rows(panel)
+        return out
+
+
+# ============================================================
+# 2. Column-wise primitives (axis 0 = time)
+# ============================================================
+def shift(panel: np.ndarray, periods: int = 1) -> np.ndarray:
+    out = np.full_like(panel, np.nan)
+    if periods < len(panel):
+        out[periods:] = panel[:len(panel) - periods]
+    return out
+
+
+def diff(panel: np.ndarray, periods: int = 1) -> np.ndarray:
+    return panel - shift(panel, periods)
+
+
+def pct_change(panel: np.ndarray, periods: int = 1) -> np.ndarray:
+    return panel / shift(panel, periods) - 1.0
+
+
+def _cumsum_rows(x: np.ndarray, dtype=None) -> np.ndarray:
+    """
+    Running sum down axis 0, one whole row per step.  Same result as
+    np.cumsum(x, axis=0) but ~3x faster on wide C-ordered panels, where
+    numpy's axis-0 accumulate walks each column with a large stride.
+    """
+    out = np.empty(x.shape, dtype=dtype or x.dtype)
+    if len(x):
+        out[0] = x[0]
+        for t in range(1, len(x)):
+            np.add(out[t - 1], x[t], out=out[t])
+    return out
+
+
+def cumsum(panel: np.ndarray) -> np.ndarray:
+    nan = np.isnan(panel)
+    out = _cumsum_rows(np.where(nan, 0.0, panel))
+    out[nan] = np.nan
+    return out
+
+
+def _zero_filled(panels):
+    """Panels with NaN -> 0 wherever any of them is NaN (pairwise, like pandas corr), plus that mask."""
+    valid = np.ones(panels[0].shape, dtype=bool)
+    for p in panels:
+        valid &= ~np.isnan(p)
+    return [np.where(valid, p, 0.0) for p in panels], valid
+
+
+def _trailing_sum(x: np.ndarray, window: int) -> np.ndarray:
+    """Sum of rows [t-window+1, t] via cumsum differences (error ~ eps * running total)."""
+    cs = _cumsum_rows(x)
+    out = np.empty_like(cs)
+    out[:window] = cs[:window]
+    np.subtract(cs[window:], cs[:-window], out=out[window:])
+    return out
+
+
+def _rolling_moments(panels, window: int, min_periods: int, pairs):
+    """
+    Trailing-window count, means and centred cross-products of aligned panels.
+
+    Returns (count, keep, means, sums), where sums[n] is the sum over the
+    window of (x_i - mean_i) * (x_j - mean_j) for pairs[n] = (i, j).  Means
+    come from cumsum differences.  Only the first moment is summed that way,
+    so drift is negligible.  Second moments are summed over explicit
+    deviations (two-pass), so flat windows give exactly zero instead of
+    cancellation noise.  The lag loop runs over blocks of _ROW_BLOCK rows so
+    its temporaries stay cache-resident.
+    """
+    x0, valid = _zero_filled(panels)
+    count = _trailing_sum(valid.astype(np.int64), window)
+    keep = count >= max(min_periods, 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = [_trailing_sum(x, window) / count for x in x0]
+
+    pad = window - 1
+    padded = [np.concatenate([np.zeros((pad,) + x.shape[1:]), x]) for x in x0]
+    # With a full window required every kept row has only valid lags: no masking.
+    padded_valid = (None if min_periods >= window
+                    else np.concatenate([np.zeros((pad,) + valid.shape[1:], dtype=bool), valid]))
+
+    T = len(count)
+    sums = [np.empty(count.shape) for _ in pairs]
+    for r0 in range(0, T, _ROW_BLOCK):
+        n = min(T, r0 + _ROW_BLOCK) - r0
+        acc = [np.zeros((n,) + count.shape[1:]) for _ in pairs]
+        dev = [np.empty_like(acc[0]) for _ in panels]
+        tmp = np.empty_like(acc[0])
+        for k in range(window):
+            lo = r0 + pad - k
+            for i, p in enumerate(padded):
+                np.subtract(p[lo: lo + n], means[i][r0: r0 + n], out=dev[i])
+                if padded_valid is not None:
+                    dev[i] *= padded_valid[lo: lo + n]
+            for a, (i, j) in zip(acc, pairs):
+                a += np.multiply(dev[i], dev[j], out=tmp)
+        for total, a in zip(sums, acc):
+            total[r0: r0 + n] = a
+    return count, keep, means, sums
+
+
+def rolling_mean(panel: np.ndarray, window: int, min_periods: int = None) -> np.ndarray:
+    min_periods = window if min_periods is None else min_periods
+    (x0,), valid = _zero_filled([panel])
+    count = _trailing_sum(valid.astype(np.int64), window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = _trailing_sum(x0, window) / count
+    return np.where(count >= max(min_periods, 1), mean, np.nan)
+
+
+def rolling_std(panel: np.ndarray, window: int, min_periods: int = None) -> np.ndarray:
+    """Sample standard deviation (ddof=1)."""
+    min_periods = window if min_periods is None else min_periods
+    count, keep, _, (ss,) = _rolling_moments([panel], window, min_periods, [(0, 0)])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(keep, np.sqrt(ss / (count - 1)), np.nan)
+
+
+def _rolling_extreme(panel: np.ndarray, window: int, min_periods, reduce) -> np.ndarray:
+    min_periods = window if min_periods is None else min_periods
+    count = _trailing_sum((~np.isnan(panel)).astype(np.int64), window)
+    out = panel.copy()
+    # fmin / fmax skip NaN, like pandas' rolling min / max.
+    for k in range(1, min(window, len(panel))):
+        reduce(out[k:], panel[:-k], out=out[k:])
+    return np.where(count >= max(min_periods, 1), out, np.nan)
+
+
+def rolling_min(panel: np.ndarray, window: int, min_periods: int = None) -> np.ndarray:
+    return _rolling_extreme(panel, window, min_periods, np.fmin)
+
+
+def rolling_max(panel: np.ndarray, window: int, min_periods: int = None) -> np.ndarray:
+    return _rolling_extreme(panel, window, min_periods, np.fmax)
+
+
+def rolling_corr(a: np.ndarray, b: np.ndarray, window: int, min_periods: int = None) -> np.ndarray:
+    """Pearson correlation over pairwise-complete rows of each window."""
+    min_periods = window if min_periods is None else min_periods
+    _, keep, _, (cov, var_a, var_b) = _rolling_moments([a, b], window, min_periods, [(0, 1), (0, 0), (1, 1)])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(keep, cov / np.sqrt(var_a * var_b), np.nan)
+
+
+def ewm(panel: np.ndarray, alpha, min_periods: int = 0) -> np.ndarray:
+    """
+    ewm(alpha=alpha, adjust=False, min_periods=min_periods).mean() per column.
+
+    ``panel`` may carry extra trailing axes, e.g. [T, k, S] to smooth k
+    stacked series in one pass. ``alpha`` may be an array that broadcasts
+    against panel.shape[1:].  Missing values keep the previous mean.  The
+    next observation's weight accounts for the skipped steps, as pandas does.
+
+    The previous mean's weight starts at 0, so the first observation takes
+    over the mean without a special case.  Per-step work is a handful of
+    in-place ufuncs; the observation masks and weights are precomputed.
+    """
+    alpha = np.broadcast_to(np.asarray(alpha, dtype=np.float64), panel.shape[1:])
+    decay = 1.0 - alpha
+    obs = ~np.isnan(panel)
+    a_obs = np.where(obs, alpha, 0.0)
+    ax_obs = np.where(obs, panel, 0.0) * a_obs
+
+    out = np.empty(panel.shape, dtype=np.float64)
+    mean = np.zeros(panel.shape[1:])
+    old_wt = np.zeros(panel.shape[1:])
+    num = np.empty_like(mean)
+    den = np.empty_like(mean)
+    for t in range(len(panel)):
+        np.multiply(old_wt, decay, out=old_wt)
+        np.multiply(old_wt, mean, out=num)
+        num += ax_obs[t]
+        np.add(old_wt, a_obs[t], out=den)
+        np.divide(num, den, out=mean, where=obs[t])
+        np.copyto(old_wt, 1.0, where=obs[t])
+        out[t] = mean
+    nobs = _cumsum_rows(obs, dtype=np.int64)
+    out[nobs < max(min_periods, 1)] = np.nan
+    return out
+
+
+# ============================================================
+# 3. Indicators
+# ============================================================
+# Elementwise building blocks, shared with indicator_stream's per-bar updates.
+def true_range(high, low, prev_close):
+    """max(high - low, |high - prev_close|, |low - prev_close|), skipping NaN terms like DataFrame.max."""
+    return np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+
+
+def directional_movement(high, low, prev_high, prev_low):
+    up_move = high - prev_high
+    down_move = prev_low - low
+    plus_dm = np.where((up_move > down_move) & (up_move > 0), up_move, 0.0)
+    minus_dm = np.where((down_move > up_move) & (down_move > 0), down_move, 0.0)
+    return plus_dm, minus_dm
+
+
+def dist_from_ma50(close, ma50):
+    """(close - MA50) / MA50, the distance the model is trained on; NaN where MA50 is 0 or missing."""
+    ma50 = np.where(ma50 == 0, np.nan, ma50)
+    return (close - ma50) / (ma50 + 1e-9)
+
+
+def rsi_from_averages(avg_gain, avg_loss):
+    rs = np.where(avg_loss == 0, 0, avg_gain / avg_loss)
+    return np.where(avg_loss == 0, 100, 100 - (100 / (1 + rs)))
+
+
+def directional_index(plus_sm, minus_sm, atr):
+    """DX from the Wilder-smoothed +DM / -DM and ATR (the input to ADX's smoothing)."""
+    safe_atr = np.where(atr == 0, np.nan, atr)
+    plus_di = 100 * (plus_sm / safe_atr)
+    minus_di = 100 * (minus_sm / safe_atr)
+    di_sum = np.abs(plus_di + minus_di)
+    return np.where(di_sum == 0, 0, 100 * np.abs(plus_di - minus_di) / di_sum)
+
+
+def obv_change(close, prev_close, volume):
+    return np.where(close > prev_close, volume, np.where(close < prev_close, -volume, 0))
+
+
+def compute_indicators(close, high, low, volume) -> dict:
+    """
+    All INDICATOR_COLUMNS from [T, S] OHLCV panels (float64, NaN-padded).
+
+    Conventions, shared by every caller:
+      - RSI, ATR and ADX use Wilder smoothing (alpha = 1/14, min_periods = 14)
+      - Rolling_Vol_20d_std is the 20-day std of close
+      - Dist_from_MA50 is (close - MA50) / MA50 (dist_from_ma50), as training derives it
+      - divisions by zero give the documented 0 / 100 fallbacks or +-inf;
+        callers replace inf / NaN (warm-up rows) as their output requires
+    """
+    out = {}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        prev_close = shift(close)
+
+        # 1. Trend
+        ma20 = rolling_mean(close, 20)
+        out['MA20'] = ma20
+        out['MA50'] = rolling_mean(close, 50)
+        emas = ewm(np.stack([close] * len(EMA_SPANS), axis=1),
+                   alpha=(2.0 / (np.array(EMA_SPANS) + 1.0))[:, None])
+        out['EMA20'] = emas[:, 0]
+
+        # 2. Momentum + Wilder-smoothed components
+        delta = diff(close)
+        tr = true_range(high, low, prev_close)
+        plus_dm, minus_dm = directional_movement(high, low, shift(high), shift(low))
+        wilder = ewm(np.stack([np.clip(delta, 0, None), -np.clip(delta, None, 0), tr, plus_dm, minus_dm], axis=1),
+                     alpha=WILDER_ALPHA, min_periods=WILDER_MIN_PERIODS)
+        avg_gain, avg_loss, atr, plus_sm, minus_sm = (wilder[:, i] for i in range(5))
+
+        out['RSI'] = rsi_from_averages(avg_gain, avg_loss)
+        out['MACD'] = emas[:, 1] - emas[:, 2]
+
+        # 3. Volatility
+        std20 = rolling_std(close, 20)
+        out['Rolling_Vol_20d_std'] = std20
+        out['ATR'] = atr
+
+        # 4. Volume
+        out['Volume_MA20'] = rolling_mean(volume, 20)
+        out['Volume_Change_pct'] = pct_change(volume)
+
+        # 5. Performance
+        ret_1d = pct_change(close)
+        out['Daily_Return_1d'] = ret_1d
+        out['Daily_Return_5d'] = pct_change(close, 5)
+        first_close = close[:1]
+        out['Cumulative_Return'] = np.where(first_close == 0, 0, (close / first_close) - 1)
+        out['Daily_Range'] = high - low
+
+        # 6. Correlation
+        out['Vol_Close_Corr_20d'] = rolling_corr(close, volume, 20)
+
+        # 7. Texture: Bollinger width (normalised by the middle band), ADX, OBV slope
+        out['BB_Width'] = np.where(ma20 == 0, 0, (4 * std20) / ma20)
+        dx = directional_index(plus_sm, minus_sm, atr)
+        out['ADX'] = ewm(dx, alpha=WILDER_ALPHA, min_periods=WILDER_MIN_PERIODS)
+        obv = cumsum(obv_change(close, prev_close, volume))
+        out['OBV_Slope_5d'] = diff(obv, 5) / 5
+
+        # 8. Memory
+        out['Lagged_Return_t1'] = shift(ret_1d, 1)
+        out['Lagged_Return_t3'] = shift(ret_1d, 3)
+        out['Lagged_Return_t5'] = shift(ret_1d, 5)
+        out['Dist_from_MA50'] = dist_from_ma50(close, out['MA50'])
+    return {name: out[name] for name in INDICATOR_COLUMNS}
+
+
+# ============================================================
+# 4. Multi-process build on shared-memory panels
+# ============================================================
+def _shared_panel(shm: shared_memory.SharedMemory, shape) -> np.ndarray:
+    return np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+
+
+def _indicator_worker(task) -> int:
+    """
+    Pool task: indicators for symbol columns [lo, hi) of the shared
+    [4, T, S] input block, written into the same columns of the shared
+    [len(INDICATOR_COLUMNS), T, S] output block.  Only names and bounds
+    cross the process boundary.
+    """
+    in_name, out_name, shape, lo, hi = task
+    shm_in = shared_memory.SharedMemory(name=in_name)
+    shm_out = shared_memory.SharedMemory(name=out_name)
+    src = dst = None
+    try:
+        src = _shared_panel(shm_in, (len(OHLCV_INPUTS),) + shape)
+        dst = _shared_panel(shm_out, (len(INDICATOR_COLUMNS),) + shape)
+        result = compute_indicators(*(np.ascontiguousarray(src[i, :, lo:hi]) for i in range(len(OHLCV_INPUTS))))
+        for k, name in enumerate(INDICATOR_COLUMNS):
+            dst[k, :, lo:hi] = result[name]
+        return hi - lo
+    finally:
+        # Views must be gone before close(), or the mapping stays exported.
+        src = dst = result = None
+        shm_in.close()
+        shm_out.close()
+
+
+def _parallel_indicator_rows(layout: PanelLayout, ohlcv: dict, gather, workers: int) -> dict:
+    """
+    compute_indicators over ``workers`` processes: the OHLCV panels are
+    scattered once into shared memory, each worker takes a contiguous range
+    of symbol columns (every indicator is column-local), and the output
+    panels are gathered back to long rows with ``gather``.
+    """
+    shape = layout.shape
+    size = max(int(np.prod(shape)), 1) * np.dtype(np.float64).itemsize
+    shm_in = shared_memory.SharedMemory(create=True, size=len(OHLCV_INPUTS) * size)
+    shm_out = shared_memory.SharedMemory(create=True, size=len(INDICATOR_COLUMNS) * size)
+    src = dst = None
+    try:
+        src = _shared_panel(shm_in, (len(OHLCV_INPUTS),) + shape)
+        for i, col in enumerate(OHLCV_INPUTS):
+            layout.to_panel(ohlcv[col], out=src[i])
+
+        bounds = np.linspace(0, shape[1], min(workers, shape[1]) + 1).astype(int)
+        tasks = [(shm_in.name, shm_out.name, shape, int(lo), int(hi))
+                 for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo]
+        with concurrent.futures.ProcessPoolExecutor(max_workers=len(tasks)) as pool:
+            done = sum(pool.map(_indicator_worker, tasks))
+        if done != shape[1]:
+            raise RuntimeError(f"Indicator workers covered {done} of {shape[1]} symbols")
+
+        dst = _shared_panel(shm_out, (len(INDICATOR_COLUMNS),) + shape)
+        return {name: gather(dst[k]) for k, name in enumerate(INDICATOR_COLUMNS)}
+    finally:
+        src = dst = None
+        for shm in (shm_in, shm_out):
+            shm.close()
+            shm.unlink()
+
+
+def calculate_indicators(df: pd.DataFrame, group_col: str = 'symbol', time_col: str = 'time',
+                         sort: bool = False, workers: int = 1) -> pd.DataFrame:
+    """
+    Long OHLCV frame -> the same rows with INDICATOR_COLUMNS appended
+    (existing columns of those names are replaced), in input order, or
+    ordered by (group_col, time_col) when ``sort`` is set.
+
+    A frame without ``group_col`` is treated as a single series.  Warm-up
+    rows are NaN and zero divisions may be +-inf.  Cleanup is left to the
+    caller.  With ``workers`` > 1 the symbols are split across a process
+    pool that shares the panels through shared memory.
+    """
+    layout = PanelLayout.from_frame(df, group_col, time_col)
+    ohlcv = {c: pd.to_numeric(df[c], errors='coerce').to_numpy(dtype=np.float64) for c in OHLCV_INPUTS}
+    gather = layout.to_rows if sort else layout.to_input_rows
+    if workers > 1 and layout.shape[1] > 1:
+        values = _parallel_indicator_rows(layout, ohlcv, gather, workers)
+    else:
+        indicators = compute_indicators(*(layout.to_panel(ohlcv[c]) for c in OHLCV_INPUTS))
+        values = {name: gather(panel) for name, panel in indicators.items()}
+
+    out = df.drop(columns=INDICATOR_COLUMNS, errors='ignore')
+    if sort:
+        out = out.iloc[layout.order]
+    return pd.concat([out, pd.DataFrame(values, index=out.index)], axis=1)
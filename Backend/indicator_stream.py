@@ -0,0 +1,410 @@
+"""
+STREAMING INDICATOR UPDATER
+===========================
+Per-symbol recurrence state for the metrics table, so that a new daily bar
+costs O(1) per symbol instead of a recompute from each symbol's first row.
+
+State kept per symbol (persisted as one .npz):
+  - EWM mean / weight / observation count for EMA20, EMA12, EMA26 and the
+    Wilder averages (gain, loss, true range, +DM, -DM, DX -> RSI, ATR, ADX)
+  - ring buffers: last 50 closes (MA20/MA50, std, 5-day return, lagged
+    returns), last 20 volumes, last 5 OBV values
+  - running OBV, the first close (Cumulative_Return), previous high / low
+  - the last bar's time, so replays and duplicates are skipped
+
+Formulas and NaN handling are indicator_engine's (same EWM recursion, same
+elementwise helpers), so a streamed row equals the full recompute up to
+float summation order in the window means.
+
+How to Run:
+-----------
+# 1. Build the state once from the full price history
+python indicator_stream.py --mode init --prices stock_prices.csv --state indicator_state.npz
+
+# 2. Each day: one new bar per symbol -> new metrics rows, state advanced in place
+python indicator_stream.py --mode update --bars new_bars.csv --state indicator_state.npz \\
+    --output new_metrics.csv
+
+# 3. Check streaming against a full recompute over the last N bars of every symbol
+python indicator_stream.py --mode verify --prices stock_prices.csv --verify_bars 20
+"""
+
+import os
+import json
+import argparse
+import logging
+
+import numpy as np
+import pandas as pd
+
+from indicator_engine import (
+    EMA_SPANS,
+    INDICATOR_COLUMNS,
+    WILDER_ALPHA,
+    WILDER_MIN_PERIODS,
+    PanelLayout,
+    calculate_indicators,
+    directional_index,
+    directional_movement,
+    dist_from_ma50,
+    obv_change,
+    rsi_from_averages,
+    true_range,
+)
+
+logger = logging.getLogger(__name__)
+
+STATE_VERSION = 1
+
+CLOSE_WINDOW  = 50   # MA50 is the longest close window
+VOLUME_WINDOW = 20
+OBV_LAG       = 5
+
+# EWM columns: EMA20, EMA12, EMA26, then the Wilder averages; DX (-> ADX) last,
+# because it is computed from the smoothed ATR / DM of the same bar.
+EWM_NAMES = ['ema20', 'ema12', 'ema26', 'avg_gain', 'avg_loss', 'atr', 'plus_dm', 'minus_dm', 'adx']
+EWM_ALPHA = np.array([2.0 / (s + 1.0) for s in EMA_SPANS] + [WILDER_ALPHA] * 6)
+EWM_MIN_PERIODS = np.array([0] * len(EMA_SPANS) + [WILDER_MIN_PERIODS] * 6)
+
+# Per-symbol arrays persisted in the state file: name -> (trailing shape, dtype, initial value).
+STATE_FIELDS = {
+    'last_time':   ((),               'datetime64[ns]', np.datetime64('NaT')),
+    'n_bars':      ((),               np.int64,         0),
+    'first_close': ((),               np.float64,       np.nan),
+    'prev_high':   ((),               np.float64,       np.nan),
+    'prev_low':    ((),               np.float64,       np.nan),
+    'close_buf':   ((CLOSE_WINDOW,),  np.float64,       np.nan),
+    'volume_buf':  ((VOLUME_WINDOW,), np.float64,       np.nan),
+    'obv_total':   ((),               np.float64,       0.0),
+    'obv_buf':     ((OBV_LAG,),       np.float64,       np.nan),
+    'ewm_mean':    ((len(EWM_NAMES),), np.float64,      0.0),
+    'ewm_wt':      ((len(EWM_NAMES),), np.float64,      0.0),
+    'ewm_nobs':    ((len(EWM_NAMES),), np.int64,        0),
+}
+
+
+def _ewm_step(mean, wt, nobs, x, alpha, min_periods):
+    """
+    One indicator_engine.ewm step for rows of [n, k] state (updated in place).
+    Same operation order as the panel recursion, so results are bit-identical.
+    """
+    obs = ~np.isnan(x)
+    a_obs = np.where(obs, alpha, 0.0)
+    ax_obs = np.where(obs, x, 0.0) * a_obs
+    wt *= 1.0 - alpha
+    num = wt * mean
+    num += ax_obs
+    den = wt + a_obs
+    np.divide(num, den, out=mean, where=obs)
+    np.copyto(wt, 1.0, where=obs)
+    nobs += obs
+    return np.where(nobs >= np.maximum(min_periods, 1), mean, np.nan)
+
+
+def _push(buf, values):
+    """Shift a [n, w] ring buffer left by one and append ``values`` (newest last)."""
+    buf[:, :-1] = buf[:, 1:]
+    buf[:, -1] = values
+
+
+def _window_std(w):
+    m = w.mean(axis=1, keepdims=True)
+    return np.sqrt(((w - m) ** 2).sum(axis=1) / (w.shape[1] - 1))
+
+
+def _window_corr(a, b):
+    da = a - a.mean(axis=1, keepdims=True)
+    db = b - b.mean(axis=1, keepdims=True)
+    return (da * db).sum(axis=1) / np.sqrt((da * da).sum(axis=1) * (db * db).sum(axis=1))
+
+
+def _to_datetime64(series: pd.Series) -> np.ndarray:
+    times = pd.to_datetime(series)
+    if getattr(times.dt, 'tz', None) is not None:
+        times = times.dt.tz_convert(None)
+    return times.to_numpy(dtype='datetime64[ns]')
+
+
+class IndicatorState:
+    """Recurrence state for a universe of symbols; row i of every array is symbols[i]."""
+
+    def __init__(self, symbols=()):
+        self.symbols = [str(s) for s in symbols]
+        self.index = {s: i for i, s in enumerate(self.symbols)}
+        self.arrays = {name: np.full((len(self.symbols),) + shape, init, dtype=dtype)
+                       for name, (shape, dtype, init) in STATE_FIELDS.items()}
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def rows_for(self, symbols) -> np.ndarray:
+        """State rows for ``symbols``; unseen symbols (new listings) get a fresh row."""
+        new = [s for s in dict.fromkeys(str(s) for s in symbols) if s not in self.index]
+        if new:
+            for s in new:
+                self.index[s] = len(self.symbols)
+                self.symbols.append(s)
+            fresh = IndicatorState(new).arrays
+            self.arrays = {name: np.concatenate([arr, fresh[name]]) for name, arr in self.arrays.items()}
+        return np.array([self.index[str(s)] for s in symbols], dtype=np.int64)
+
+    # ------------------------------------------------------------------
+    # Per-bar update
+    # ------------------------------------------------------------------
+    def step(self, rows, times, close, high, low, volume) -> dict:
+        """
+        Advance ``rows`` (distinct state rows) by one bar each and return
+        their INDICATOR_COLUMNS as arrays.  Raw values: warm-up NaN and
+        zero-division inf are left in, as from indicator_engine.
+        """
+        st = {name: arr[rows] for name, arr in self.arrays.items()}
+        close, high, low, volume = (np.asarray(v, dtype=np.float64) for v in (close, high, low, volume))
+        out = {}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            prev_close = st['close_buf'][:, -1].copy()
+            first = st['n_bars'] == 0
+            st['first_close'] = np.where(first, close, st['first_close'])
+            _push(st['close_buf'], close)
+            _push(st['volume_buf'], volume)
+            closes = st['close_buf']
+
+            # Recursive averages (EMA20/12/26 + Wilder), then DX -> ADX on the updated values
+            delta = close - prev_close
+            plus_dm, minus_dm = directional_movement(high, low, st['prev_high'], st['prev_low'])
+            x = np.stack([close, close, close,
+                          np.clip(delta, 0, None), -np.clip(delta, None, 0),
+                          true_range(high, low, prev_close), plus_dm, minus_dm], axis=1)
+            smoothed = _ewm_step(st['ewm_mean'][:, :-1], st['ewm_wt'][:, :-1], st['ewm_nobs'][:, :-1],
+                                 x, EWM_ALPHA[:-1], EWM_MIN_PERIODS[:-1])
+            ema20, ema12, ema26, avg_gain, avg_loss, atr, plus_sm, minus_sm = smoothed.T
+            dx = directional_index(plus_sm, minus_sm, atr)
+            adx = _ewm_step(st['ewm_mean'][:, -1:], st['ewm_wt'][:, -1:], st['ewm_nobs'][:, -1:],
+                            dx[:, None], EWM_ALPHA[-1:], EWM_MIN_PERIODS[-1:])[:, 0]
+
+            # Running OBV (NaN change rows stay NaN, the total carries over)
+            change = obv_change(close, prev_close, volume)
+            st['obv_total'] = st['obv_total'] + np.nan_to_num(change, nan=0.0)
+            obv = np.where(np.isnan(change), np.nan, st['obv_total'])
+            obv_slope = (obv - st['obv_buf'][:, 0]) / OBV_LAG
+            _push(st['obv_buf'], obv)
+
+            ma20 = closes[:, -20:].mean(axis=1)
+            ma50 = closes.mean(axis=1)
+            std20 = _window_std(closes[:, -20:])
+            ret = closes[:, -7:][:, 1:] / closes[:, -7:][:, :-1] - 1.0  # returns t-5 .. t
+
+            out['MA20'] = ma20
+            out['MA50'] = ma50
+            out['EMA20'] = ema20
+            out['RSI'] = rsi_from_averages(avg_gain, avg_loss)
+            out['MACD'] = ema12 - ema26
+            out['Rolling_Vol_20d_std'] = std20
+            out['ATR'] = atr
+            out['Volume_MA20'] = st['volume_buf'].mean(axis=1)
+            out['Volume_Change_pct'] = volume / st['volume_buf'][:, -2] - 1.0
+            out['Daily_Return_1d'] = ret[:, -1]
+            out['Daily_Return_5d'] = close / closes[:, -6] - 1.0
+            out['Cumulative_Return'] = np.where(st['first_close'] == 0, 0, (close / st['first_close']) - 1)
+            out['Daily_Range'] = high - low
+            out['Vol_Close_Corr_20d'] = _window_corr(closes[:, -20:], st['volume_buf'])
+            out['BB_Width'] = np.where(ma20 == 0, 0, (4 * std20) / ma20)
+            out['ADX'] = adx
+            out['OBV_Slope_5d'] = obv_slope
+            out['Lagged_Return_t1'] = ret[:, -2]
+            out['Lagged_Return_t3'] = ret[:, -4]
+            out['Lagged_Return_t5'] = ret[:, -6]
+            out['Dist_from_MA50'] = dist_from_ma50(close, ma50)
+
+        st['prev_high'] = high
+        st['prev_low'] = low
+        st['n_bars'] = st['n_bars'] + 1
+        st['last_time'] = times
+        for name, arr in self.arrays.items():
+            arr[rows] = st[name]
+        return {name: out[name] for name in INDICATOR_COLUMNS}
+
+    def update(self, bars: pd.DataFrame) -> pd.DataFrame:
+        """
+        Apply one bar per symbol (columns time, symbol, high, low, close,
+        volume).  Bars at or before a symbol's last applied time are skipped,
+        so re-running an ingest is harmless.  Returns time, symbol and the raw
+        INDICATOR_COLUMNS of the applied bars.
+        """
+        if bars['symbol'].duplicated().any():
+            dupes = bars.loc[bars['symbol'].duplicated(), 'symbol'].unique().tolist()
+            raise ValueError(f"update() takes one bar per symbol; duplicated: {dupes[:10]}")
+        rows = self.rows_for(bars['symbol'])
+        times = _to_datetime64(bars['time'])
+        last = self.arrays['last_time'][rows]
+        fresh = np.isnat(last) | (times > last)
+        if not fresh.all():
+            logger.warning("Skipping %d bar(s) not newer than the stored state: %s",
+                           int((~fresh).sum()), bars['symbol'][~fresh].tolist()[:10])
+        bars, rows, times = bars[fresh], rows[fresh], times[fresh]
+        values = {c: pd.to_numeric(bars[c], errors='coerce').to_numpy(dtype=np.float64)
+                  for c in ('close', 'high', 'low', 'volume')}
+        indicators = self.step(rows, times, values['close'], values['high'], values['low'], values['volume'])
+        result = pd.DataFrame({'time': bars['time'].to_numpy(), 'symbol': bars['symbol'].to_numpy()})
+        return pd.concat([result, pd.DataFrame(indicators)], axis=1)
+
+    # ------------------------------------------------------------------
+    # Bootstrap from history
+    # ------------------------------------------------------------------
+    @classmethod
+    def from_history(cls, prices: pd.DataFrame) -> 'IndicatorState':
+        """
+        Replay a full price history bar by bar (vectorised across symbols per
+        bar position) to reach the state after each symbol's last bar.
+        """
+        layout = PanelLayout.from_frame(prices)
+        symbols = prices['symbol'].to_numpy()[layout.order]
+        starts = np.r_[0, np.cumsum(layout.lengths)[:-1]].astype(np.int64)
+        state = cls(symbols[starts])
+
+        times = _to_datetime64(prices['time'])[layout.order]
+        values = {c: pd.to_numeric(prices[c], errors='coerce').to_numpy(dtype=np.float64)[layout.order]
+                  for c in ('close', 'high', 'low', 'volume')}
+        rowid = np.full(layout.shape, -1, dtype=np.int64)
+        rowid.ravel()[layout.flat] = np.arange(len(layout.order))
+        for t in range(layout.shape[0]):
+            cols = np.flatnonzero(rowid[t] >= 0)
+            r = rowid[t, cols]
+            state.step(cols, times[r], values['close'][r], values['high'][r], values['low'][r], values['volume'][r])
+        return state
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+    def save(self, path: str):
+        """Atomic write (tmp + rename): a crash mid-save leaves the previous state intact."""
+        tmp_path = f"{path}.tmp.npz"
+        meta = {'version': STATE_VERSION, 'columns': INDICATOR_COLUMNS,
+                'ewm': EWM_NAMES, 'close_window': CLOSE_WINDOW, 'volume_window': VOLUME_WINDOW}
+        np.savez(tmp_path, symbols=np.array(self.symbols, dtype=str), meta=np.array(json.dumps(meta)),
+                 **{name: (arr.view(np.int64) if arr.dtype.kind == 'M' else arr) for name, arr in self.arrays.items()})
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'IndicatorState':
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data['meta']))
+            if meta.get('version') != STATE_VERSION or meta.get('columns') != INDICATOR_COLUMNS:
+                raise ValueError(f"Indicator state {path} was written by an incompatible version; "
+                                 f"rebuild it with --mode init")
+            state = cls()
+            state.symbols = data['symbols'].tolist()
+            state.index = {s: i for i, s in enumerate(state.symbols)}
+            state.arrays = {name: (data[name].view(dtype) if np.dtype(dtype).kind == 'M' else data[name])
+                            for name, (_, dtype, _) in STATE_FIELDS.items()}
+        return state
+
+
+def finalize_metrics_rows(rows: pd.DataFrame) -> pd.DataFrame:
+    """Metrics-table formatting, as in Scraper/metrics.py: inf/NaN -> 0, 4 decimals."""
+    out = rows.copy()
+    out[INDICATOR_COLUMNS] = out[INDICATOR_COLUMNS].replace([np.inf, -np.inf], np.nan).fillna(0).round(4)
+    return out
+
+
+def read_bars(path: str) -> pd.DataFrame:
+    df = pd.read_csv(path)
+    for col in ('open', 'high', 'low', 'close', 'volume'):
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    df['time'] = pd.to_datetime(df['time'])
+    return df
+
+
+# ============================================================
+# Verification against a full recompute
+# ============================================================
+def verify_streaming(prices: pd.DataFrame, verify_bars: int, rtol: float = 1e-9, atol: float = 1e-9) -> dict:
+    """
+    Build the state from all but the last ``verify_bars`` bars of every
+    symbol, stream those bars date by date, and compare each emitted row
+    with indicator_engine.calculate_indicators on the full history.
+    """
+    prices = prices.reset_index(drop=True)
+    pos_from_end = prices.sort_values(['symbol', 'time']).groupby('symbol').cumcount(ascending=False)
+    tail = pos_from_end.sort_index() < verify_bars
+    if tail.all():
+        raise ValueError(f"verify_bars={verify_bars} leaves no history to build the state from")
+
+    state = IndicatorState.from_history(prices[~tail])
+    streamed = []
+    new_bars = prices[tail]
+    for _, day in new_bars.groupby('time', sort=True):
+        streamed.append(state.update(day))
+    streamed = pd.concat(streamed, ignore_index=True)
+
+    full = calculate_indicators(prices)[['time', 'symbol'] + INDICATOR_COLUMNS]
+    merged = streamed.merge(full, on=['time', 'symbol'], suffixes=('_stream', '_full'), validate='one_to_one')
+
+    report = {'rows': int(len(merged)), 'columns': {}}
+    failures = []
+    for col in INDICATOR_COLUMNS:
+        s = merged[f"{col}_stream"].to_numpy()
+        f = merged[f"{col}_full"].to_numpy()
+        ok = np.isclose(s, f, rtol=rtol, atol=atol, equal_nan=True) | ((s == f) & np.isinf(f))
+        finite = np.isfinite(s) & np.isfinite(f)
+        report['columns'][col] = {
+            'max_abs_diff': float(np.abs(s[finite] - f[finite]).max()) if finite.any() else 0.0,
+            'mismatches': int((~ok).sum()),
+        }
+        if not ok.all():
+            failures.append(col)
+    report['ok'] = not failures
+    report['failed_columns'] = failures
+    return report
+
+
+# ============================================================
+# Entry point
+# ============================================================
+def main():
+    parser = argparse.ArgumentParser(description="Streaming per-bar indicator updates with persisted state")
+    parser.add_argument("--mode",        type=str, required=True, choices=["init", "update", "verify"])
+    parser.add_argument("--prices",      type=str, default="stock_prices.csv",
+                        help="Full OHLCV history (init / verify)")
+    parser.add_argument("--bars",        type=str, default=None,
+                        help="New bars, one per symbol (update)")
+    parser.add_argument("--state",       type=str, default="indicator_state.npz")
+    parser.add_argument("--output",      type=str, default=None,
+                        help="Where update writes the new metrics rows (CSV); printed if omitted")
+    parser.add_argument("--verify_bars", type=int, default=20,
+                        help="Bars per symbol streamed in verify mode")
+    parser.add_argument("--rtol",        type=float, default=1e-9)
+    parser.add_argument("--atol",        type=float, default=1e-9)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.mode == "init":
+        prices = read_bars(args.prices)
+        state = IndicatorState.from_history(prices)
+        state.save(args.state)
+        logger.info("Indicator state for %d symbols (%d bars) written to %s", len(state), len(prices), args.state)
+
+    elif args.mode == "update":
+        if not args.bars:
+            parser.error("--mode update requires --bars")
+        state = IndicatorState.load(args.state)
+        rows = finalize_metrics_rows(state.update(read_bars(args.bars)))
+        state.save(args.state)
+        if args.output:
+            rows.to_csv(args.output, index=False)
+            logger.info("%d metrics rows written to %s", len(rows), args.output)
+        else:
+            print(rows.to_string(index=False))
+
+    else:
+        report = verify_streaming(read_bars(args.prices), args.verify_bars, rtol=args.rtol, atol=args.atol)
+        for col, r in report['columns'].items():
+            print(f"  {col:<20s} max_abs_diff={r['max_abs_diff']:.3e}  mismatches={r['mismatches']}")
+        print(f"\nVerified {report['rows']} streamed rows: {'OK' if report['ok'] else 'FAILED ' + str(report['failed_columns'])}")
+        if not report['ok']:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,35 @@
 import os
 import json
+import hashlib
 import logging
+import threading
 import torch
 from datetime import datetime, timedelta
 import numpy as np
 import pandas as pd
 import joblib
-from sqlalchemy import text
 
 from feature_pipeline import (
     FEATURE_SCHEMA,
     normalize_features,
+    fill_forward_backward,
     validate_feature_schema,
     assert_sequence_integrity,
     log_input_stats,
-    to_model_feature_frame,
+    prepare_model_input,
+    scaler_vectors,
+    standardize_model_input,
+    CONTRACT_HISTORY_ROWS,
     enforce_scaled_anomaly_guard,
 )
-from train import predict, MultiMetricPredictor
-from database import sync_engine
+from train import (
+    predict,
+    predict_multi_horizon,
+    MultiMetricPredictor,
+    MultiHorizonPredictor,
+    SHARED_ENCODER_DIR,
+    SHARED_ENCODER_CONFIG,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -32,6 +43,10 @@ MODELS_DIR = os.path.join(BASE_DIR, 'output_model')
 # Fixed Forecast Range according to specification parity limits
 PYTORCH_FORECAST_DAYS = 7
 LOOKBACK_WINDOW = 120
+# Bars ahead of the window seed its first returns and lagged returns (prepare_model_input).
+PREDICTION_FETCH_ROWS = LOOKBACK_WINDOW + CONTRACT_HISTORY_ROWS
+# Optional shared-encoder checkpoint (train.py --shared_encoder) serving all horizons in one pass.
+MULTI_HORIZON_DIR = os.path.join(MODELS_DIR, SHARED_ENCODER_DIR)
 
 _metadata_cache = {
     'scaler_X': None,
@@ -40,6 +55,58 @@ _metadata_cache = {
     'symbol_mapping': None
 }
 _model_instances = {}
+_fingerprint_lock = threading.Lock()
+_fingerprint_state = {'stat_key': None, 'digest': None}
+
+METADATA_FILES = ('scaler_X.pkl', 'scaler_Y.pkl', 'features.json', 'symbol_mapping.json')
+
+def resolve_checkpoint_path(days: int = PYTORCH_FORECAST_DAYS):
+    candidate_paths = [
+        os.path.join(MODELS_DIR, f'{days}d', 'best_model.pth'),
+        os.path.join(MODELS_DIR, f'{days}d', f'{days}d.pth'),
+        os.path.join(MODELS_DIR, f'{days}d.pth'),
+        # Per-horizon export of a shared-encoder run (train.export_horizon_checkpoints).
+        os.path.join(MULTI_HORIZON_DIR, f'{days}d', 'best_model.pth'),
+    ]
+    return next((p for p in candidate_paths if os.path.exists(p)), None)
+
+def get_checkpoint_fingerprint(days: int = PYTORCH_FORECAST_DAYS) -> str:
+    """
+    Short content hash of the deployed checkpoint plus scalers/metadata.
+
+    Files are only re-hashed when their (mtime, size) changes. A changed
+    fingerprint means a new deployment, so cached scalers and model
+    instances are dropped and reloaded on the next prediction.
+    """
+    paths = [
+        resolve_checkpoint_path(days),
+        os.path.join(MULTI_HORIZON_DIR, 'best_model.pth'),
+        os.path.join(MULTI_HORIZON_DIR, SHARED_ENCODER_CONFIG),
+    ] + [os.path.join(MODELS_DIR, name) for name in METADATA_FILES]
+    paths = [p for p in paths if p and os.path.exists(p)]
+    stat_key = tuple((p, os.stat(p).st_mtime_ns, os.stat(p).st_size) for p in paths)
+
+    with _fingerprint_lock:
+        if stat_key == _fingerprint_state['stat_key']:
+            return _fingerprint_state['digest']
+
+        hasher = hashlib.sha256()
+        for p in paths:
+            hasher.update(os.path.relpath(p, MODELS_DIR).encode())
+            with open(p, 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    hasher.update(chunk)
+        digest = hasher.hexdigest()[:16] if paths else 'missing'
+
+        if _fingerprint_state['digest'] is not None and digest != _fingerprint_state['digest']:
+            logger.info("Model artefacts changed (%s -> %s); reloading on next use.", _fingerprint_state['digest'], digest)
+            for key in _metadata_cache:
+                _metadata_cache[key] = None
+            _model_instances.clear()
+
+        _fingerprint_state['stat_key'] = stat_key
+        _fingerprint_state['digest'] = digest
+        return digest
 
 def load_metadata():
     if _metadata_cache['scaler_X'] is None:
@@ -77,12 +144,7 @@ def get_model(num_symbols: int, num_features: int, num_targets: int = 4):
             forecast_horizon=days,
             num_target_metrics=num_targets
         )
-        candidate_paths = [
-            os.path.join(MODELS_DIR, f'{days}d', 'best_model.pth'),
-            os.path.join(MODELS_DIR, f'{days}d', f'{days}d.pth'),
-            os.path.join(MODELS_DIR, f'{days}d.pth'),
-        ]
-        model_path = next((p for p in candidate_paths if os.path.exists(p)), None)
+        model_path = resolve_checkpoint_path(days)
 
         if model_path is None:
             raise FileNotFoundError(f"Checkpoint not found for {days}D horizon in {MODELS_DIR}")
@@ -99,59 +161,132 @@ def get_model(num_symbols: int, num_features: int, num_targets: int = 4):
         
     return _model_instances[days]
 
+def get_multi_horizon_model(num_symbols: int, num_features: int, num_targets: int = 4):
+    """
+    Loads the shared-encoder checkpoint if one is deployed and it covers
+    PYTORCH_FORECAST_DAYS; returns None otherwise (per-horizon path is used).
+    """
+    if SHARED_ENCODER_DIR in _model_instances:
+        return _model_instances[SHARED_ENCODER_DIR]
+
+    model_path = os.path.join(MULTI_HORIZON_DIR, 'best_model.pth')
+    config_path = os.path.join(MULTI_HORIZON_DIR, SHARED_ENCODER_CONFIG)
+    if not (os.path.exists(model_path) and os.path.exists(config_path)):
+        return None
+
+    with open(config_path, 'r') as f:
+        config = json.load(f)
+    horizons = [int(h) for h in config.get('horizons', [])]
+    if PYTORCH_FORECAST_DAYS not in horizons or int(config.get('lookback', LOOKBACK_WINDOW)) != LOOKBACK_WINDOW:
+        logger.warning("Shared-encoder checkpoint %s does not match serving config; ignoring.", config)
+        return None
+
+    model = MultiHorizonPredictor(
+        num_symbols=num_symbols,
+        num_features=num_features,
+        lookback=LOOKBACK_WINDOW,
+        horizons=horizons,
+        num_target_metrics=num_targets,
+    )
+    try:
+        model.load_state_dict(torch.load(model_path, map_location=device, weights_only=True))
+        logger.info(f"✅ Loaded shared-encoder predictor for horizons {horizons} on {device}")
+    except Exception as e:
+        raise RuntimeError(f"Could not decode checkpoint bindings for {model_path}: {e}") from e
+
+    model.to(device)
+    model.eval()
+    _model_instances[SHARED_ENCODER_DIR] = model
+    return model
+
 # ────────────────────────────────────────────────────────────
 # Data Acquisition
 # ────────────────────────────────────────────────────────────
-def fetch_stock_data(symbol: str, limit: int, _fallback_data: list) -> pd.DataFrame:
-    """Fetch full canonical feature set from DB using exact timestamp alignment."""
-    try:
-        query = text("""
-            SELECT *
-            FROM (
-                SELECT p."time", p.open, p.high, p.low, p.close, p.volume,
-                       m.ma20, m.ma50, m.ema20,
-                       m.rsi, m.macd,
-                       m.rolling_vol_20d_std AS volatility,
-                       m.atr,
-                       m.daily_return_1d,
-                       m.lagged_return_t1,
-                       m.lagged_return_t3,
-                       m.lagged_return_t5,
-                       m.dist_from_ma50
-                FROM stock_prices p
-                INNER JOIN metrics m ON p.symbol = m.symbol AND p."time" = m."time"
-                WHERE p.symbol = :sym
-                ORDER BY p."time" DESC
-                LIMIT :limit
-            ) latest
-            ORDER BY latest."time" ASC
-        """)
-        with sync_engine.connect() as conn:
-            df = pd.read_sql(query, conn, params={"sym": symbol, "limit": limit})
-
-        if df.empty:
-            raise ValueError(f"No rows returned for symbol={symbol}")
-
-        if len(df) < int(limit):
-            logger.warning(
-                "Strict DB parity load for %s returned %d/%d rows. "
-                "This can indicate timestamp mismatch between stock_prices and metrics.",
-                symbol,
-                len(df),
-                int(limit),
-            )
+def window_to_frame(symbol: str, window: dict) -> pd.DataFrame:
+    """Wrap the column arrays from dataset_service.get_prediction_window for the model pipeline."""
+    times = window.get('time')
+    features = window.get('features')
+    if times is None or features is None or len(times) == 0:
+        raise ValueError(f"No rows returned for symbol={symbol}")
+    if features.shape != (len(times), len(FEATURE_SCHEMA)):
+        raise ValueError(
+            f"Prediction window shape mismatch: expected ({len(times)}, {len(FEATURE_SCHEMA)}), got {features.shape}"
+        )
 
-        norm_df = normalize_features(df)
-        assert_sequence_integrity(norm_df, seq_len=1)
-        return norm_df
+    if len(times) < PREDICTION_FETCH_ROWS:
+        logger.warning(
+            "Strict DB parity load for %s returned %d/%d rows. "
+            "This can indicate timestamp mismatch between stock_prices and metrics.",
+            symbol,
+            len(times),
+            PREDICTION_FETCH_ROWS,
+        )
 
-    except Exception as e:
-        raise RuntimeError(f"Database query failed for strict inference pipeline: {e}") from e
+    stamps = pd.to_datetime(times, utc=True, errors='coerce')
+    if stamps.isna().any() or not stamps.is_monotonic_increasing:
+        df = pd.DataFrame(features, columns=FEATURE_SCHEMA, copy=False)
+        df.insert(0, 'time', times)
+        norm_df = normalize_features(df)
+    else:
+        # Time-sorted DB rows: the NumPy ffill/bfill yields normalize_features' frame without its copies.
+        matrix = fill_forward_backward(np.array(features, dtype=np.float32))
+        norm_df = pd.DataFrame(matrix, columns=FEATURE_SCHEMA, copy=False)
+        norm_df.insert(0, 'time', stamps)
+    assert_sequence_integrity(norm_df, seq_len=1)
+    return norm_df
 
 # ────────────────────────────────────────────────────────────
 # Prediction Triggers
 # ────────────────────────────────────────────────────────────
-def predict_future_prices(symbol: str, historical_data: list):
+def build_prediction_points(pred_df: pd.DataFrame, last_date_val, last_close: float) -> list:
+    """Turns the predicted OHLC frame into sanitised PredictionPoint dicts on trading days."""
+    if isinstance(last_date_val, str):
+        try:
+            curr_date = datetime.fromisoformat(last_date_val.replace('Z', '+00:00')).replace(tzinfo=None)
+        except ValueError:
+            curr_date = datetime.now()
+    else:
+        curr_date = last_date_val if pd.notnull(last_date_val) else datetime.now()
+        
+    predictions = []
+    d = curr_date
+    prev_close = last_close
+    for _, row in pred_df.iterrows():
+        d += timedelta(days=1)
+        if d.weekday() >= 5: # Skip weekends
+            d += timedelta(days=2)
+
+        close_v = float(row.get('close', prev_close))
+        if not np.isfinite(close_v) or close_v <= 0:
+            close_v = max(0.01, prev_close)
+
+        open_v = float(row.get('open', prev_close))
+        if not np.isfinite(open_v) or open_v <= 0:
+            open_v = prev_close
+
+        high_v = float(row.get('high', max(open_v, close_v)))
+        low_v = float(row.get('low', min(open_v, close_v)))
+
+        if not np.isfinite(high_v) or high_v <= 0:
+            high_v = max(open_v, close_v)
+        if not np.isfinite(low_v) or low_v <= 0:
+            low_v = min(open_v, close_v)
+
+        high_v = max(high_v, open_v, close_v)
+        low_v = max(0.01, min(low_v, open_v, close_v))
+            
+        predictions.append({
+            "date": d.isoformat() + 'Z',
+            "open": float(open_v),
+            "high": float(high_v),
+            "low": float(low_v),
+            "close": float(close_v)
+        })
+        prev_close = close_v
+    return predictions
+
+
+def predict_future_prices(symbol: str, window: dict):
     meta = load_metadata()
     if not meta['features'] or not meta['scaler_X'] or not meta['scaler_Y']:
         return {"available": False, "message": "ML Pipeline missing trained scalers/metadata in the output_model folder."}
@@ -162,9 +297,8 @@ def predict_future_prices(symbol: str, historical_data: list):
     except Exception as e:
         return {"available": False, "message": f"Feature schema validation failed: {e}"}
 
-    # Extends limit bounds slightly to allow localized rolling features to populate.
     try:
-        df = fetch_stock_data(symbol, LOOKBACK_WINDOW + 50, historical_data)
+        df = window_to_frame(symbol, window)
     except Exception as e:
         return {"available": False, "message": f"Strict DB load failed: {e}"}
 
@@ -178,14 +312,18 @@ def predict_future_prices(symbol: str, historical_data: list):
     sym_id = meta['symbol_mapping'][symbol]
 
     window_df = df.tail(LOOKBACK_WINDOW).copy()
+    model_features = window.get('model_features')
     anomaly_message = None
     log_input_stats(window_df, prefix="Input stats (raw)")
     try:
-        model_window_df = to_model_feature_frame(window_df)
-        log_input_stats(model_window_df, prefix="Input stats (model contract)")
-
-        x_window = model_window_df[FEATURE_SCHEMA].to_numpy(dtype=np.float32)
-        x_scaled = meta['scaler_X'].transform(x_window)
+        x_vectors, y_vectors = scaler_vectors(meta['scaler_X']), scaler_vectors(meta['scaler_Y'])
+        if model_features is None:
+            # Database rows: training's contract and scalers, built in one float32 buffer.
+            x_scaled = prepare_model_input(window['features'], LOOKBACK_WINDOW, x_vectors, y_vectors)
+        else:
+            x_scaled = standardize_model_input(
+                np.array(model_features[-LOOKBACK_WINDOW:], dtype=np.float32), x_vectors, y_vectors
+            )
         scaled_stats = {
             'mean': float(np.mean(x_scaled)),
             'std': float(np.std(x_scaled)),
@@ -223,16 +361,18 @@ def predict_future_prices(symbol: str, historical_data: list):
     logger.info(f"[DEBUG] Executing Inference using external train.predict()")
     logger.info(f"[DEBUG] Binding configuration: Symbol ID {sym_id} / Regime ID {regime_id}")
 
-    # 3. Load Model
+    # 3. Load Model (shared-encoder checkpoint preferred when deployed)
     num_targets = meta['scaler_Y'].scale_.shape[0]
     try:
-        model = get_model(len(meta['symbol_mapping']), len(features), num_targets)
+        multi_model = get_multi_horizon_model(len(meta['symbol_mapping']), len(features), num_targets)
+        model = multi_model or get_model(len(meta['symbol_mapping']), len(features), num_targets)
     except Exception as e:
         return {"available": False, "message": f"Model load failed: {e}"}
     
     # 4. Execute predict from train.py
+    predict_fn = predict_multi_horizon if multi_model is not None else predict
     try:
-        pred_df = predict(
+        pred_out = predict_fn(
             df, 
             symbol_id=sym_id, 
             regime_id=regime_id,
@@ -240,62 +380,33 @@ def predict_future_prices(symbol: str, historical_data: list):
             scaler_X=meta['scaler_X'], 
             scaler_Y=meta['scaler_Y'],
             feature_names=FEATURE_SCHEMA,
-            device=device
+            device=device,
+            model_input=x_scaled,
         )
     except Exception as e:
         logger.error(f"Prediction execution failed: {e}")
         return {"available": False, "message": f"Prediction execution failed: {str(e)}"}
-        
-    last_date_val = df['time'].iloc[-1]
-    if isinstance(last_date_val, str):
-        try:
-            curr_date = datetime.fromisoformat(last_date_val.replace('Z', '+00:00')).replace(tzinfo=None)
-        except ValueError:
-            curr_date = datetime.now()
-    else:
-        curr_date = last_date_val if pd.notnull(last_date_val) else datetime.now()
-        
-    predictions = []
-    d = curr_date
-    prev_close = float(df['close'].iloc[-1])
-    for _, row in pred_df.iterrows():
-        d += timedelta(days=1)
-        if d.weekday() >= 5: # Skip weekends
-            d += timedelta(days=2)
-
-        close_v = float(row.get('close', prev_close))
-        if not np.isfinite(close_v) or close_v <= 0:
-            close_v = max(0.01, prev_close)
 
-        open_v = float(row.get('open', prev_close))
-        if not np.isfinite(open_v) or open_v <= 0:
-            open_v = prev_close
-
-        high_v = float(row.get('high', max(open_v, close_v)))
-        low_v = float(row.get('low', min(open_v, close_v)))
-
-        if not np.isfinite(high_v) or high_v <= 0:
-            high_v = max(open_v, close_v)
-        if not np.isfinite(low_v) or low_v <= 0:
-            low_v = min(open_v, close_v)
+    last_time, last_close = df['time'].iloc[-1], float(df['close'].iloc[-1])
+    if multi_model is not None:
+        horizon_points = {
+            f"{h}d": build_prediction_points(frame, last_time, last_close)
+            for h, frame in pred_out.items()
+        }
+        predictions = horizon_points[f"{PYTORCH_FORECAST_DAYS}d"]
+        model_used = f"MultiHorizon Seq2Seq ({'/'.join(horizon_points)})"
+    else:
+        horizon_points = None
+        predictions = build_prediction_points(pred_out, last_time, last_close)
+        model_used = f"MultiMetric Seq2Seq ({PYTORCH_FORECAST_DAYS}D)"
 
-        high_v = max(high_v, open_v, close_v)
-        low_v = max(0.01, min(low_v, open_v, close_v))
-            
-        predictions.append({
-            "date": d.isoformat() + 'Z',
-            "open": float(open_v),
-            "high": float(high_v),
-            "low": float(low_v),
-            "close": float(close_v)
-        })
-        prev_close = close_v
-        
     response = {
         "available": True,
-        "model_used": f"MultiMetric Seq2Seq ({PYTORCH_FORECAST_DAYS}D)",
+        "model_used": model_used,
         "predictions": predictions
     }
+    if horizon_points:
+        response["horizons"] = horizon_points
     if anomaly_message:
         response["message"] = anomaly_message
 
@@ -305,12 +416,17 @@ def predict_future_prices(symbol: str, historical_data: list):
 # ────────────────────────────────────────────────────────────
 # Prediction Aggregator (PyTorch 7d)
 # ────────────────────────────────────────────────────────────
-def predict_ensemble(symbol: str, historical_data: list) -> dict:
-    if not historical_data or len(historical_data) < LOOKBACK_WINDOW:
+def predict_ensemble(symbol: str, window: dict) -> dict:
+    """
+    window: column arrays from dataset_service.get_prediction_window (or
+    feature_store.prediction_window), fetched once with PREDICTION_FETCH_ROWS
+    and shared by the length check and the model.
+    """
+    if not window or len(window['time']) < LOOKBACK_WINDOW:
         return {"available": False, "message": f"Dataset constraint: model requires {LOOKBACK_WINDOW} days of localized data."}
 
     try:
-        torch_result = predict_future_prices(symbol, historical_data)
+        torch_result = predict_future_prices(symbol, window)
     except Exception as e:
         logger.warning(f"PyTorch {PYTORCH_FORECAST_DAYS}D failed for {symbol}: {e}")
         torch_result = {"available": False, "message": str(e)}
@@ -321,7 +437,9 @@ def predict_ensemble(symbol: str, historical_data: list) -> dict:
             "message": torch_result.get("message") or "No prediction model available. Validation failed on dataset components."
         }
 
-    last_close = float(historical_data[-1].get("close", 0))
+    last_close = float(window['features'][-1, FEATURE_SCHEMA.index('close')])
+    if not np.isfinite(last_close):
+        last_close = 0.0
     trend = "neutral"
     if torch_result.get("predictions"):
         end_7d = torch_result["predictions"][-1]["close"]
@@ -347,4 +465,5 @@ def predict_ensemble(symbol: str, historical_data: list) -> dict:
         "trend": trend,
         "confidence": None,
         "predictions": torch_result.get("predictions"),
+        "horizons": torch_result.get("horizons"),
     }
\ No newline at end of file
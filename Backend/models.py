@@ -54,6 +54,8 @@ class PredictionResponse(BaseModel):
     confidence: Optional[float] = None
     top_features: Optional[List[Dict[str, Any]]] = None
     predictions: Optional[List[PredictionPoint]] = None
+    # Populated when a shared-encoder checkpoint serves every horizon, e.g. {"7d": [...], "30d": [...]}
+    horizons: Optional[Dict[str, List[PredictionPoint]]] = None
 
 class CompareRequest(BaseModel):
     symbols: List[str] = Field(..., max_items=3, min_items=1)
@@ -0,0 +1,280 @@
+"""
+TARGETED SYMBOL REBUILD
+=======================
+Replaces the history of a few symbols (split / dividend adjustment, a bad
+fetch) without the full Scraper/data.py refetch -> metrics.py -> TRUNCATE
+reload.  For the selected symbols only:
+
+  1. their new OHLCV history is read from --prices (e.g. a data.py re-fetch
+     of just those symbols; other symbols in the file are ignored)
+  2. indicators come from indicator_engine.calculate_indicators, with the
+     metrics-table cleanup (inf/NaN -> 0, 4 decimals), i.e. the same rows a
+     full metrics.py build would produce for them
+  3. one transaction: their stock_prices / metrics rows are deleted and the
+     new ones COPYed in
+  4. their Redis keys (summary / price / indicator / prediction) are deleted
+     and the symbols are published on CACHE_INVALIDATION_CHANNEL, so API
+     workers drop their in-process custom-indicator price arrays and stop
+     serving them from the feature store
+
+Symbol selection: --symbols A,B, or --detect: every symbol in --prices whose
+history (time + OHLCV) hashes differently from its rows in the database.
+
+The container entrypoint reloads the CSVs on every start, so --data_dir also
+rewrites stock_prices.csv / metrics.csv there (the
+symbols' blocks are replaced, everything else is copied through).  A feature
+store (feature_store.py) is per data version; with FEATURE_STORE_DIR set it
+is rebuilt from the patched CSVs and CURRENT re-pointed, after which workers
+serve those symbols from it again.
+
+How to Run:
+-----------
+# Known symbols
+python rebuild_symbols.py --prices refetched.csv --symbols VNM,HPG --data_dir /app
+
+# Whatever changed in a re-fetch
+python rebuild_symbols.py --prices stock_prices_new.csv --detect --dry_run
+"""
+
+import io
+import os
+import json
+import time
+import hashlib
+import argparse
+import logging
+
+import numpy as np
+import pandas as pd
+
+import feature_store
+from indicator_engine import INDICATOR_COLUMNS, calculate_indicators
+from indicator_stream import finalize_metrics_rows, read_bars
+
+logger = logging.getLogger(__name__)
+
+PRICE_TABLE_COLUMNS = ['time', 'symbol', 'open', 'high', 'low', 'close', 'volume']
+METRIC_TABLE_COLUMNS = ['time', 'symbol'] + INDICATOR_COLUMNS
+CACHE_KEY_PATTERNS = ("summary:{symbol}", "price:{symbol}:*", "indicator:{symbol}:*", "prediction:{symbol}:*")
+CSV_CHUNK_ROWS = 500_000
+HASH_DECIMALS = 6
+
+
+# ============================================================
+# 1. Pure computations
+# ============================================================
+def _canonical(prices: pd.DataFrame) -> pd.DataFrame:
+    out = prices[PRICE_TABLE_COLUMNS].copy()
+    out['time'] = pd.to_datetime(out['time'])
+    for col in PRICE_TABLE_COLUMNS[2:]:
+        out[col] = pd.to_numeric(out[col], errors='coerce').astype(np.float64)
+    return out.sort_values(['symbol', 'time'], kind='stable').reset_index(drop=True)
+
+
+def table_prices(prices: pd.DataFrame) -> pd.DataFrame:
+    """stock_prices column order, volume as integers (the column is BIGINT)."""
+    out = prices[PRICE_TABLE_COLUMNS].copy()
+    out['volume'] = pd.to_numeric(out['volume'], errors='coerce').round().astype('Int64')
+    return out
+
+
+def history_hashes(prices: pd.DataFrame) -> dict:
+    """
+    {symbol: sha256 of its time-sorted time + OHLCV values}.  Values are
+    rounded to HASH_DECIMALS first, so the CSV text and the database's parse
+    of it hash equally despite last-digit float differences.
+    """
+    prices = _canonical(prices)
+    times = prices['time'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+    values = np.round(prices[PRICE_TABLE_COLUMNS[2:]].to_numpy(), HASH_DECIMALS) + 0.0  # -0.0 -> 0.0
+    values = np.where(np.isnan(values), np.nan, values)  # one NaN bit pattern
+    symbols = prices['symbol'].to_numpy()
+    starts = np.flatnonzero(np.r_[True, symbols[1:] != symbols[:-1]])
+    stops = np.r_[starts[1:], len(symbols)]
+    hashes = {}
+    for lo, hi in zip(starts, stops):
+        digest = hashlib.sha256(times[lo:hi].tobytes())
+        digest.update(np.ascontiguousarray(values[lo:hi]).tobytes())
+        hashes[symbols[lo]] = digest.hexdigest()
+    return hashes
+
+
+def compute_symbol_metrics(prices: pd.DataFrame) -> pd.DataFrame:
+    """metrics-table rows (time, symbol, INDICATOR_COLUMNS) for the given symbols' full histories."""
+    raw = calculate_indicators(prices)
+    return finalize_metrics_rows(raw[METRIC_TABLE_COLUMNS])
+
+
+# ============================================================
+# 2. Database
+# ============================================================
+def load_db_prices(conn, symbols) -> pd.DataFrame:
+    with conn.cursor() as cur:
+        cur.execute(
+            'SELECT "time", symbol, open, high, low, close, volume FROM stock_prices '
+            'WHERE symbol = ANY(%(syms)s) ORDER BY symbol, "time"',
+            {'syms': list(symbols)},
+        )
+        rows = cur.fetchall()
+    return pd.DataFrame(rows, columns=PRICE_TABLE_COLUMNS)
+
+
+def _copy_rows(cur, table: str, frame: pd.DataFrame):
+    buf = io.StringIO()
+    frame.to_csv(buf, index=False, header=False)
+    buf.seek(0)
+    columns = ', '.join(f'"{c.lower()}"' for c in frame.columns)
+    cur.copy_expert(f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)", buf)
+
+
+def replace_symbol_rows(conn, symbols, prices: pd.DataFrame, metrics: pd.DataFrame):
+    """Delete + COPY the symbols' stock_prices / metrics rows (caller commits)."""
+    with conn.cursor() as cur:
+        cur.execute('DELETE FROM stock_prices WHERE symbol = ANY(%(syms)s)', {'syms': list(symbols)})
+        cur.execute('DELETE FROM metrics WHERE symbol = ANY(%(syms)s)', {'syms': list(symbols)})
+        _copy_rows(cur, 'stock_prices', table_prices(prices))
+        _copy_rows(cur, 'metrics', metrics[METRIC_TABLE_COLUMNS])
+
+
+def invalidate_caches(symbols) -> int:
+    """Delete the symbols' Redis keys and tell API workers to drop their in-process copies."""
+    import redis
+    from database import REDIS_URL, CACHE_INVALIDATION_CHANNEL
+
+    client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+    deleted = 0
+    for symbol in symbols:
+        for pattern in CACHE_KEY_PATTERNS:
+            keys = list(client.scan_iter(match=pattern.format(symbol=symbol), count=1000))
+            if keys:
+                deleted += client.delete(*keys)
+    client.publish(CACHE_INVALIDATION_CHANNEL, json.dumps(list(symbols)))
+    return deleted
+
+
+# ============================================================
+# 3. CSV copies reloaded by the entrypoint
+# ============================================================
+def patch_symbol_csv(path: str, symbols, new_rows: pd.DataFrame, chunk_rows: int = CSV_CHUNK_ROWS):
+    """
+    Rewrite ``path`` without the symbols' rows and with ``new_rows`` appended
+    (one block per symbol, so a symbol-contiguous file stays contiguous for
+    metrics.py --stream).  Atomic: tmp file + rename.
+    """
+    tmp_path = path + '.tmp'
+    symbols = set(symbols)
+    try:
+        header = None
+        for i, chunk in enumerate(pd.read_csv(path, chunksize=chunk_rows, dtype=str, keep_default_na=False)):
+            header = list(chunk.columns)
+            chunk[~chunk['symbol'].isin(symbols)].to_csv(tmp_path, mode='w' if i == 0 else 'a',
+                                                         header=i == 0, index=False)
+        if header is None:
+            raise ValueError(f"{path} is empty")
+        new_rows[header].to_csv(tmp_path, mode='a', header=False, index=False)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+
+
+# ============================================================
+# 4. Driver
+# ============================================================
+def rebuild_symbols(prices: pd.DataFrame, symbols=None, detect: bool = False,
+                    data_dir: str = None, dry_run: bool = False) -> dict:
+    from database import sync_engine
+
+    timings = {}
+    t0 = time.perf_counter()
+    prices = prices[PRICE_TABLE_COLUMNS]
+    available = set(prices['symbol'].unique())
+    if symbols:
+        missing = sorted(set(symbols) - available)
+        if missing:
+            raise ValueError(f"--prices has no rows for: {missing}")
+        candidates = sorted(set(symbols))
+    else:
+        candidates = sorted(available)
+
+    conn = sync_engine.raw_connection()
+    try:
+        old = load_db_prices(conn, candidates)
+        timings['load_db'] = time.perf_counter() - t0
+        if detect:
+            old_hashes = history_hashes(old) if len(old) else {}
+            new_hashes = history_hashes(prices[prices['symbol'].isin(candidates)])
+            candidates = [s for s in candidates if old_hashes.get(s) != new_hashes[s]]
+        report = {'symbols': candidates, 'timings': timings}
+        if not candidates:
+            logger.info("No symbol histories changed.")
+            return report
+
+        new = prices[prices['symbol'].isin(candidates)].reset_index(drop=True)
+        t = time.perf_counter()
+        metrics = compute_symbol_metrics(new)
+        timings['indicators'] = time.perf_counter() - t
+        report.update(price_rows=int(len(new)), metric_rows=int(len(metrics)))
+        if dry_run:
+            conn.rollback()
+            return report
+
+        t = time.perf_counter()
+        replace_symbol_rows(conn, candidates, new, metrics)
+        conn.commit()
+        timings['database'] = time.perf_counter() - t
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    t = time.perf_counter()
+    report['cache_keys_deleted'] = invalidate_caches(candidates)
+    timings['caches'] = time.perf_counter() - t
+
+    if data_dir:
+        t = time.perf_counter()
+        patch_symbol_csv(os.path.join(data_dir, 'stock_prices.csv'), candidates, table_prices(new))
+        patch_symbol_csv(os.path.join(data_dir, 'metrics.csv'), candidates, metrics)
+        timings['csv'] = time.perf_counter() - t
+        if feature_store.FEATURE_STORE_DIR:
+            t = time.perf_counter()
+            store = feature_store.load_or_build(feature_store.FEATURE_STORE_DIR,
+                                                os.path.join(data_dir, 'metrics.csv'),
+                                                os.path.join(data_dir, 'stock_prices.csv'))
+            report['feature_store_version'] = store.version
+            timings['feature_store'] = time.perf_counter() - t
+    elif feature_store.FEATURE_STORE_DIR:
+        logger.warning("No --data_dir: the feature store keeps the old rows; API workers read these "
+                       "symbols from the database until it is rebuilt from corrected CSVs.")
+    timings['total'] = time.perf_counter() - t0
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild prices / metrics / caches for a few symbols")
+    parser.add_argument("--prices",   type=str, required=True,
+                        help="OHLCV CSV holding the corrected full histories")
+    parser.add_argument("--symbols",  type=str, default=None,
+                        help="Comma-separated symbols to rebuild (default: every symbol in --prices)")
+    parser.add_argument("--detect",   action="store_true",
+                        help="Only rebuild symbols whose history hash differs from the database")
+    parser.add_argument("--data_dir", type=str, default=None,
+                        help="Also patch stock_prices.csv / metrics.csv in this directory")
+    parser.add_argument("--dry_run",  action="store_true",
+                        help="Compute and report, write nothing")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    np.seterr(divide='ignore', invalid='ignore')
+
+    symbols = [s.strip() for s in args.symbols.split(',') if s.strip()] if args.symbols else None
+    report = rebuild_symbols(read_bars(args.prices), symbols=symbols, detect=args.detect,
+                             data_dir=args.data_dir, dry_run=args.dry_run)
+    print(json.dumps(report, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,169 @@
 import os
 import json
 import time
+import asyncio
 from collections import deque
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from pydantic import ValidationError
 import socketio
 
 import dataset_service 
-from database import redis_client, init_db_indexes
+import custom_indicators
+import feature_store
+from database import redis_client, init_db_indexes, CACHE_INVALIDATION_CHANNEL
 from models import ExplainPredictionRequest, build_envelope, SummaryResponse, PredictionResponse, CompareRequest
 from tasks import generate_prediction_explanation, process_ai_chat, clear_user_memory
-from ml_model import predict_ensemble
+from ml_model import predict_ensemble, get_checkpoint_fingerprint, PREDICTION_FETCH_ROWS, PYTORCH_FORECAST_DAYS
 
 # --- GLOBAL TRACKING STATE ---
 BOOT_TIME = time.time()
 ACTIVE_USERS = set()
 REQUEST_HISTORY = deque(maxlen=2000)
 
+# --- PREDICTION CACHE ---
+# Keys embed the last bar timestamp and the checkpoint fingerprint, so a new
+# bar or a new deployment misses automatically; stale keys simply expire.
+PREDICTION_CACHE_TTL = 86400 # TTL: 24 hours
+PREDICTION_DEMAND_KEY = "prediction:demand"
+PREDICTION_WARM_TOP_N = int(os.getenv("PREDICTION_WARM_TOP_N", "20"))
+# Re-warm period: a pass costs one index lookup + EXISTS per top symbol and only
+# recomputes symbols whose newest bar moved, so it picks up ingests cheaply.
+PREDICTION_WARM_INTERVAL = int(os.getenv("PREDICTION_WARM_INTERVAL", "300"))
+
+# --- SPECULATIVE PREDICTION PREFETCH ---
+# Opening a stock hits /summary and /price first; the forecast is computed in the
+# background so /prediction finds it cached. One job per symbol (Redis NX lock,
+# shared across workers) and a small semaphore keep it below user traffic.
+PREFETCH_LOCK_TTL = 300 # TTL: 5 minutes (also debounces repeated views)
+PREFETCH_STATS_KEY = "prediction:prefetch:stats"
+PREFETCH_SLOTS = asyncio.Semaphore(int(os.getenv("PREDICTION_PREFETCH_CONCURRENCY", "1")))
+PREFETCH_TASKS = set()
+PREFETCH_INFLIGHT = {}
+
 # --- SETUP FASTAPI & ASGI SOCKET.IO ---
 REDIS_URL = os.getenv("REDIS_URL", "redis://redis:26379/0")
 mgr = socketio.AsyncRedisManager(REDIS_URL)
 sio = socketio.AsyncServer(async_mode='asgi', client_manager=mgr, cors_allowed_origins='*')
 
+async def prediction_cache_key(symbol: str, last_bar):
+    """Cache key for `symbol` at its newest bar `last_bar` (get_latest_bar_time), or None."""
+    if last_bar is None:
+        return None
+    fingerprint = await run_in_threadpool(get_checkpoint_fingerprint)
+    store = feature_store.active_store()
+    if store is not None and not feature_store.is_invalidated(symbol):
+        # Windows come from the feature store: a rebuilt store must miss too.
+        fingerprint = f"{fingerprint}:{store.version}"
+    return f"prediction:{symbol}:{PYTORCH_FORECAST_DAYS}d:{last_bar}:{fingerprint}"
+
+async def compute_prediction(symbol: str, last_bar, cache_key: str = None) -> dict:
+    # Single async fetch of the lookback window as arrays; inference runs off the event loop.
+    # With FEATURE_STORE_DIR set, the window is read by offset from the materialised training rows.
+    window = None
+    if feature_store.active_store() is not None:
+        window = feature_store.prediction_window(symbol, PREDICTION_FETCH_ROWS, last_bar=last_bar)
+    if window is None:
+        window = await dataset_service.get_prediction_window(symbol, PREDICTION_FETCH_ROWS)
+    prediction = await run_in_threadpool(predict_ensemble, symbol, window)
+    if cache_key and prediction.get("available"):
+        await redis_client.setex(cache_key, PREDICTION_CACHE_TTL, json.dumps(prediction))
+    return prediction
+
+async def _prefetch_prediction(symbol: str):
+    try:
+        if not await redis_client.set(f"prediction:prefetch:{symbol}", 1, nx=True, ex=PREFETCH_LOCK_TTL):
+            return
+        last_bar = await dataset_service.get_latest_bar_time(symbol)
+        cache_key = await prediction_cache_key(symbol, last_bar)
+        if cache_key is None or await redis_client.exists(cache_key):
+            return
+
+        await redis_client.hincrby(PREFETCH_STATS_KEY, "enqueued", 1)
+        PREFETCH_INFLIGHT[symbol] = asyncio.current_task()
+        async with PREFETCH_SLOTS:
+            prediction = await compute_prediction(symbol, last_bar, cache_key)
+        if prediction.get("available"):
+            await redis_client.setex(f"{cache_key}:prefetched", PREDICTION_CACHE_TTL, 1)
+            await redis_client.hincrby(PREFETCH_STATS_KEY, "completed", 1)
+    except Exception as e:
+        print(f"[CACHE] Prediction prefetch failed for {symbol}: {e}")
+    finally:
+        PREFETCH_INFLIGHT.pop(symbol, None)
+
+def schedule_prediction_prefetch(symbol: str):
+    """Fire-and-forget; never delays the handler that triggered it."""
+    task = asyncio.create_task(_prefetch_prediction(symbol))
+    PREFETCH_TASKS.add(task)
+    task.add_done_callback(PREFETCH_TASKS.discard)
+
+async def get_prefetch_stats() -> dict:
+    try:
+        raw = await redis_client.hgetall(PREFETCH_STATS_KEY)
+    except Exception:
+        raw = {}
+    stats = {k: int(raw.get(k, 0)) for k in ("enqueued", "completed", "hits", "late")}
+    stats["hit_rate"] = stats["hits"] / stats["completed"] if stats["completed"] else 0.0
+    return stats
+
+async def warm_prediction_cache(top_n: int = PREDICTION_WARM_TOP_N) -> int:
+    """Precomputes predictions for the most-requested symbols (e.g. after a data load)."""
+    try:
+        symbols = await redis_client.zrevrange(PREDICTION_DEMAND_KEY, 0, max(0, top_n - 1))
+    except Exception as e:
+        print(f"[CACHE] Prediction warm-up skipped, demand ranking unavailable: {e}")
+        return 0
+    warmed = 0
+    for symbol in symbols:
+        try:
+            last_bar = await dataset_service.get_latest_bar_time(symbol)
+            cache_key = await prediction_cache_key(symbol, last_bar)
+            if cache_key is None or await redis_client.exists(cache_key):
+                continue
+            prediction = await compute_prediction(symbol, last_bar, cache_key)
+            warmed += int(bool(prediction.get("available")))
+        except Exception as e:
+            print(f"[CACHE] Prediction warm-up failed for {symbol}: {e}")
+    print(f"[CACHE] Prediction cache warmed for {warmed}/{len(symbols)} top symbols")
+    return warmed
+
+async def keep_prediction_cache_warm(interval: int = PREDICTION_WARM_INTERVAL):
+    """Warms at startup (the entrypoint has just reloaded the data), then every `interval` s."""
+    while True:
+        await warm_prediction_cache()
+        await asyncio.sleep(interval)
+
+async def listen_cache_invalidations():
+    """Drops this worker's in-process caches and feature-store windows for symbols rewritten by rebuild_symbols.py."""
+    while True:
+        try:
+            pubsub = redis_client.pubsub()
+            await pubsub.subscribe(CACHE_INVALIDATION_CHANNEL)
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                symbols = json.loads(message["data"])
+                for symbol in symbols:
+                    custom_indicators.invalidate_symbol(symbol)
+                feature_store.invalidate_symbols(symbols)
+                print(f"[CACHE] In-process caches invalidated for {', '.join(symbols)}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[CACHE] Invalidation listener error, resubscribing: {e}")
+            await asyncio.sleep(5)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await init_db_indexes()
+    # The entrypoint reloads the dataset right before uvicorn starts, so startup is "after a load".
+    warm_task = asyncio.create_task(keep_prediction_cache_warm())
+    invalidation_task = asyncio.create_task(listen_cache_invalidations())
     yield
+    warm_task.cancel()
+    invalidation_task.cancel()
 
 app = FastAPI(title="HypeStock REST API v4.0", lifespan=lifespan)
 
@@ -68,11 +204,13 @@ async def get_system_status():
         "boot_time": BOOT_TIME,
         "active_users": len(ACTIVE_USERS),
         "total_entries": entries,
-        "request_graph": graph_data
+        "request_graph": graph_data,
+        "prediction_prefetch": await get_prefetch_stats()
     }
 
 @app.get("/stock/{symbol}/summary", response_model=SummaryResponse)
 async def get_summary(symbol: str):
+    schedule_prediction_prefetch(symbol)
     cache_key = f"summary:{symbol}"
     cached = await redis_client.get(cache_key)
     if cached: 
@@ -84,6 +222,7 @@ async def get_summary(symbol: str):
 
 @app.get("/stock/{symbol}/price")
 async def get_price(symbol: str, range: str = Query("1M", regex="^(1M|3M|6M|1Y|3Y|ALL)$")):
+    schedule_prediction_prefetch(symbol)
     cache_key = f"price:{symbol}:{range}"
     cached = await redis_client.get(cache_key)
     if cached: 
@@ -104,15 +243,53 @@ async def get_indicator(symbol: str, type: str = Query(..., description="rsi, ma
     await redis_client.setex(cache_key, 3600, json.dumps(data)) # TTL: 1 hour
     return data
 
+@app.get("/stock/{symbol}/indicator/custom")
+async def get_custom_indicator(
+    symbol: str,
+    kind: str = Query(..., regex=f"^({'|'.join(custom_indicators.CUSTOM_INDICATORS)})$"),
+    window: int = Query(14, ge=1, le=custom_indicators.MAX_CUSTOM_WINDOW),
+    num_std: float = Query(2.0, gt=0, le=10, description="bollinger only"),
+    smooth: int = Query(3, ge=1, le=50, description="stochastic %D window"),
+    range: str = Query("1M", regex="^(1M|3M|6M|1Y|3Y|ALL)$"),
+):
+    # Computed from in-process price arrays; the response bytes are cached in process (LRU).
+    body = await custom_indicators.get_custom_indicator(
+        symbol, kind, range, window=window, num_std=num_std, smooth=smooth
+    )
+    return Response(content=body, media_type="application/json")
+
 @app.get("/stock/{symbol}/prediction", response_model=PredictionResponse)
 async def get_prediction(symbol: str):
     """
     Evaluates the 7D Ensemble against the latest available historical data.
     """
-    # Prediction engine expects at least enough history for Lookback padding (1Y is safe)
-    historical_data = await dataset_service.get_stock_price(symbol, '1Y')
-    prediction = predict_ensemble(symbol, historical_data)
-    return prediction
+    await redis_client.zincrby(PREDICTION_DEMAND_KEY, 1, symbol)
+    last_bar = await dataset_service.get_latest_bar_time(symbol)
+    cache_key = await prediction_cache_key(symbol, last_bar)
+    if cache_key:
+        cached = await redis_client.get(cache_key)
+        if cached:
+            # Count each prefetched entry once, on its first read.
+            if await redis_client.delete(f"{cache_key}:prefetched"):
+                await redis_client.hincrby(PREFETCH_STATS_KEY, "hits", 1)
+            return json.loads(cached)
+
+    inflight = PREFETCH_INFLIGHT.get(symbol)
+    if inflight is not None and cache_key:
+        # Join the running prefetch instead of duplicating inference.
+        await redis_client.hincrby(PREFETCH_STATS_KEY, "late", 1)
+        await asyncio.shield(inflight)
+        cached = await redis_client.get(cache_key)
+        if cached:
+            await redis_client.delete(f"{cache_key}:prefetched")
+            return json.loads(cached)
+
+    return await compute_prediction(symbol, last_bar, cache_key)
+
+@app.post("/system/prediction-cache/warm")
+async def warm_predictions(top_n: int = Query(PREDICTION_WARM_TOP_N, ge=1, le=500)):
+    warmed = await warm_prediction_cache(top_n)
+    return {"warmed": warmed}
 
 @app.get("/stock/search")
 async def search_stocks_rest(query: str = ""):
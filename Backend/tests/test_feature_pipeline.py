@@ -0,0 +1,94 @@
+"""
+Served model input vs training X.
+
+Synthetic bars (train.create_dummy_dataset_if_missing) get their metrics from
+the scraper's indicator engine and are written as the CSVs the DB is loaded
+from.  Training rows come from train.build_feature_rows on those CSVs; served
+windows are the stock_prices / metrics INNER join ml_model fetches.  For the
+same dates both must give the same scaled matrix, bit for bit: the NumPy
+served path (prepare_model_input) against training's pandas groupby path and
+sklearn scalers.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from feature_pipeline import (
+    FEATURE_SCHEMA,
+    apply_training_scalers,
+    feature_window,
+    prepare_model_input,
+    scaler_vectors,
+)
+from indicator_engine import calculate_indicators
+from ml_model import LOOKBACK_WINDOW, PREDICTION_FETCH_ROWS
+from train import _prepare_inference_window, build_feature_rows, build_scalers, create_dummy_dataset_if_missing
+
+# Window end positions (bar index within a symbol); all clear of the MA50 warm-up.
+WINDOW_ENDS = (200, 401, 599)
+
+
+@pytest.fixture(scope="module")
+def dataset(tmp_path_factory):
+    root = tmp_path_factory.mktemp("data")
+    metrics_path, prices_path = str(root / "metrics.csv"), str(root / "stock_prices.csv")
+    np.random.seed(48)
+    create_dummy_dataset_if_missing(metrics_path, prices_path, str(root / "companies.csv"))
+
+    # Scraper/metrics.py: engine indicators, inf/NaN -> 0, 4 decimals.
+    prices = pd.read_csv(prices_path)
+    metrics = calculate_indicators(prices).drop(columns=["open", "high", "low", "close", "volume"])
+    metrics = metrics.replace([np.inf, -np.inf], np.nan).fillna(0).round(4)
+    metrics.to_csv(metrics_path, index=False)
+
+    rows = build_feature_rows(metrics_path, prices_path)
+    scaler_X, scaler_Y = build_scalers(rows["features"], np.ones(len(rows["features"]), dtype=bool))
+    joined = pd.read_csv(prices_path).merge(pd.read_csv(metrics_path), on=["time", "symbol"], how="inner")
+    return rows, scaler_X, scaler_Y, joined
+
+
+def training_window(rows, scaler_X, scaler_Y, symbol, end):
+    sel = np.flatnonzero(rows["symbol"] == symbol)[end - LOOKBACK_WINDOW + 1:end + 1]
+    return rows["time"][sel], apply_training_scalers(rows["features"][sel], scaler_X, scaler_Y)
+
+
+def served_frame(joined, symbol, end):
+    bars = joined[joined["symbol"] == symbol].sort_values("time").iloc[:end + 1]
+    return bars.tail(PREDICTION_FETCH_ROWS)
+
+
+@pytest.fixture(scope="module")
+def model_buffer():
+    # One buffer for every case, as a caller reusing it across requests would.
+    return np.full((PREDICTION_FETCH_ROWS, len(FEATURE_SCHEMA)), np.nan, dtype=np.float32)
+
+
+@pytest.mark.parametrize("symbol", ["AAPL", "MSFT", "GOOG"])
+@pytest.mark.parametrize("end", WINDOW_ENDS)
+def test_database_window_matches_training_rows(dataset, model_buffer, symbol, end):
+    rows, scaler_X, scaler_Y, joined = dataset
+    times, expected = training_window(rows, scaler_X, scaler_Y, symbol, end)
+
+    # ml_model.predict_future_prices on a get_prediction_window result.
+    window = feature_window(served_frame(joined, symbol, end))
+    raw = window["features"].copy()
+    actual = prepare_model_input(
+        window["features"], LOOKBACK_WINDOW, scaler_vectors(scaler_X), scaler_vectors(scaler_Y), out=model_buffer
+    )
+
+    np.testing.assert_array_equal(window["time"][-LOOKBACK_WINDOW:], times)
+    np.testing.assert_array_equal(actual, expected)
+    assert np.shares_memory(actual, model_buffer)
+    np.testing.assert_array_equal(window["features"], raw)
+
+
+@pytest.mark.parametrize("end", WINDOW_ENDS)
+def test_predict_history_matches_training_rows(dataset, end):
+    rows, scaler_X, scaler_Y, joined = dataset
+    _, expected = training_window(rows, scaler_X, scaler_Y, "MSFT", end)
+
+    # train.predict() on a DataFrame history, with the shuffled rows it has to sort itself.
+    history = served_frame(joined, "MSFT", end).sample(frac=1.0, random_state=0)
+    actual = _prepare_inference_window(history, scaler_X, FEATURE_SCHEMA, LOOKBACK_WINDOW, scaler_Y=scaler_Y)[3]
+
+    np.testing.assert_array_equal(actual, expected)
@@ -44,6 +44,40 @@ v5 MEMORY & THROUGHPUT REFACTOR
 
   PRED-2  Curvature guard threshold 0.005 (was 0.02) for realistic turns.
 
+  RAM-6  Columnar dataset cache: --cache_dir stores the preprocessed
+         float32 arrays as .npy (+ scalers, meta.json keyed by schema
+         hash and source-file sha256).  Later runs memory-map them and
+         skip CSV parsing, merging, normalisation and scaler fitting.
+         --finetune_from re-applies the reference scalers, so it caches
+         the unscaled rows instead (<cache_dir>/finetune_rows/).
+
+  RAM-7  Memory-mapped shared tensors: the flat arrays are views over
+         .npy memory maps (cache entry, or a spill dir when workers > 0
+         and no --cache_dir).  TemporalBatchCollator pickles only the
+         directory, so spawn workers re-map the files instead of copying.
+
+  RAM-8  Feature store: --feature_store materialises the preprocessed,
+         unscaled rows once per data version (feature_store.py, keyed by
+         schema hash + source sha256).  Training memory-maps them and only
+         fits the split / regimes / scalers; the API reads prediction
+         windows from the same files.
+
+  DIST-1  --ddp_cpu N: N gloo DistributedDataParallel ranks per node
+          (--ddp_nnodes/--ddp_node_rank + MASTER_ADDR/PORT for more
+          nodes).  DistributedSampler shards each stage; validation,
+          checkpoints and logs happen on rank 0 only.
+
+  CKPT-1  Resumable training: model + AdamW + LambdaLR + GradScaler +
+          stage/epoch/batch cursor + RNG are written atomically by a
+          background thread every --checkpoint_every batches and at
+          epoch/stage ends; --resume continues exactly there.
+
+  TUNE-1  Incremental fine-tuning: --finetune_from output_model/ reuses
+          that model's checkpoints, scalers and symbol ids (no refit),
+          trains a few low-LR epochs on only the windows whose targets
+          include bars after data_range.json's last_date, and promotes
+          the result only if a recent holdout loss does not regress.
+
   DIAG-1  All diagnostics operate on per-sequence statistics (no blind
           full-flatten). Logged every 200 steps, not every batch.
 
@@ -62,14 +96,21 @@ python train.py \
     --epochs_per_stage 20 \
     --learning_rate 0.0005 \
     --device cuda \
-    --mixed_precision true
+    --mixed_precision true \
+    --cache_dir cache/dataset
 
 Output structure:
   output_model/
     scaler_X.pkl, scaler_Y.pkl, features.json, symbol_mapping.json
+    data_range.json      -- last bar date trained on (--finetune_from)
     7d/best_model.pth    -- 1-week predictor
     14d/best_model.pth   -- 2-week predictor
     30d/best_model.pth   -- 30-day predictor
+    multi/best_model.pth, multi/horizons.json
+                         -- --shared_encoder: one model for all horizons
+    multi/{h}d/best_model.pth
+                         -- the same weights per horizon, loadable as the
+                            {h}d/ checkpoints above (never written over them)
 """
 
 import os
@@ -83,6 +124,10 @@ import shutil
 import threading
 import contextlib
 import queue
+import random
+import hashlib
+import inspect
+import tempfile
 from dataclasses import dataclass
 from functools import lru_cache
 from typing import TYPE_CHECKING
@@ -95,13 +140,19 @@ import numpy as np
 import torch
 import torch.nn as nn
 import torch.optim as optim
-from torch.utils.data import Dataset, DataLoader
+import torch.distributed as dist
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data import Dataset, DataLoader, DistributedSampler, Sampler
+from indicator_engine import dist_from_ma50
 from feature_pipeline import (
     FEATURE_SCHEMA,
     normalize_features,
     assert_sequence_integrity,
     validate_feature_schema,
-    to_model_feature_frame,
+    apply_training_scalers,
+    feature_window,
+    prepare_model_input,
+    scaler_vectors,
 )
 # NOTE: sklearn.preprocessing.StandardScaler is imported inside build_scalers()
 #       to prevent spawn-mode worker processes from loading the full sklearn stack.
@@ -146,13 +197,73 @@ class TemporalAnchorDataset(Dataset):
         return int(self.indices[idx])
 
 
+def symbol_row_layout(sym_ids: np.ndarray):
+    """
+    Per-row (position within its symbol run, length of that run).
+
+    Rows are sorted by (symbol, time), so every symbol is one contiguous run;
+    this replaces the per-symbol np.where scan with a single pass.
+    """
+    sym_ids = np.asarray(sym_ids)
+    n = len(sym_ids)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    starts  = np.flatnonzero(np.r_[True, sym_ids[1:] != sym_ids[:-1]])
+    lengths = np.diff(np.r_[starts, n])
+    row_pos = np.arange(n, dtype=np.int64) - np.repeat(starts, lengths)
+    run_len = np.repeat(lengths, lengths).astype(np.int64)
+    return row_pos, run_len
+
+
+def horizon_valid_indices(row_pos, run_len, lookback, horizon):
+    """Anchors with `lookback` rows of history and `horizon` future rows in the same symbol."""
+    return np.flatnonzero((row_pos >= lookback - 1) & (row_pos < run_len - horizon))
+
+
+class CurriculumStageIndex:
+    """
+    Train anchors ordered once by date rank.
+
+    A stage keeping the most-recent N dates is then a single searchsorted
+    threshold on the sorted ranks (instead of an np.isin over all anchors).
+    Selected anchors are returned in row order, matching the stride sampling
+    of TemporalAnchorDataset.
+    """
+    def __init__(self, train_indices, date_rank):
+        ranks = date_rank[train_indices]
+        order = np.argsort(ranks, kind='stable')
+        self.by_rank     = train_indices[order]
+        self.sorted_rank = ranks[order]
+        is_first = np.r_[True, self.sorted_rank[1:] != self.sorted_rank[:-1]]
+        self.unique_ranks = self.sorted_rank[is_first]
+
+    @property
+    def num_dates(self):
+        return len(self.unique_ranks)
+
+    def select(self, ratio):
+        num_dates = max(1, int(self.num_dates * ratio))
+        if num_dates > self.num_dates:
+            return np.zeros(0, dtype=np.int64)
+        start = np.searchsorted(self.sorted_rank, self.unique_ranks[-num_dates], side='left')
+        return np.sort(self.by_rank[start:])
+
+
 class TemporalBatchCollator:
     """
     Vectorised batch-time slicing using index_select.
 
     This removes per-sample slicing in Python and performs all slicing for a
     batch in a small number of tensor operations.
+
+    When ``array_dir`` is given the base tensors are views over memory-mapped
+    .npy files in that directory.  Pickling (spawn-mode DataLoader workers)
+    then ships only the directory, and each worker re-opens the maps: pages are
+    shared through the OS page cache instead of being copied into every worker.
     """
+    # attribute -> .npy basename written by save_dataset_cache / spill_arrays_to_disk
+    MAPPED_ARRAYS = {'X': 'X', 'Y_ret': 'Y_ret', 'Y_price': 'Y_price', 'sym': 'symbol_id', 'regime': 'regime'}
+
     def __init__(self,
                  X_tensor,
                  sym_tensor,
@@ -161,7 +272,8 @@ class TemporalBatchCollator:
                  Y_price_tensor,
                  last_price_tensor,
                  lookback,
-                 forecast_horizon):
+                 forecast_horizon,
+                 array_dir=None):
         self.X = X_tensor
         self.sym = sym_tensor
         self.regime = regime_tensor
@@ -170,6 +282,7 @@ class TemporalBatchCollator:
         self.last_price = last_price_tensor
         self.lookback = int(lookback)
         self.horizon = int(forecast_horizon)
+        self.array_dir = array_dir
         self.num_features = int(X_tensor.shape[1])
         self.num_targets = int(Y_ret_tensor.shape[1])
         self.lookback_offsets = torch.arange(-self.lookback + 1, 1, dtype=torch.long)
@@ -192,6 +305,83 @@ class TemporalBatchCollator:
         last_price = self.last_price.index_select(0, anchor_idx)
         return x, sym, regime, y_ret, y_price, last_price
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self.array_dir is None:
+            return state
+        state['last_price_is_price'] = self.last_price is self.Y_price
+        for attr in self.MAPPED_ARRAYS:
+            state.pop(attr)
+        if state['last_price_is_price']:
+            state.pop('last_price')
+        return state
+
+    def __setstate__(self, state):
+        last_price_is_price = state.pop('last_price_is_price', False)
+        self.__dict__.update(state)
+        if self.array_dir is None:
+            return
+        maps = open_array_maps(self.array_dir, self.MAPPED_ARRAYS.values())
+        for attr, name in self.MAPPED_ARRAYS.items():
+            setattr(self, attr, torch.from_numpy(maps[name]))
+        if last_price_is_price:
+            self.last_price = self.Y_price
+
+
+class ResumableSampler(Sampler):
+    """
+    Seeded per-epoch shuffle that can start part-way through an epoch.
+
+    The permutation depends only on (seed, epoch), so a resumed run replays the
+    same order and skips the `start` anchors already consumed.  With
+    distributed=True the order comes from a DistributedSampler (same seed on
+    every rank) and `start` is counted within this rank's shard.
+    """
+    def __init__(self, dataset, seed, distributed=False):
+        self.dataset = dataset
+        self.seed = int(seed)
+        self.epoch = 0
+        self.start = 0
+        self.dist_sampler = (
+            DistributedSampler(dataset, shuffle=True, drop_last=True, seed=self.seed)
+            if distributed else None
+        )
+
+    def set_epoch(self, epoch, start=0):
+        self.epoch = int(epoch)
+        self.start = int(start)
+        if self.dist_sampler is not None:
+            self.dist_sampler.set_epoch(self.epoch)
+
+    def _order(self):
+        if self.dist_sampler is not None:
+            return list(self.dist_sampler)
+        g = torch.Generator()
+        g.manual_seed(self.seed + self.epoch)
+        return torch.randperm(len(self.dataset), generator=g).tolist()
+
+    def __iter__(self):
+        return iter(self._order()[self.start:])
+
+    def __len__(self):
+        full = len(self.dist_sampler) if self.dist_sampler is not None else len(self.dataset)
+        return max(0, full - self.start)
+
+
+class HorizonSliceLoader:
+    """Re-yields collated batches with targets cut to the first `horizon` steps."""
+    def __init__(self, loader, horizon):
+        self.loader = loader
+        self.horizon = int(horizon)
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        h = self.horizon
+        for x, sym, regime, y_ret, y_price, last_price in self.loader:
+            yield x, sym, regime, y_ret[:, :h], y_price[:, :h], last_price
+
 
 def _move_batch_to_device(batch, device, non_blocking=True, channels_last=False):
     if torch.is_tensor(batch):
@@ -343,6 +533,28 @@ class StepTiming:
         }
 
 
+class DeviceMetrics:
+    """
+    Named running sums kept as one float64 tensor on the compute device.
+
+    add() only queues tensor ops, so per-batch metrics cost no host sync;
+    read() is the single device->host transfer, once per epoch / log interval.
+    """
+    def __init__(self, device, *names):
+        self.names = names
+        self.sums = torch.zeros(len(names), dtype=torch.float64, device=device)
+
+    def add(self, values, mask=None):
+        """values: 0-d tensors in `names` order; mask (0-d bool) drops the whole row, NaNs included."""
+        row = torch.stack([v.detach() if v.dtype == torch.float32 else v.detach().float() for v in values])
+        if mask is not None:
+            row = row.where(mask, 0.0)
+        self.sums += row
+
+    def read(self):
+        return dict(zip(self.names, self.sums.tolist()))
+
+
 def maybe_build_profiler(enabled, device, log_dir, horizon_name, stage, profile_steps):
     if not enabled:
         return None
@@ -489,8 +701,16 @@ class MultiMetricPredictor(nn.Module):
           If provided (training), uses parallel GRU scan.
           If None (inference), uses autoregressive GRUCell loop.
         """
-        B = x.size(0)
         ctx = self.encode(x, sym_id, regime_id)  # [B, D]
+        return self.decode(ctx, x, teacher_targets=teacher_targets)
+
+    def decode(self, ctx, x, teacher_targets=None, steps=None):
+        """
+        Decoder half of forward(); `x` only supplies the realized-volatility proxy.
+        Decodes teacher_targets.size(1) steps, or `steps` (default forecast_horizon)
+        autoregressively.
+        """
+        B = x.size(0)
 
         if teacher_targets is not None:
             # --- PERF-3: parallel training path ---
@@ -498,7 +718,7 @@ class MultiMetricPredictor(nn.Module):
             # shifted right by 1 (standard seq2seq teacher forcing)
             zero_step = torch.zeros(B, 1, self.num_target_metrics, device=x.device)
             decoder_in_tgt = torch.cat([zero_step, teacher_targets[:, :-1, :]], dim=1)  # [B, H, M]
-            ctx_expanded   = ctx.unsqueeze(1).expand(-1, self.forecast_horizon, -1)      # [B, H, D]
+            ctx_expanded   = ctx.unsqueeze(1).expand(-1, teacher_targets.size(1), -1)   # [B, H, D]
             decoder_in     = torch.cat([decoder_in_tgt, ctx_expanded], dim=-1)           # [B, H, M+D]
 
             h0  = ctx.unsqueeze(0)                               # [1, B, D]
@@ -520,7 +740,7 @@ class MultiMetricPredictor(nn.Module):
             past_returns = x[:, :, 0:1]  # proxy: first feature channel
             realized_vol = torch.std(past_returns, dim=1, keepdim=True).squeeze(1)  # [B, 1]
             preds = []
-            for _ in range(self.forecast_horizon):
+            for _ in range(steps or self.forecast_horizon):
                 gru_in = torch.cat([step, ctx], dim=-1)
                 h      = self.decoder_gru_cell(gru_in, h)
                 mu     = torch.tanh(self.mu_head(h))            # [B, M]
@@ -531,6 +751,49 @@ class MultiMetricPredictor(nn.Module):
                 preds.append(step.unsqueeze(1))
             return torch.cat(preds, dim=1)
 
+
+# Output sub-directory and config file of the shared-encoder checkpoint.
+SHARED_ENCODER_DIR = 'multi'
+SHARED_ENCODER_CONFIG = 'horizons.json'
+
+
+class MultiHorizonPredictor(MultiMetricPredictor):
+    """
+    Shared-encoder variant serving several horizons from one forward pass.
+
+    The GRU decoder is causal, so the first h steps of a max-horizon
+    autoregressive decode are exactly an h-step forecast. One encode plus
+    one max(horizons) decode therefore yields every horizon; shorter ones
+    are prefixes. Parameters are identical to MultiMetricPredictor with
+    forecast_horizon=max(horizons), so checkpoints load into either class.
+    """
+    def __init__(self, num_symbols, num_features, horizons=(7, 14, 30), **kwargs):
+        kwargs.pop('forecast_horizon', None)
+        self.horizons = sorted({int(h) for h in horizons})
+        super().__init__(num_symbols, num_features,
+                         forecast_horizon=self.horizons[-1], **kwargs)
+
+    def forward_horizons(self, x, sym_id, regime_id):
+        """Returns {horizon: [B, horizon, M]} from a single encode + decode."""
+        full = self.forward(x, sym_id, regime_id, teacher_targets=None)
+        return {h: full[:, :h, :] for h in self.horizons}
+
+
+class HorizonPrefix(nn.Module):
+    """
+    A MultiHorizonPredictor seen as an h-step predictor: the first h steps of
+    its decode (teacher forcing on h-step targets, or h autoregressive steps).
+    Shares the model's parameters; used to score each horizon in validation.
+    """
+    def __init__(self, model, horizon):
+        super().__init__()
+        self.model = model
+        self.horizon = int(horizon)
+
+    def forward(self, x, sym_id, regime_id, teacher_targets=None):
+        ctx = self.model.encode(x, sym_id, regime_id)
+        return self.model.decode(ctx, x, teacher_targets=teacher_targets, steps=self.horizon)
+
 # ============================================================
 # 4. Combined Loss
 # ============================================================
@@ -603,6 +866,32 @@ def compute_pattern_guard_losses(pred_returns: torch.Tensor, target_returns: tor
         'variance_penalty': variance_penalty,
     }
 
+
+def compute_forecast_loss(outputs, y_ret, y_price, last_p, criterion, scale_t, mean_t, head_weights):
+    """
+    Weighted sum of CombinedForecastLoss + pattern guards over forecast horizons.
+
+    outputs: [B, H, M] with H = y_ret.size(1); head_weights {h: weight} with
+    h <= H.  The decoder is causal, so horizon h is scored on the first h
+    steps of both (a MultiHorizonPredictor trained on all its horizons).
+    Returns (loss, pred_ret, guard_metrics) where the last two belong to the
+    longest horizon and drive the batch diagnostics.
+    """
+    loss = None
+    for h, weight in sorted(head_weights.items()):
+        pred_ret = outputs[:, :h, :]
+        tgt_ret, tgt_price = y_ret[:, :h, :], y_price[:, :h, :]
+        # Compute curvature per sequence (seq dim=1), then flatten for vol/acf/variance
+        b_sz, h_sz, m_sz = pred_ret.shape
+        pred_returns = pred_ret.reshape(b_sz * h_sz, m_sz).mean(dim=-1)
+        target_returns = tgt_ret.reshape(b_sz * h_sz, m_sz).mean(dim=-1)
+        guard_metrics = compute_pattern_guard_losses(pred_returns, target_returns)
+        pred_price = _reconstruct_prices(pred_ret, last_p, scale_t, mean_t)
+        head_loss = criterion(pred_ret, tgt_ret, pred_price, tgt_price, last_p)
+        head_loss = weight * (head_loss + guard_metrics['total_guard_loss'])
+        loss = head_loss if loss is None else loss + head_loss
+    return loss, pred_ret, guard_metrics
+
 # ============================================================
 # 4b. Regime Multipliers & Confidence Scaling (Sections A–F)
 # ============================================================
@@ -764,14 +1053,17 @@ def evaluate_model(
     channels_last=False,
 ):
     model.eval()
-    total_loss = total_mae = total_mse = total_dir = total_elem = total_n = 0.0
     n_val_batches = 0
-    n_val_skipped = 0
-    pred_ret_sum = pred_ret_sq_sum = pred_price_sum = pred_price_sq_sum = 0.0
-    pred_ret_count = pred_price_count = 0
-    diag_pred_std = diag_vol = diag_curvature = diag_acf1 = 0.0
-    diag_batches = 0
-    smooth_price_warn_count = 0
+    # Finite-loss batches only (masked on device, like the old `continue`).
+    valid = DeviceMetrics(
+        device, 'loss', 'n', 'elem', 'mae', 'mse', 'dir',
+        'ret_sum', 'ret_sq_sum', 'price_sum', 'price_sq_sum',
+    )
+    # Every batch.
+    diag = DeviceMetrics(
+        device, 'pred_std', 'volatility_loss', 'curvature_loss', 'acf1',
+        'smooth_price', 'skipped', 'skipped_pred_nan', 'skipped_price_nan',
+    )
 
     batch_source = CUDAPrefetcher(
         dataloader,
@@ -804,49 +1096,44 @@ def evaluate_model(
                 loss       = criterion(pred_ret, y_ret, pred_price, y_price, last_p)
                 loss       = loss + guard_metrics['total_guard_loss']
 
-            diag_batches += 1
-            diag_pred_std += guard_metrics['pred_std'].detach().item()
-            diag_vol += guard_metrics['volatility_loss'].detach().item()
-            diag_curvature += guard_metrics['curvature_loss'].detach().item()
-            diag_acf1 += guard_metrics['acf1'].detach().item()
-
+            finite = torch.isfinite(loss)
+            skipped = ~finite
             price_vol = torch.std(pred_price.contiguous().view(-1))
             real_price_vol = torch.std(y_price.contiguous().view(-1))
-            if real_price_vol.item() > 0 and price_vol.item() < 0.3 * real_price_vol.item():
-                smooth_price_warn_count += 1
-                if smooth_price_warn_count <= 3:
-                    logger.warning("Predicted price path unrealistically smooth")
-
-            if not torch.isfinite(loss):
-                n_val_skipped += 1
-                if n_val_skipped <= 3:
-                    has_nan_pred = torch.isnan(pred_ret).any().item()
-                    has_nan_price = torch.isnan(pred_price).any().item()
-                    logging.warning(
-                        f"  [DIAG-VAL] Batch {n_val_batches}: loss non-finite "
-                        f"(pred_nan={has_nan_pred}, price_nan={has_nan_price})"
-                    )
-                continue
-
-            pred_ret_sum += pred_ret.sum().item()
-            pred_ret_sq_sum += (pred_ret ** 2).sum().item()
-            pred_ret_count += pred_ret.numel()
-            pred_price_sum += pred_price.sum().item()
-            pred_price_sq_sum += (pred_price ** 2).sum().item()
-            pred_price_count += pred_price.numel()
+            diag.add((
+                guard_metrics['pred_std'],
+                guard_metrics['volatility_loss'],
+                guard_metrics['curvature_loss'],
+                guard_metrics['acf1'],
+                (real_price_vol > 0) & (price_vol < 0.3 * real_price_vol),
+                skipped,
+                skipped & torch.isnan(pred_ret).any(),
+                skipped & torch.isnan(pred_price).any(),
+            ))
 
             B    = x.size(0)
-            elem = B * pred_ret.size(1) * pred_ret.size(2)
-            total_n    += B
-            total_elem += elem
-            total_loss += loss.item() * B
-            total_mae  += torch.sum(torch.abs(pred_ret - y_ret)).item()
-            total_mse  += torch.sum((pred_ret - y_ret) ** 2).item()
-            total_dir  += torch.sum(torch.sign(pred_ret) == torch.sign(y_ret)).float().item()
-
+            elem = pred_ret.numel()
+            valid.add((
+                loss * B,
+                finite * B,
+                finite * elem,
+                torch.sum(torch.abs(pred_ret - y_ret)),
+                torch.sum((pred_ret - y_ret) ** 2),
+                torch.sum(torch.sign(pred_ret) == torch.sign(y_ret)),
+                pred_ret.sum(),
+                (pred_ret ** 2).sum(),
+                pred_price.sum(),
+                (pred_price ** 2).sum(),
+            ), mask=finite)
+
+    v = valid.read()
+    d = diag.read()
+    total_n, total_elem = v['n'], v['elem']
+    n_val_skipped = int(d['skipped'])
     if n_val_skipped > 0:
         logging.warning(
-            f"  [DIAG-VAL] {n_val_skipped}/{n_val_batches} val batches skipped (non-finite loss). "
+            f"  [DIAG-VAL] {n_val_skipped}/{n_val_batches} val batches skipped (non-finite loss; "
+            f"pred_nan in {int(d['skipped_pred_nan'])}, price_nan in {int(d['skipped_price_nan'])}). "
             f"Valid samples: {int(total_n)}"
         )
     if total_n == 0:
@@ -857,28 +1144,27 @@ def evaluate_model(
         return float('inf'), float('nan'), float('nan'), float('nan')
 
     # --- Training diagnostics ---
-    if pred_ret_count > 0:
-        pred_mean = pred_ret_sum / pred_ret_count
-        pred_var = max(pred_ret_sq_sum / pred_ret_count - pred_mean ** 2, 0.0)
-        pred_std = math.sqrt(pred_var)
-        logging.info(
-            f"[DIAG] Predicted return stats | "
-            f"mean={pred_mean:.6f} std={pred_std:.6f}"
+    pred_mean = v['ret_sum'] / total_elem
+    pred_var = max(v['ret_sq_sum'] / total_elem - pred_mean ** 2, 0.0)
+    pred_std = math.sqrt(pred_var)
+    logging.info(
+        f"[DIAG] Predicted return stats | "
+        f"mean={pred_mean:.6f} std={pred_std:.6f}"
+    )
+    if pred_std < 0.005:
+        logging.warning(
+            "[DIAG] Return std < 0.005 — model may be collapsing to flat predictions."
         )
-        if pred_std < 0.005:
-            logging.warning(
-                "[DIAG] Return std < 0.005 — model may be collapsing to flat predictions."
-            )
-        price_mean = pred_price_sum / pred_price_count
-        price_var = max(pred_price_sq_sum / pred_price_count - price_mean ** 2, 0.0)
-        price_std = math.sqrt(price_var)
-        logging.info(f"[DIAG] Price path volatility std={price_std:.6f}")
+    price_mean = v['price_sum'] / total_elem
+    price_var = max(v['price_sq_sum'] / total_elem - price_mean ** 2, 0.0)
+    price_std = math.sqrt(price_var)
+    logging.info(f"[DIAG] Price path volatility std={price_std:.6f}")
 
-    if diag_batches > 0:
-        avg_pred_std = diag_pred_std / diag_batches
-        avg_vol = diag_vol / diag_batches
-        avg_curvature = diag_curvature / diag_batches
-        avg_acf1 = diag_acf1 / diag_batches
+    if n_val_batches > 0:
+        avg_pred_std = d['pred_std'] / n_val_batches
+        avg_vol = d['volatility_loss'] / n_val_batches
+        avg_curvature = d['curvature_loss'] / n_val_batches
+        avg_acf1 = d['acf1'] / n_val_batches
 
         logger.info(
             f"[DIAG] pred_std={avg_pred_std:.6f} "
@@ -896,12 +1182,13 @@ def evaluate_model(
         if avg_curvature < 0.005:
             logger.warning("Linear ramp pattern detected")
 
-    if smooth_price_warn_count > 3:
+    smooth_price_warn_count = int(d['smooth_price'])
+    if smooth_price_warn_count > 0:
         logger.warning(
             f"Predicted price path unrealistically smooth (triggered {smooth_price_warn_count} batches)"
         )
 
-    dir_acc_val = total_dir / max(total_elem, 1)
+    dir_acc_val = v['dir'] / max(total_elem, 1)
     if dir_acc_val < 0.51:
         logging.warning(
             "[DIAG] Directional accuracy near random (\u22480.50). "
@@ -909,9 +1196,9 @@ def evaluate_model(
         )
 
     return (
-        total_loss / max(total_n,    1),
-        total_mae  / max(total_elem, 1),
-        math.sqrt(total_mse / max(total_elem, 1)),
+        v['loss'] / max(total_n,    1),
+        v['mae']  / max(total_elem, 1),
+        math.sqrt(v['mse'] / max(total_elem, 1)),
         dir_acc_val,
     )
 
@@ -930,8 +1217,7 @@ def evaluate_autoregressive(
 ):
     """Autoregressive validation — no teacher forcing, matches real inference."""
     model.eval()
-    total_loss = total_n = 0.0
-    total_mae = total_dir = total_elem = 0.0
+    valid = DeviceMetrics(device, 'loss', 'n', 'elem', 'mae', 'dir')
 
     batch_source = CUDAPrefetcher(
         dataloader,
@@ -960,24 +1246,49 @@ def evaluate_autoregressive(
                 loss       = criterion(pred_ret, y_ret, pred_price, y_price, last_p)
                 loss       = loss + guard_metrics['total_guard_loss']
 
-            if not torch.isfinite(loss):
-                continue
-
+            finite = torch.isfinite(loss)
             B    = x.size(0)
-            elem = B * pred_ret.size(1) * pred_ret.size(2)
-            total_n    += B
-            total_elem += elem
-            total_loss += loss.item() * B
-            total_mae  += torch.sum(torch.abs(pred_ret - y_ret)).item()
-            total_dir  += torch.sum(torch.sign(pred_ret) == torch.sign(y_ret)).float().item()
-
-    if total_n == 0:
+            elem = pred_ret.numel()
+            valid.add((
+                loss * B,
+                finite * B,
+                finite * elem,
+                torch.sum(torch.abs(pred_ret - y_ret)),
+                torch.sum(torch.sign(pred_ret) == torch.sign(y_ret)),
+            ), mask=finite)
+
+    v = valid.read()
+    if v['n'] == 0:
         return float('inf'), float('nan'), float('nan')
 
     return (
-        total_loss / total_n,
-        total_mae  / max(total_elem, 1),
-        total_dir  / max(total_elem, 1),
+        v['loss'] / v['n'],
+        v['mae']  / max(v['elem'], 1),
+        v['dir']  / max(v['elem'], 1),
+    )
+
+
+def evaluate_heads(eval_fn, model, dataloader, criterion, device, use_amp, scale_t, mean_t,
+                   amp_dtype, head_weights=None, tag='', **eval_kwargs):
+    """
+    eval_fn over dataloader.  For a MultiHorizonPredictor trained on several
+    horizons (head_weights given) each horizon's prefix is evaluated on its
+    target slice and the weighted mean returned.
+    """
+    if head_weights is None:
+        return eval_fn(model, dataloader, criterion, device, use_amp,
+                       scale_t, mean_t, amp_dtype, **eval_kwargs)
+    per_head = {
+        h: eval_fn(HorizonPrefix(model, h), HorizonSliceLoader(dataloader, h), criterion, device,
+                   use_amp, scale_t, mean_t, amp_dtype, **eval_kwargs)
+        for h in sorted(head_weights)
+    }
+    logging.info(f"{tag} {eval_fn.__name__} per head | " + " ".join(
+        f"{h}d={vals[0]:.5f}" for h, vals in per_head.items()))
+    total_w = sum(head_weights.values())
+    return tuple(
+        sum(head_weights[h] * vals[i] for h, vals in per_head.items()) / total_w
+        for i in range(len(next(iter(per_head.values()))))
     )
 
 # ============================================================
@@ -1030,11 +1341,422 @@ def _vectorised_preprocess(df: pd.DataFrame, target_cols: list, raw_price_cols:
         elif 'MA50' in df.columns:
             ma50_col = 'MA50'
         if ma50_col is not None:
-            ma50_safe = df[ma50_col].replace(0, np.nan)
-            df['dist_from_ma50'] = (df['raw_close'] - ma50_safe) / (ma50_safe + 1e-9)
+            df['dist_from_ma50'] = dist_from_ma50(df['raw_close'].to_numpy(), df[ma50_col].to_numpy())
 
     return df
 
+TARGET_COLS = ('open', 'high', 'low', 'close')
+
+# ---- RAM-4: deferred sklearn import — keeps workers from loading full stack ----
+def build_scalers(X, train_mask, fitted=None):
+    """
+    Fit scaler_X / scaler_Y on the train rows of unscaled feature rows X (or
+    reuse `fitted`).  scaler_Y sees the price columns, the return targets;
+    feature_pipeline.apply_training_scalers applies the pair.
+    """
+    if fitted is not None:
+        return fitted
+    from sklearn.preprocessing import StandardScaler
+    price_idx = [FEATURE_SCHEMA.index(c) for c in TARGET_COLS]
+    X_train = np.asarray(X[train_mask], dtype=np.float32)
+    scaler_X = StandardScaler().fit(X_train)
+    scaler_Y = StandardScaler().fit(X_train[:, price_idx])
+    return scaler_X, scaler_Y
+
+
+def build_feature_rows(dataset_path: str, prices_path: str) -> dict:
+    """
+    CSV -> merged frame -> per-symbol preprocessing -> unscaled float32 rows.
+
+    Returns flat arrays sorted by symbol then time: ``features`` [N, F]
+    (model-contract rows in FEATURE_SCHEMA order), ``prices`` [N, 4] (raw
+    OHLC), ``symbol`` [N] and ``time`` [N].  This is what the feature store
+    materialises; finish_training_dataset turns it into training arrays.
+    """
+    logging.info("Loading datasets...")
+    metrics_df = pd.read_csv(dataset_path)
+    prices_df  = pd.read_csv(prices_path)
+    metrics_df['time'] = pd.to_datetime(metrics_df['time'], utc=True)
+    prices_df['time']  = pd.to_datetime(prices_df['time'],  utc=True)
+
+    df = pd.merge(metrics_df, prices_df, on=['symbol', 'time'], how='inner')
+    del metrics_df, prices_df  # free source DataFrames immediately
+    if df.empty:
+        raise ValueError("Merged dataset is empty — check 'time' and 'symbol' columns match.")
+    df = df.sort_values(['symbol', 'time']).reset_index(drop=True)
+    df['symbol_id'] = pd.factorize(df['symbol'])[0]
+
+    target_cols    = list(TARGET_COLS)
+    raw_price_cols = [f'raw_{c}' for c in target_cols]
+    features = list(FEATURE_SCHEMA)
+    validate_feature_schema(features)
+
+    # ---- RAM-3: vectorised pandas preprocessing (no joblib workers) ----
+    logging.info("Preprocessing features (vectorised pandas)...")
+    df = _vectorised_preprocess(df, target_cols, raw_price_cols)
+
+    def _normalize_symbol_group(group: pd.DataFrame) -> pd.DataFrame:
+        norm = normalize_features(group)
+        norm.index = group.index
+        return norm[features]
+
+    normalized_features = df.groupby('symbol', group_keys=False).apply(_normalize_symbol_group)
+    df[features] = normalized_features[features]
+
+    df.replace([np.inf, -np.inf], np.nan, inplace=True)
+    df[features] = df.groupby('symbol')[features].ffill().bfill()
+    df[raw_price_cols] = df.groupby('symbol')[raw_price_cols].ffill().bfill()
+
+    for _symbol, grp in df.groupby('symbol', sort=False):
+        assert_sequence_integrity(grp[['time'] + features], seq_len=1)
+
+    # ---- RAM-2: cast ALL numeric data to float32 before tensor/scaler work ----
+    logging.info("Casting all numeric columns to float32...")
+    return {
+        'features': np.ascontiguousarray(df[features].to_numpy(dtype=np.float32)),
+        'prices':   np.ascontiguousarray(df[raw_price_cols].to_numpy(dtype=np.float32)),
+        'symbol':   df['symbol'].to_numpy(dtype=object),
+        'time':     df['time'].dt.tz_localize(None).to_numpy(dtype='datetime64[ns]'),
+    }
+
+
+def finish_training_dataset(rows: dict, verify_split: float, reference: dict = None) -> dict:
+    """
+    Temporal split, volatility regimes and fitted scalers over build_feature_rows
+    output (in RAM or memory-mapped from the feature store) -> flat arrays.
+
+    `reference` (load_shared_artefacts of a trained output dir) pins the symbol
+    ids and scalers to that model: its scalers are applied, not refit, and
+    symbols it has no embedding for are dropped.
+    """
+    target_cols = list(TARGET_COLS)
+    features = list(FEATURE_SCHEMA)
+    symbols = np.asarray(rows['symbol'], dtype=object)
+
+    if reference is not None:
+        if list(reference['features']) != features:
+            raise ValueError("Reference model features.json does not match FEATURE_SCHEMA; retrain from scratch.")
+        sym2id = dict(reference['sym2id'])
+        known = pd.Series(symbols).isin(sym2id.keys()).to_numpy()
+        if not known.all():
+            logging.warning(
+                f"Dropping {pd.unique(symbols[~known]).size} symbols not in the reference "
+                f"symbol_mapping.json (no embedding); retrain from scratch to add them."
+            )
+            rows = {name: np.asarray(values)[known] for name, values in rows.items()}
+            symbols = symbols[known]
+    else:
+        sym2id = {s: i for i, s in enumerate(pd.unique(symbols))}
+    symbol_id = pd.Series(symbols).map(sym2id).to_numpy(dtype=np.int64)
+    X_raw = rows['features']
+    times = np.asarray(rows['time'], dtype='datetime64[ns]')
+
+    # ---- Horizon-independent temporal split ----
+    all_dates = np.unique(times)
+    split_pos = max(1, int(len(all_dates) * (1.0 - verify_split)))
+    cutoff_date = pd.Timestamp(all_dates[min(split_pos, len(all_dates) - 1)], tz='UTC')
+    train_mask  = times < cutoff_date.tz_localize(None).to_datetime64()
+    logging.info(f"Train/val temporal cutoff: {cutoff_date}")
+
+    # ---- Volatility regimes ----
+    vol = pd.Series(X_raw[:, features.index('volatility')])
+    q33 = vol[train_mask].quantile(0.33)
+    q66 = vol[train_mask].quantile(0.66)
+    regime = np.zeros(len(vol), dtype=np.int64)
+    regime[(vol > q33).to_numpy()] = 1
+    regime[(vol > q66).to_numpy()] = 2
+
+    scaler_X, scaler_Y = build_scalers(
+        X_raw, train_mask,
+        fitted=(reference['scaler_X'], reference['scaler_Y']) if reference is not None else None,
+    )
+    X = np.ascontiguousarray(apply_training_scalers(X_raw, scaler_X, scaler_Y), dtype=np.float32)
+    price_idx = [features.index(c) for c in target_cols]
+
+    # RAM note: only the flat [N_rows, F] arrays are kept — no windows pre-expanded.
+    return {
+        'X':         X,
+        'Y_ret':     np.ascontiguousarray(X[:, price_idx]),
+        'Y_price':   np.ascontiguousarray(rows['prices'], dtype=np.float32),
+        'symbol_id': symbol_id,
+        'regime':    regime,
+        'time':      times,
+        'sym2id':      sym2id,
+        'features':    features,
+        'target_cols': target_cols,
+        'cutoff_date': cutoff_date,
+        'scaler_X':    scaler_X,
+        'scaler_Y':    scaler_Y,
+    }
+
+
+def prepare_training_dataset(dataset_path: str, prices_path: str, verify_split: float,
+                             reference: dict = None) -> dict:
+    """
+    CSV -> preprocessed rows -> fitted scalers -> flat arrays.
+
+    Returns plain NumPy arrays (row-aligned, sorted by symbol then time) so the
+    result can be written to / memory-mapped from the columnar cache unchanged.
+    """
+    return finish_training_dataset(build_feature_rows(dataset_path, prices_path), verify_split, reference)
+
+
+def write_shared_artefacts(output_dir: str, prepared: dict):
+    """Scalers + symbol/feature metadata consumed by ml_model at inference time."""
+    import joblib as _joblib
+    with open(os.path.join(output_dir, 'symbol_mapping.json'), 'w') as f:
+        json.dump(prepared['sym2id'], f, indent=4)
+    with open(os.path.join(output_dir, 'features.json'), 'w') as f:
+        json.dump(prepared['features'], f, indent=4)
+    _joblib.dump(prepared['scaler_X'], os.path.join(output_dir, 'scaler_X.pkl'))
+    _joblib.dump(prepared['scaler_Y'], os.path.join(output_dir, 'scaler_Y.pkl'))
+    logging.info("Scalers saved.")
+
+
+# Last bar date a model in output_dir has trained on; --finetune_from starts after it.
+DATA_RANGE_FILE = 'data_range.json'
+
+
+def write_data_range(output_dir: str, times: np.ndarray, cutoff_date):
+    with open(os.path.join(output_dir, DATA_RANGE_FILE), 'w') as f:
+        json.dump({
+            'first_date':  pd.Timestamp(times.min()).isoformat(),
+            'last_date':   pd.Timestamp(times.max()).isoformat(),
+            'cutoff_date': pd.Timestamp(cutoff_date).isoformat(),
+        }, f, indent=4)
+
+
+def load_shared_artefacts(model_dir: str) -> dict:
+    """Inverse of write_shared_artefacts (+ data_range.json when present)."""
+    import joblib as _joblib
+    with open(os.path.join(model_dir, 'symbol_mapping.json')) as f:
+        sym2id = json.load(f)
+    with open(os.path.join(model_dir, 'features.json')) as f:
+        features = json.load(f)
+    data_range = None
+    range_path = os.path.join(model_dir, DATA_RANGE_FILE)
+    if os.path.exists(range_path):
+        with open(range_path) as f:
+            data_range = json.load(f)
+    return {
+        'sym2id':     sym2id,
+        'features':   features,
+        'scaler_X':   _joblib.load(os.path.join(model_dir, 'scaler_X.pkl')),
+        'scaler_Y':   _joblib.load(os.path.join(model_dir, 'scaler_Y.pkl')),
+        'data_range': data_range,
+    }
+
+
+# ============================================================
+# 7b. Columnar dataset cache — RAM-6 (--cache_dir)
+# ============================================================
+# Bump for changes the source hash below cannot see (e.g. a pandas / sklearn upgrade).
+DATASET_CACHE_VERSION = 1
+DATASET_CACHE_ARRAYS  = ('X', 'Y_ret', 'Y_price', 'symbol_id', 'regime', 'time')
+DATASET_CACHE_META    = 'meta.json'
+# Sub-directory of --cache_dir holding the unscaled rows fine-tuning re-scales (a feature store).
+FINETUNE_ROWS_DIR     = 'finetune_rows'
+
+
+def _file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=1)
+def preprocessing_source_sha() -> str:
+    """sha256 of the train.py functions that turn the CSVs into cached arrays."""
+    digest = hashlib.sha256()
+    for fn in (_vectorised_preprocess, build_scalers, build_feature_rows, finish_training_dataset):
+        digest.update(inspect.getsource(fn).encode())
+    return digest.hexdigest()
+
+
+def dataset_cache_key(dataset_path: str, prices_path: str, verify_split: float) -> tuple:
+    """
+    Cache identity = preprocessing schema + source file contents + split parameters.
+
+    The schema hash covers the feature/target column contract, the
+    feature_pipeline source and the preprocessing functions in this file, so
+    editing normalize_features or build_feature_rows invalidates the cache.
+    Returns (key, metadata) where metadata is what gets written to meta.json.
+    """
+    import feature_pipeline
+    with open(feature_pipeline.__file__, 'rb') as f:
+        pipeline_sha = hashlib.sha256(f.read()).hexdigest()
+    schema = {
+        'version':       DATASET_CACHE_VERSION,
+        'features':      list(FEATURE_SCHEMA),
+        'target_cols':   list(TARGET_COLS),
+        'pipeline_sha':  pipeline_sha,
+        'preprocess_sha': preprocessing_source_sha(),
+    }
+    schema_hash = hashlib.sha256(json.dumps(schema, sort_keys=True).encode()).hexdigest()
+    meta = {
+        'schema_hash':  schema_hash,
+        'sources': {
+            'dataset': {'path': os.path.abspath(dataset_path), 'sha256': _file_sha256(dataset_path)},
+            'prices':  {'path': os.path.abspath(prices_path),  'sha256': _file_sha256(prices_path)},
+        },
+        'verify_split': float(verify_split),
+    }
+    key_material = json.dumps(
+        [schema_hash, meta['sources']['dataset']['sha256'],
+         meta['sources']['prices']['sha256'], meta['verify_split']],
+    )
+    return hashlib.sha256(key_material.encode()).hexdigest()[:16], meta
+
+
+def open_array_maps(array_dir: str, names=DATASET_CACHE_ARRAYS) -> dict:
+    """
+    Memory-map .npy arrays from ``array_dir``.
+
+    Copy-on-write (mmap_mode='c') so torch.from_numpy can wrap them without a
+    copy and without the read-only tensor warning; pages are faulted in lazily.
+    """
+    return {name: np.load(os.path.join(array_dir, f"{name}.npy"), mmap_mode='c') for name in names}
+
+
+def spill_arrays_to_disk(prepared: dict, array_dir: str) -> dict:
+    """
+    Write the flat arrays of an in-RAM prepared dataset to ``array_dir`` and
+    swap them for memory maps, so DataLoader workers can share them by path.
+    """
+    os.makedirs(array_dir, exist_ok=True)
+    for name in DATASET_CACHE_ARRAYS:
+        np.save(os.path.join(array_dir, f"{name}.npy"), prepared[name])
+    prepared.update(open_array_maps(array_dir), array_dir=array_dir)
+    return prepared
+
+
+def build_shared_inputs(prepared: dict) -> dict:
+    """
+    Horizon-independent train_single_horizon inputs: zero-copy tensors over the
+    flat arrays plus the symbol run layout and per-row date ranks.
+    """
+    row_pos, run_len = symbol_row_layout(prepared['symbol_id'])
+    Y_price_tensor = torch.from_numpy(prepared['Y_price'])
+    return {
+        'X_tensor':          torch.from_numpy(prepared['X']),
+        'Y_ret_tensor':      torch.from_numpy(prepared['Y_ret']),
+        'Y_price_tensor':    Y_price_tensor,
+        'last_price_tensor': Y_price_tensor,
+        'sym_tensor':        torch.from_numpy(prepared['symbol_id']),
+        'regime_tensor':     torch.from_numpy(prepared['regime']),
+        'idx_to_date':       prepared['time'],
+        'row_pos':           row_pos,
+        'run_len':           run_len,
+        'date_rank':         np.unique(prepared['time'], return_inverse=True)[1].astype(np.int64),
+    }
+
+
+def save_dataset_cache(cache_dir: str, key: str, meta: dict, prepared: dict):
+    """Write arrays as .npy + scalers + meta.json into <cache_dir>/<key>/ (atomic rename)."""
+    import joblib as _joblib
+    entry_dir = os.path.join(cache_dir, key)
+    if os.path.isdir(entry_dir):
+        return entry_dir
+    tmp_dir = f"{entry_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    try:
+        for name in DATASET_CACHE_ARRAYS:
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), prepared[name])
+        _joblib.dump(prepared['scaler_X'], os.path.join(tmp_dir, 'scaler_X.pkl'))
+        _joblib.dump(prepared['scaler_Y'], os.path.join(tmp_dir, 'scaler_Y.pkl'))
+        entry_meta = dict(
+            meta,
+            key=key,
+            rows=int(len(prepared['symbol_id'])),
+            sym2id=prepared['sym2id'],
+            features=prepared['features'],
+            target_cols=prepared['target_cols'],
+            cutoff_date=prepared['cutoff_date'].isoformat(),
+            created=pd.Timestamp.now(tz='UTC').isoformat(),
+        )
+        with open(os.path.join(tmp_dir, DATASET_CACHE_META), 'w') as f:
+            json.dump(entry_meta, f, indent=4)
+        os.replace(tmp_dir, entry_dir)
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not os.path.isdir(entry_dir):  # lost a race to a concurrent writer is fine
+            raise
+    logging.info(f"Dataset cache written: {entry_dir}")
+    return entry_dir
+
+
+def load_dataset_cache(cache_dir: str, key: str, meta: dict):
+    """
+    Memory-map a cache entry. Returns the same dict shape as prepare_training_dataset
+    (plus ``array_dir``), or None when the entry is missing, stale or unreadable.
+    """
+    import joblib as _joblib
+    entry_dir = os.path.join(cache_dir, key)
+    meta_path = os.path.join(entry_dir, DATASET_CACHE_META)
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path) as f:
+            entry_meta = json.load(f)
+        if (entry_meta.get('schema_hash') != meta['schema_hash']
+                or entry_meta.get('sources') != meta['sources']
+                or entry_meta.get('verify_split') != meta['verify_split']):
+            logging.warning(f"Dataset cache {entry_dir} metadata mismatch; rebuilding.")
+            return None
+        prepared = open_array_maps(entry_dir)
+        if any(len(prepared[name]) != entry_meta['rows'] for name in DATASET_CACHE_ARRAYS):
+            logging.warning(f"Dataset cache {entry_dir} row counts disagree; rebuilding.")
+            return None
+        prepared.update(
+            sym2id=entry_meta['sym2id'],
+            features=entry_meta['features'],
+            target_cols=entry_meta['target_cols'],
+            cutoff_date=pd.Timestamp(entry_meta['cutoff_date']),
+            scaler_X=_joblib.load(os.path.join(entry_dir, 'scaler_X.pkl')),
+            scaler_Y=_joblib.load(os.path.join(entry_dir, 'scaler_Y.pkl')),
+            array_dir=entry_dir,
+        )
+    except (OSError, ValueError, KeyError) as e:
+        logging.warning(f"Dataset cache {entry_dir} unreadable ({e}); rebuilding.")
+        return None
+    logging.info(f"Dataset cache hit: {entry_dir} ({entry_meta['rows']} rows)")
+    return prepared
+
+
+def load_or_prepare_dataset(dataset_path: str, prices_path: str, verify_split: float,
+                            cache_dir: str = None, reference: dict = None, feature_store: str = None) -> dict:
+    """
+    prepare_training_dataset, served from / written to the cache when cache_dir is set.
+    With ``feature_store`` the preprocessed rows are memory-mapped from (or first
+    materialised into) that feature store instead of being rebuilt from the CSVs.
+    """
+    def _prepare(ref=None, store_root=feature_store):
+        if store_root:
+            from feature_store import load_or_build
+            rows = load_or_build(store_root, dataset_path, prices_path).rows()
+            return finish_training_dataset(rows, verify_split, reference=ref)
+        return prepare_training_dataset(dataset_path, prices_path, verify_split, reference=ref)
+
+    if reference is not None:
+        # Fine-tuning applies the reference scalers, so cache entries (fitted here) don't
+        # apply; the unscaled rows do, and are kept under cache_dir as a feature store.
+        rows_root = feature_store or (os.path.join(cache_dir, FINETUNE_ROWS_DIR) if cache_dir else None)
+        return _prepare(reference, store_root=rows_root)
+    if not cache_dir:
+        return _prepare()
+    cache_key, cache_meta = dataset_cache_key(dataset_path, prices_path, verify_split)
+    prepared = load_dataset_cache(cache_dir, cache_key, cache_meta)
+    if prepared is None:
+        prepared = _prepare()
+        os.makedirs(cache_dir, exist_ok=True)
+        save_dataset_cache(cache_dir, cache_key, cache_meta, prepared)
+        # Re-open from disk so the in-RAM copies are released and workers share by path.
+        prepared = load_dataset_cache(cache_dir, cache_key, cache_meta) or prepared
+    return prepared
+
 # ============================================================
 # 8. Dummy data generator
 # ============================================================
@@ -1077,6 +1799,41 @@ def create_dummy_dataset_if_missing(metrics_path, prices_path, companies_path):
 # ============================================================
 # 9. Inference helper
 # ============================================================
+def _prepare_inference_window(ohlc_history, scaler_X, feature_names, lookback,
+                              model_input=None, scaler_Y=None):
+    """
+    Shared input path of predict()/predict_multi_horizon(): normalise, transform, scale.
+
+    ``model_input`` (the scaled [lookback, F] window the caller already
+    built, e.g. ml_model) is used as given; otherwise it is derived from the
+    raw history with feature_pipeline.prepare_model_input, which scales it
+    exactly as training X was.
+    """
+    if isinstance(ohlc_history, pd.DataFrame):
+        hist_df = ohlc_history.copy()
+    else:
+        if len(ohlc_history) < lookback:
+            raise ValueError(f"Need >= {lookback} history entries (got {len(ohlc_history)}).")
+        hist_df = pd.DataFrame(ohlc_history)
+
+    validate_feature_schema(feature_names)
+
+    normalized_df = normalize_features(hist_df)
+    assert_sequence_integrity(normalized_df, lookback)
+
+    last_close = float(normalized_df['close'].iloc[-1])
+    if not np.isfinite(last_close):
+        raise ValueError("Last close is non-finite after normalization.")
+
+    if model_input is not None:
+        return hist_df, normalized_df, last_close, model_input
+    # Raw float64 values in time order: training takes its returns before the float32 cast.
+    window_scaled = prepare_model_input(
+        feature_window(hist_df)['features'], lookback, scaler_vectors(scaler_X), scaler_vectors(scaler_Y)
+    )
+    return hist_df, normalized_df, last_close, window_scaled
+
+
 def predict(
     ohlc_history: list,
     symbol_id: int,
@@ -1087,6 +1844,7 @@ def predict(
     feature_names: list,
     device,
     lookback: int = 120,
+    model_input: np.ndarray = None,
 ) -> pd.DataFrame:
     """
     Run inference on an arbitrarily long OHLC history.
@@ -1105,30 +1863,51 @@ def predict(
     feature_names : ordered list (from features.json)
     device        : torch.device
     lookback      : must match training value
+    model_input   : optional scaled [lookback, F] window for the same bars
+                    (feature_pipeline.prepare_model_input); used as given
 
     Returns
     -------
     pd.DataFrame  columns=['open','high','low','close'], len=horizon
     """
-    if isinstance(ohlc_history, pd.DataFrame):
-        hist_df = ohlc_history.copy()
-    else:
-        if len(ohlc_history) < lookback:
-            raise ValueError(f"Need >= {lookback} history entries (got {len(ohlc_history)}).")
-        hist_df = pd.DataFrame(ohlc_history)
+    hist_df, normalized_df, last_close, window_scaled = _prepare_inference_window(
+        ohlc_history, scaler_X, feature_names, lookback, model_input=model_input, scaler_Y=scaler_Y
+    )
 
-    validate_feature_schema(feature_names)
+    x     = torch.tensor(window_scaled).unsqueeze(0).to(device)
+    sym_t = torch.tensor([symbol_id], dtype=torch.long, device=device)
+    reg_t = torch.tensor([regime_id], dtype=torch.long, device=device)
 
-    normalized_df = normalize_features(hist_df)
-    assert_sequence_integrity(normalized_df, lookback)
+    model.eval()
+    with torch.no_grad():
+        # No teacher_targets -> true autoregressive inference
+        pred_ret_scaled = model(x, sym_t, reg_t, teacher_targets=None).squeeze(0).cpu().numpy()
 
-    last_close = float(normalized_df['close'].iloc[-1])
-    if not np.isfinite(last_close):
-        raise ValueError("Last close is non-finite after normalization.")
+    pred_ret = scaler_Y.inverse_transform(pred_ret_scaled)
+    return postprocess_forecast(pred_ret, normalized_df, hist_df, last_close)
+
+
+def predict_multi_horizon(
+    ohlc_history,
+    symbol_id: int,
+    regime_id: int,
+    model: "MultiHorizonPredictor",
+    scaler_X: "StandardScaler",
+    scaler_Y: "StandardScaler",
+    feature_names: list,
+    device,
+    lookback: int = 120,
+    model_input: np.ndarray = None,
+) -> dict:
+    """
+    predict() for MultiHorizonPredictor: one encode + one max-horizon decode,
+    then per-horizon post-processing of each prefix.
 
-    model_feature_df = to_model_feature_frame(normalized_df)
-    window = model_feature_df[feature_names].to_numpy(dtype=np.float32)[-lookback:]
-    window_scaled = scaler_X.transform(window)
+    Returns {horizon: pd.DataFrame(columns=['open','high','low','close'])}.
+    """
+    hist_df, normalized_df, last_close, window_scaled = _prepare_inference_window(
+        ohlc_history, scaler_X, feature_names, lookback, model_input=model_input, scaler_Y=scaler_Y
+    )
 
     x     = torch.tensor(window_scaled).unsqueeze(0).to(device)
     sym_t = torch.tensor([symbol_id], dtype=torch.long, device=device)
@@ -1136,11 +1915,25 @@ def predict(
 
     model.eval()
     with torch.no_grad():
-        # No teacher_targets -> true autoregressive inference
-        pred_ret_scaled = model(x, sym_t, reg_t, teacher_targets=None).squeeze(0).cpu().numpy()
+        prefixes = model.forward_horizons(x, sym_t, reg_t)
+
+    forecasts = {}
+    for h, pred_scaled in prefixes.items():
+        pred_ret = scaler_Y.inverse_transform(pred_scaled.squeeze(0).cpu().numpy())
+        forecasts[h] = postprocess_forecast(pred_ret, normalized_df, hist_df, last_close)
+    return forecasts
 
-    pred_ret = scaler_Y.inverse_transform(pred_ret_scaled)
 
+def postprocess_forecast(
+    pred_ret: np.ndarray,
+    normalized_df: pd.DataFrame,
+    hist_df: pd.DataFrame,
+    last_close: float,
+) -> pd.DataFrame:
+    """
+    Regime/confidence scaling, low-variance fallback and price reconstruction
+    applied to de-standardised model returns ([H, M]) inside predict().
+    """
     # ---- Regime multipliers & confidence scaling (Sections A–F) ----
     momentum_20d_val = float(normalized_df['close'].pct_change(20).fillna(0).iloc[-1])
     volatility_std_val = float(normalized_df['volatility'].iloc[-1])
@@ -1284,11 +2077,13 @@ def build_temporal_loader(
     drop_last,
     loader_kwargs,
     cpu_prefetch_queue,
+    sampler=None,
 ):
     loader = DataLoader(
         anchor_dataset,
         batch_size=batch_size,
-        shuffle=shuffle,
+        shuffle=shuffle if sampler is None else False,
+        sampler=sampler,
         drop_last=drop_last,
         collate_fn=collator,
         **loader_kwargs,
@@ -1315,6 +2110,7 @@ def auto_tune_batch_size(
     min_batch_size,
     max_batch_size,
     accum_steps,
+    head_weights,
 ):
     """
     Probe feasible batch size on current GPU and preserve effective batch with
@@ -1363,14 +2159,10 @@ def auto_tune_batch_size(
             )
             model.zero_grad(set_to_none=True)
             with torch.amp.autocast('cuda', enabled=use_amp, dtype=amp_dtype):
-                pred_ret = model(x, sym, regime, teacher_targets=y_ret)
-                bsz, hsz, msz = pred_ret.shape
-                pred_returns = pred_ret.reshape(bsz * hsz, msz).mean(dim=-1)
-                target_returns = y_ret.reshape(bsz * hsz, msz).mean(dim=-1)
-                guard_metrics = compute_pattern_guard_losses(pred_returns, target_returns)
-                pred_price = _reconstruct_prices(pred_ret, last_p, scale_t, mean_t)
-                loss = criterion(pred_ret, y_ret, pred_price, y_price, last_p)
-                loss = loss + guard_metrics['total_guard_loss']
+                loss, _, _ = compute_forecast_loss(
+                    model(x, sym, regime, teacher_targets=y_ret),
+                    y_ret, y_price, last_p, criterion, scale_t, mean_t, head_weights,
+                )
             (loss / max(1, accum_steps)).backward()
             torch.cuda.synchronize(device)
             model.zero_grad(set_to_none=True)
@@ -1414,6 +2206,157 @@ def auto_tune_batch_size(
     tuned_accum_steps = max(1, math.ceil(target_effective / best))
     return int(best), int(tuned_accum_steps)
 
+def build_predictor(num_symbols, num_features, lookback, horizon, num_targets,
+                    horizon_set=None, model_kwargs=None):
+    """
+    MultiMetricPredictor for one horizon, or MultiHorizonPredictor when
+    horizon_set is given.  model_kwargs (model_dim, num_heads, num_layers, ...)
+    override the architecture defaults.
+    """
+    model_kwargs = model_kwargs or {}
+    if horizon_set:
+        model = MultiHorizonPredictor(
+            num_symbols=num_symbols, num_features=num_features,
+            lookback=lookback, horizons=horizon_set,
+            num_target_metrics=num_targets, **model_kwargs,
+        )
+    else:
+        model = MultiMetricPredictor(
+            num_symbols=num_symbols, num_features=num_features,
+            lookback=lookback, forecast_horizon=horizon,
+            num_target_metrics=num_targets, **model_kwargs,
+        )
+    # Tie the GRUCell to the parallel GRU up front.  Autoregressive validation
+    # would otherwise do it mid-run, shrinking model.parameters() between the
+    # first stage's optimizer and later ones, which breaks optimizer-state
+    # restore on --resume and leaves unused parameters for DDP.
+    for module in model.modules():
+        if isinstance(module, MultiMetricPredictor):
+            module._share_gru_weights()
+    return model
+
+
+# ---- Resumable training state (--resume / --checkpoint_every) ----
+TRAIN_STATE_FILE = 'train_state.pt'
+TRAIN_STATE_VERSION = 2
+
+
+def capture_rng_state():
+    state = {
+        'python': random.getstate(),
+        'numpy': np.random.get_state(),
+        'torch': torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def restore_rng_state(state):
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+    if 'cuda' in state and torch.cuda.is_available() and len(state['cuda']) == torch.cuda.device_count():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+
+def _snapshot_to_cpu(obj):
+    """Detached CPU copy of every tensor (and fresh containers) so training can keep mutating."""
+    if torch.is_tensor(obj):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return {k: _snapshot_to_cpu(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_snapshot_to_cpu(v) for v in obj]
+    if isinstance(obj, tuple):
+        return tuple(_snapshot_to_cpu(v) for v in obj)
+    return obj
+
+
+def atomic_torch_save(obj, path):
+    tmp_path = f"{path}.tmp"
+    torch.save(obj, tmp_path)
+    os.replace(tmp_path, path)
+
+
+class CheckpointWriter:
+    """
+    Background atomic checkpoint writer.
+
+    submit() snapshots the state to CPU on the caller's thread (a memcpy) and
+    returns; serialisation + fsync-free atomic rename happen on a daemon thread.
+    If a write is still pending when a newer state arrives, the newer one
+    replaces it (latest wins), so training never queues up behind disk I/O.
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pending = None
+        self._busy = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='ckpt-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, state, path):
+        snapshot = _snapshot_to_cpu(state)
+        with self._cond:
+            self._pending = (snapshot, path)
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closed:
+                    self._cond.wait()
+                if self._pending is None:
+                    return
+                snapshot, path = self._pending
+                self._pending = None
+                self._busy = True
+            try:
+                atomic_torch_save(snapshot, path)
+            except Exception:
+                logging.exception(f"Background checkpoint write to {path} failed.")
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def flush(self):
+        with self._cond:
+            while self._pending is not None or self._busy:
+                self._cond.wait()
+
+    def close(self):
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+
+def load_training_state(path):
+    state = torch.load(path, map_location='cpu', weights_only=False)
+    if state.get('version') != TRAIN_STATE_VERSION:
+        raise ValueError(f"Unsupported training state version in {path}: {state.get('version')}")
+    return state
+
+
+def export_horizon_checkpoints(model, output_dir):
+    """
+    Write a MultiHorizonPredictor as <output_dir>/multi/{h}d/best_model.pth
+    for each of its horizons.  Its parameters do not depend on the horizon,
+    so each file loads into MultiMetricPredictor(forecast_horizon=h), which
+    decodes exactly the first h steps.  The exports sit under multi/ so they
+    never replace a sequentially trained <output_dir>/{h}d/best_model.pth.
+    """
+    state_dict = model.state_dict()
+    for h in model.horizons:
+        head_dir = os.path.join(output_dir, SHARED_ENCODER_DIR, f"{h}d")
+        os.makedirs(head_dir, exist_ok=True)
+        atomic_torch_save(state_dict, os.path.join(head_dir, 'best_model.pth'))
+    logging.info(f"Exported horizons {model.horizons} to {os.path.join(output_dir, SHARED_ENCODER_DIR)}")
+
+
 # ============================================================
 # 10. Per-Horizon Training Worker
 # ============================================================
@@ -1422,8 +2365,8 @@ def train_single_horizon(
     # Shared tensors (CPU)
     X_tensor, sym_tensor, regime_tensor,
     Y_ret_tensor, Y_price_tensor, last_price_tensor,
-    # Index computation
-    df_groups, idx_to_date, cutoff_date,
+    # Index computation (symbol_row_layout + per-row date rank)
+    row_pos, run_len, date_rank, idx_to_date, cutoff_date,
     # Scalers
     scaler_Y,
     # Model config
@@ -1450,6 +2393,22 @@ def train_single_horizon(
     profile_sync_timing,
     # Shared results dict
     results,
+    # Shared-encoder mode: train one MultiHorizonPredictor at max(horizon_set)
+    horizon_set=None,
+    # Directory of the .npy files backing the shared tensors (see TemporalBatchCollator)
+    array_dir=None,
+    # --ddp_cpu: this process is one rank of an initialised gloo process group
+    distributed=False,
+    # Shared-encoder mode: {horizon: loss weight} over prefixes of the max-horizon decode
+    horizon_weights=None,
+    # Resumable state: continue from <checkpoint_dir>/<horizon>/train_state.pt; write it every N batches
+    resume=False,
+    checkpoint_every=0,
+    # Hyperparameter overrides (train_sweep.py): MultiMetricPredictor / CombinedForecastLoss kwargs
+    model_kwargs=None,
+    loss_kwargs=None,
+    # Called on rank 0 after every validated epoch as (epochs_done, val_loss); True stops the run
+    epoch_callback=None,
 ):
     """
         Train one model for a specific forecast horizon.
@@ -1459,19 +2418,34 @@ def train_single_horizon(
             2) Optional CPU queue prefetch when num_workers=0
             3) CUDA stream prefetch overlaps H2D transfer with compute
             4) Optional one-shot batch-size auto tuning per horizon
+
+        With horizon_set the model is a MultiHorizonPredictor trained at
+        `horizon` (= max): each batch is sliced once, horizon h is scored on the
+        first h steps and the losses are summed with horizon_weights; validation
+        uses the same weighted mean and the best model is also exported to
+        <output_dir>/multi/{h}d/best_model.pth.
+
+        Full training state (model, AdamW, LambdaLR, GradScaler, stage, epoch,
+        batch cursor, RNG) is written atomically in the background every
+        `checkpoint_every` batches and at epoch/stage ends; resume=True
+        continues from it.
+
+        epoch_callback lets a caller (the train_sweep.py pruner) end the run
+        early; the result is then marked 'pruned'.
+
+        With distributed=True the train loader is sharded by DistributedSampler
+        and gradients are all-reduced by DDP; validation, checkpoints, logs and
+        the result entry are produced by rank 0 only.
     """
     tag = f"[{horizon_name}]"
+    is_main_rank = (not distributed) or dist.get_rank() == 0
     horizon_output = os.path.join(output_dir, horizon_name)
     horizon_ckpt   = os.path.join(checkpoint_dir, horizon_name)
     os.makedirs(horizon_output, exist_ok=True)
     os.makedirs(horizon_ckpt, exist_ok=True)
 
     # ---- Valid indices for this horizon ----
-    valid_indices = []
-    for indices in df_groups:
-        if len(indices) >= lookback + horizon:
-            valid_indices.extend(indices[lookback - 1 : len(indices) - horizon])
-    valid_indices = np.array(valid_indices)
+    valid_indices = horizon_valid_indices(row_pos, run_len, lookback, horizon)
 
     if len(valid_indices) == 0:
         logging.error(f"{tag} No valid sequences for horizon={horizon}. Skipping.")
@@ -1491,14 +2465,47 @@ def train_single_horizon(
 
     logging.info(f"{tag} Sequences: train={len(train_indices)}, val={len(verify_indices)}")
 
+    state_path = os.path.join(horizon_ckpt, TRAIN_STATE_FILE)
+    resume_state = None
+    if resume and os.path.exists(state_path):
+        resume_state = load_training_state(state_path)
+    elif is_main_rank and os.path.exists(state_path):
+        os.remove(state_path)
+    completed = resume_state is not None and bool(resume_state.get('completed'))
+    if distributed and not _ddp_agree(resume_state is not None, completed):
+        # A rank that skipped or resumed alone would issue different collectives and deadlock the rest.
+        raise RuntimeError(f"{tag} Ranks disagree on {state_path}; every rank needs the same checkpoint_dir.")
+    if completed:
+        logging.info(f"{tag} Already completed in a previous run; skipping.")
+        if is_main_rank:
+            results[horizon_name] = resume_state['result']
+        return
+    if resume_state is not None:
+        logging.info(
+            f"{tag} Resuming at stage {resume_state['stage_idx'] + 1} epoch {resume_state['epoch'] + 1} "
+            f"batch {resume_state['batch_cursor']}"
+        )
+
+    horizon_weights = dict(horizon_weights or {h: 1.0 for h in horizon_set}) if horizon_set else None
+    head_weights = horizon_weights or {horizon: 1.0}
+
+    def _validate(eval_fn, eval_model):
+        """eval_fn over verify_loader; in shared-encoder mode the weighted mean over horizons."""
+        return evaluate_heads(
+            eval_fn, eval_model, verify_loader, criterion, device, use_amp, scale_t, mean_t,
+            amp_dtype, head_weights=horizon_weights, tag=tag,
+            use_gpu_prefetch=enable_gpu_prefetch, channels_last=channels_last,
+        )
+
     # ---- Model ----
-    model = MultiMetricPredictor(
-        num_symbols=num_symbols, num_features=num_features,
-        lookback=lookback, forecast_horizon=horizon,
-        num_target_metrics=len(target_cols),
+    model = build_predictor(
+        num_symbols, num_features, lookback, horizon, len(target_cols),
+        horizon_set=horizon_set, model_kwargs=model_kwargs,
     ).to(device)
+    if distributed:
+        model = _wrap_ddp(model)
 
-    criterion   = CombinedForecastLoss(alpha=0.7, beta=0.2, gamma=0.5)
+    criterion   = CombinedForecastLoss(**{'alpha': 0.7, 'beta': 0.2, 'gamma': 0.5, **(loss_kwargs or {})})
 
     scale_t = torch.tensor(scaler_Y.scale_.astype(np.float32), device=device)
     mean_t  = torch.tensor(scaler_Y.mean_.astype(np.float32),  device=device)
@@ -1512,11 +2519,16 @@ def train_single_horizon(
         last_price_tensor=last_price_tensor,
         lookback=lookback,
         forecast_horizon=horizon,
+        array_dir=array_dir,
     )
 
     tuned_batch_size = int(batch_size)
     tuned_accum_steps = int(accum_steps)
-    if auto_batch_size_enabled:
+    if resume_state is not None:
+        # The batch cursor is only meaningful with the batch size it was recorded at.
+        tuned_batch_size = resume_state['tuned_batch_size']
+        tuned_accum_steps = resume_state['tuned_accum_steps']
+    elif auto_batch_size_enabled:
         probe_n = min(len(train_indices), max(4096, tuned_batch_size * 16))
         probe_dataset = TemporalAnchorDataset(train_indices[:probe_n], stride=stride)
         if len(probe_dataset) > 1:
@@ -1535,6 +2547,7 @@ def train_single_horizon(
                 min_batch_size=min_batch_size,
                 max_batch_size=max_batch_size,
                 accum_steps=tuned_accum_steps,
+                head_weights=head_weights,
             )
             logging.info(
                 f"{tag} Auto batch-size tune | mode={mode} "
@@ -1542,25 +2555,72 @@ def train_single_horizon(
                 f"effective_batch={tuned_batch_size * tuned_accum_steps}"
             )
 
-    verify_dataset = TemporalAnchorDataset(verify_indices, stride=stride)
-    verify_loader = build_temporal_loader(
-        anchor_dataset=verify_dataset,
-        collator=collator,
-        batch_size=tuned_batch_size,
-        shuffle=False,
-        drop_last=True,
-        loader_kwargs=loader_kwargs,
-        cpu_prefetch_queue=cpu_prefetch_queue,
-    )
+    verify_loader = None
+    if is_main_rank:
+        verify_dataset = TemporalAnchorDataset(verify_indices, stride=stride)
+        verify_loader = build_temporal_loader(
+            anchor_dataset=verify_dataset,
+            collator=collator,
+            batch_size=tuned_batch_size,
+            shuffle=False,
+            drop_last=True,
+            loader_kwargs=loader_kwargs,
+            cpu_prefetch_queue=cpu_prefetch_queue,
+        )
 
     best_global_val = float('inf')
+    epochs_done = 0
+    pruned = False
     log_data = []
     epoch_log_data = []
     batch_diag_data = []
-    train_dates = np.sort(np.unique(idx_to_date[train_indices]))
+    stage_index = CurriculumStageIndex(train_indices, date_rank)
+
+    if resume_state is not None:
+        sampler_seed = resume_state['sampler_seed']
+        best_global_val = resume_state['best_global_val']
+        log_data = resume_state['log_data']
+        epoch_log_data = resume_state['epoch_log_data']
+        batch_diag_data = resume_state['batch_diag_data']
+        epochs_done = resume_state['epochs_done']
+    else:
+        sampler_seed = torch.initial_seed() % (2 ** 31)
+        if distributed:
+            # DistributedSampler shards are only disjoint if every rank shuffles identically.
+            seed_t = _ddp_hold(torch.tensor([sampler_seed], dtype=torch.int64))
+            dist.broadcast(seed_t, src=0)
+            sampler_seed = int(seed_t.item())
+    state_writer = CheckpointWriter() if is_main_rank else None
+
+    def _training_state(stage_idx, epoch, batch_cursor, epoch_acc=None, stage_state=True):
+        """Everything needed to resume at (stage_idx, epoch, batch_cursor)."""
+        return {
+            'version': TRAIN_STATE_VERSION,
+            'horizon_name': horizon_name,
+            'stage_idx': stage_idx,
+            'epoch': epoch,
+            'batch_cursor': batch_cursor,
+            'sampler_seed': sampler_seed,
+            'tuned_batch_size': tuned_batch_size,
+            'tuned_accum_steps': tuned_accum_steps,
+            'model': eval_model.state_dict(),
+            # Stage-boundary states start the next stage with a fresh optimizer/schedule.
+            'optimizer': optimizer.state_dict() if stage_state else None,
+            'scheduler': scheduler.state_dict() if stage_state else None,
+            'grad_scaler': grad_scaler.state_dict() if (stage_state and grad_scaler is not None) else None,
+            'best_stage': best_stage if stage_state else float('inf'),
+            'pat_ctr': pat_ctr if stage_state else 0,
+            'epoch_acc': epoch_acc,
+            'best_global_val': best_global_val,
+            'log_data': log_data,
+            'epoch_log_data': epoch_log_data,
+            'batch_diag_data': batch_diag_data,
+            'epochs_done': epochs_done,
+            'rng': capture_rng_state(),
+        }
 
     # ---- Curriculum stages ----
-    # train_dates is sorted ascending (oldest → newest).
+    # Dates are ranked ascending (oldest → newest).
     # We slice from the TAIL so each stage uses the most-recent N% of history,
     # progressively extending backward into older data as the stage ratio grows.
     # This avoids the "nested oldest-data" anti-pattern where early stages lock
@@ -1577,24 +2637,22 @@ def train_single_horizon(
     for stage_idx in range(stages):
         stage = stage_idx + 1
         ratio = stage_ratios[stage_idx]
+        if resume_state is not None and stage_idx < resume_state['stage_idx']:
+            continue
+        resuming_stage = resume_state is not None and stage_idx == resume_state['stage_idx']
 
-        num_dates     = max(1, int(len(train_dates) * ratio))
-        stage_indices = np.array([], dtype=np.int64)
-        for _expand in range(num_dates, len(train_dates) + 1):
-            # Slice from the END to keep the most-recent _expand dates.
-            # Compared to train_dates[:_expand] (oldest-first), this ensures
-            # the model is always anchored on recent market conditions while
-            # each larger stage adds progressively older context.
-            stage_dates   = train_dates[-_expand:]
-            stage_indices = train_indices[np.isin(idx_to_date[train_indices], stage_dates)]
-            if len(stage_indices) > 0:
-                break
+        # Keep the most-recent N dates (slice from the END of the date ranks).
+        # Compared to oldest-first slicing, this ensures the model is always
+        # anchored on recent market conditions while each larger stage adds
+        # progressively older context.
+        stage_indices = stage_index.select(ratio)
 
         if len(stage_indices) == 0:
             logging.warning(f"{tag} Stage {stage}: no sequences — skipping.")
             continue
 
         stage_dataset = TemporalAnchorDataset(stage_indices, stride=stride)
+        train_sampler = ResumableSampler(stage_dataset, seed=sampler_seed, distributed=distributed)
         train_loader = build_temporal_loader(
             anchor_dataset=stage_dataset,
             collator=collator,
@@ -1603,6 +2661,7 @@ def train_single_horizon(
             drop_last=True,
             loader_kwargs=loader_kwargs,
             cpu_prefetch_queue=cpu_prefetch_queue,
+            sampler=train_sampler,
         )
         stage_batches = len(train_loader)
 
@@ -1616,11 +2675,13 @@ def train_single_horizon(
                      f"Seqs: {len(stage_indices)} | Batches: {stage_batches}")
 
         if not is_iterative:
-            model = MultiMetricPredictor(
-                num_symbols=num_symbols, num_features=num_features,
-                lookback=lookback, forecast_horizon=horizon,
-                num_target_metrics=len(target_cols),
+            model = build_predictor(
+                num_symbols, num_features, lookback, horizon, len(target_cols),
+                horizon_set=horizon_set, model_kwargs=model_kwargs,
             ).to(device)
+            if distributed:
+                model = _wrap_ddp(model)
+        eval_model = _unwrap_model(model)
         optimizer = optim.AdamW(model.parameters(), lr=learning_rate, weight_decay=1e-4)
         grad_scaler = torch.amp.GradScaler('cuda') if (use_amp and amp_dtype == torch.float16) else None
 
@@ -1630,18 +2691,50 @@ def train_single_horizon(
         ckpt_path = os.path.join(horizon_ckpt, f'stage_{stage}.pt')
         best_stage = float('inf')
         pat_ctr    = 0
-
-        if os.path.exists(ckpt_path):
+        start_epoch = resume_cursor = 0
+        resume_acc = pending_rng = None
+
+        if resuming_stage:
+            # The stage's best-so-far checkpoint (ckpt_path) is kept, not deleted.
+            eval_model.load_state_dict(resume_state['model'])
+            if resume_state['optimizer'] is not None:
+                optimizer.load_state_dict(resume_state['optimizer'])
+                scheduler.load_state_dict(resume_state['scheduler'])
+                if grad_scaler is not None and resume_state['grad_scaler'] is not None:
+                    grad_scaler.load_state_dict(resume_state['grad_scaler'])
+            best_stage = resume_state['best_stage']
+            pat_ctr = resume_state['pat_ctr']
+            start_epoch = resume_state['epoch']
+            resume_cursor = resume_state['batch_cursor']
+            resume_acc = resume_state['epoch_acc']
+            if resume_cursor:
+                # Mid-epoch states were captured after the DataLoader iterator drew its
+                # base seed; restore once the replayed epoch's iterator exists.
+                pending_rng = resume_state['rng']
+            else:
+                restore_rng_state(resume_state['rng'])
+            resume_state = None
+        elif is_main_rank and os.path.exists(ckpt_path):
             try:
                 os.remove(ckpt_path)
             except OSError:
                 pass
 
-        for epoch in range(epochs_per_stage):
+        for epoch in range(start_epoch, epochs_per_stage):
             epoch_start = time.perf_counter()
+            start_batch, resume_cursor = resume_cursor, 0
+            train_sampler.set_epoch(stage_idx * epochs_per_stage + epoch, start=start_batch * tuned_batch_size)
             model.train()
-            ep_loss = ep_n = ep_skip = 0
+            ep_n = ep_skip = 0
             n_nan_pred = n_nan_loss = n_extreme = n_nan_grad = 0
+            # Sample-weighted loss sum stays on device; read back at epoch end / state snapshots.
+            ep_loss_t = torch.zeros((), dtype=torch.float64, device=device)
+            if start_batch and resume_acc is not None:
+                ep_loss_t += resume_acc['ep_loss']
+                ep_n, ep_skip = resume_acc['ep_n'], resume_acc['ep_skip']
+                n_nan_pred, n_nan_loss = resume_acc['n_nan_pred'], resume_acc['n_nan_loss']
+                n_extreme, n_nan_grad = resume_acc['n_extreme'], resume_acc['n_nan_grad']
+            batches_since_save = 0
             ar_loss = float('nan')
             ar_mae = float('nan')
             ar_dir = float('nan')
@@ -1649,7 +2742,7 @@ def train_single_horizon(
             timing = StepTiming()
             last_step_end = time.perf_counter()
             profiler = maybe_build_profiler(
-                enabled=(profile and stage == 1 and epoch == 0),
+                enabled=(profile and is_main_rank and stage == 1 and epoch == 0),
                 device=device,
                 log_dir=log_dir,
                 horizon_name=horizon_name,
@@ -1666,7 +2759,10 @@ def train_single_horizon(
                     channels_last=channels_last,
                 )
 
-                for batch_idx, (x, sym, regime, y_ret, y_price, last_p) in enumerate(train_source):
+                for batch_idx, (x, sym, regime, y_ret, y_price, last_p) in enumerate(train_source, start=start_batch):
+                    if pending_rng is not None:
+                        restore_rng_state(pending_rng)
+                        pending_rng = None
                     data_ready = time.perf_counter()
                     timing.data_wait_s += max(0.0, data_ready - last_step_end)
 
@@ -1684,18 +2780,18 @@ def train_single_horizon(
 
                     forward_t0 = time.perf_counter()
                     with torch.amp.autocast('cuda', enabled=use_amp, dtype=amp_dtype):
-                        pred_ret = model(x, sym, regime, teacher_targets=y_ret)
-                        # Compute curvature per sequence (seq dim=1), then flatten for vol/acf/variance
-                        b_sz, h_sz, m_sz = pred_ret.shape
-                        pred_returns = pred_ret.reshape(b_sz * h_sz, m_sz).mean(dim=-1)
-                        target_returns = y_ret.reshape(b_sz * h_sz, m_sz).mean(dim=-1)
-                        guard_metrics = compute_pattern_guard_losses(pred_returns, target_returns)
+                        loss, pred_ret, guard_metrics = compute_forecast_loss(
+                            model(x, sym, regime, teacher_targets=y_ret),
+                            y_ret, y_price, last_p, criterion, scale_t, mean_t, head_weights,
+                        )
                         if batch_idx % 200 == 0:
-                            pred_mean = pred_ret.mean().item()
-                            pred_std = guard_metrics['pred_std'].detach().item()
-                            vol_loss = guard_metrics['volatility_loss'].detach().item()
-                            curvature = guard_metrics['curvature_loss'].detach().item()
-                            acf1 = guard_metrics['acf1'].detach().item()
+                            pred_mean, pred_std, vol_loss, curvature, acf1 = torch.stack([
+                                pred_ret.detach().float().mean(),
+                                guard_metrics['pred_std'].detach().float(),
+                                guard_metrics['volatility_loss'].detach().float(),
+                                guard_metrics['curvature_loss'].detach().float(),
+                                guard_metrics['acf1'].detach().float(),
+                            ]).tolist()
                             batch_diag_data.append({
                                 'horizon': horizon_name,
                                 'stage': stage,
@@ -1719,24 +2815,31 @@ def train_single_horizon(
                                 logger.warning("High autocorrelation detected — possible repeating pattern")
                             if curvature < 0.005:
                                 logger.warning("Linear ramp pattern detected")
-                        pred_price = _reconstruct_prices(pred_ret, last_p, scale_t, mean_t)
-                        loss = criterion(pred_ret, y_ret, pred_price, y_price, last_p)
-                        loss = loss + guard_metrics['total_guard_loss']
                     if profile_sync_timing and device.type == 'cuda':
                         torch.cuda.synchronize(device)
                     timing.forward_s += time.perf_counter() - forward_t0
 
-                    if torch.isnan(pred_ret).any() or torch.isinf(pred_ret).any():
-                        n_nan_pred += 1
-
-                    if not torch.isfinite(loss):
+                    # All per-step skip decisions in one device->host read.
+                    loss_d = loss.detach()
+                    nan_pred, skip_nan, skip_extreme = torch.stack([
+                        ~torch.isfinite(pred_ret.detach()).all(),
+                        ~torch.isfinite(loss_d),
+                        loss_d > 1e6,
+                    ]).tolist()
+                    n_nan_pred += int(nan_pred)
+                    skip_extreme = skip_extreme and not skip_nan
+                    if distributed:
+                        # Every rank must take the same skip decision, or the next all-reduce deadlocks.
+                        skip_nan, skip_extreme = _ddp_any(skip_nan, skip_extreme)
+
+                    if skip_nan:
                         n_nan_loss += 1
                         ep_skip += 1
                         last_step_end = time.perf_counter()
                         if profiler is not None:
                             profiler.step()
                         continue
-                    if loss.item() > 1e6:
+                    if skip_extreme:
                         n_extreme += 1
                         ep_skip += 1
                         last_step_end = time.perf_counter()
@@ -1745,18 +2848,22 @@ def train_single_horizon(
                         continue
 
                     backward_t0 = time.perf_counter()
+                    step_now = (batch_idx + 1) % tuned_accum_steps == 0 or (batch_idx + 1) == stage_batches
                     scaled_loss = loss / tuned_accum_steps
-                    if grad_scaler is not None:
-                        grad_scaler.scale(scaled_loss).backward()
-                    else:
-                        scaled_loss.backward()
+                    # Accumulation micro-batches skip the gradient all-reduce under DDP.
+                    sync_ctx = model.no_sync() if (distributed and not step_now) else contextlib.nullcontext()
+                    with sync_ctx:
+                        if grad_scaler is not None:
+                            grad_scaler.scale(scaled_loss).backward()
+                        else:
+                            scaled_loss.backward()
                     if profile_sync_timing and device.type == 'cuda':
                         torch.cuda.synchronize(device)
                     timing.backward_s += time.perf_counter() - backward_t0
 
                     optim_t0 = time.perf_counter()
                     # Step optimizer every accum_steps batches (or at end of epoch)
-                    if (batch_idx + 1) % tuned_accum_steps == 0 or (batch_idx + 1) == stage_batches:
+                    if step_now:
                         if grad_scaler is not None:
                             grad_scaler.unscale_(optimizer)
                             try:
@@ -1769,7 +2876,7 @@ def train_single_horizon(
                                 grad_scaler.update()
                                 optimizer.zero_grad(set_to_none=True)
                                 scheduler.step()
-                                ep_loss += loss.item() * x.size(0)
+                                ep_loss_t += loss_d * x.size(0)
                                 ep_n += x.size(0)
                                 if profile_sync_timing and device.type == 'cuda':
                                     torch.cuda.synchronize(device)
@@ -1791,7 +2898,7 @@ def train_single_horizon(
                                 ep_skip += 1
                                 optimizer.zero_grad(set_to_none=True)
                                 scheduler.step()
-                                ep_loss += loss.item() * x.size(0)
+                                ep_loss_t += loss_d * x.size(0)
                                 ep_n += x.size(0)
                                 if profile_sync_timing and device.type == 'cuda':
                                     torch.cuda.synchronize(device)
@@ -1809,14 +2916,30 @@ def train_single_horizon(
                         torch.cuda.synchronize(device)
                     timing.optim_s += time.perf_counter() - optim_t0
 
-                    ep_loss += loss.item() * x.size(0)
+                    ep_loss_t += loss_d * x.size(0)
                     ep_n += x.size(0)
                     timing.batches += 1
+                    batches_since_save += 1
+                    if (state_writer is not None and checkpoint_every > 0 and step_now
+                            and batches_since_save >= checkpoint_every):
+                        state_writer.submit(_training_state(
+                            stage_idx, epoch, batch_idx + 1,
+                            epoch_acc={
+                                'ep_loss': ep_loss_t.item(), 'ep_n': ep_n, 'ep_skip': ep_skip,
+                                'n_nan_pred': n_nan_pred, 'n_nan_loss': n_nan_loss,
+                                'n_extreme': n_extreme, 'n_nan_grad': n_nan_grad,
+                            },
+                        ), state_path)
+                        batches_since_save = 0
                     last_step_end = time.perf_counter()
 
                     if profiler is not None:
                         profiler.step()
 
+            ep_loss = ep_loss_t.item()
+            if distributed:
+                ep_loss, ep_n = _ddp_sum(ep_loss, ep_n)
+                ep_n = int(ep_n)
             ep_loss = ep_loss / max(ep_n, 1)
             timing_metrics = timing.as_dict()
 
@@ -1830,130 +2953,139 @@ def train_single_horizon(
                     f"model weights are likely corrupted.")
                 break
 
-            val_loss, mae, rmse, dir_acc = evaluate_model(
-                model, verify_loader, criterion, device, use_amp,
-                scale_t, mean_t, amp_dtype,
-                use_gpu_prefetch=enable_gpu_prefetch,
-                channels_last=channels_last)
-            epoch_seconds = time.perf_counter() - epoch_start
-            current_lr = optimizer.param_groups[0]['lr']
-            logging.info(
-                f"{tag} Ep {epoch+1:3d} timing | data_wait={timing_metrics['data_wait_pct']:.1f}% "
-                f"h2d={timing_metrics['transfer_pct']:.1f}% "
-                f"fwd={timing_metrics['forward_pct']:.1f}% "
-                f"bwd={timing_metrics['backward_pct']:.1f}% "
-                f"gpu_util_est={timing_metrics['gpu_util_est_pct']:.1f}%"
-            )
-            logging.info(f"{tag} Ep {epoch+1:3d} | train={ep_loss:.5f} "
-                         f"val={val_loss:.5f} mae={mae:.5f} dir={dir_acc:.3f}")
-
-            # Periodic autoregressive validation (realistic, no teacher forcing)
-            if epoch % 3 == 0:
-                ar_loss, ar_mae, ar_dir = evaluate_autoregressive(
-                    model, verify_loader, criterion, device, use_amp,
-                    scale_t, mean_t, amp_dtype,
-                    use_gpu_prefetch=enable_gpu_prefetch,
-                    channels_last=channels_last)
-                logging.info(f"{tag} Ep {epoch+1:3d} | AR val={ar_loss:.5f} "
-                             f"ar_mae={ar_mae:.5f} ar_dir={ar_dir:.3f}")
-
-            if not math.isfinite(val_loss):
-                epoch_log_data.append({
-                    'horizon': horizon_name,
-                    'stage': stage,
-                    'stage_ratio': ratio,
-                    'epoch': epoch + 1,
-                    'n_sequences': len(stage_indices),
-                    'n_train_batches': stage_batches,
-                    'train_samples': ep_n,
-                    'train_loss': ep_loss,
-                    'val_loss': val_loss,
-                    'val_mae': mae,
-                    'val_rmse': rmse,
-                    'val_dir_acc': dir_acc,
-                    'ar_val_loss': ar_loss,
-                    'ar_val_mae': ar_mae,
-                    'ar_val_dir_acc': ar_dir,
-                    'learning_rate': current_lr,
-                    'epoch_seconds': epoch_seconds,
-                    'effective_batch_size': tuned_batch_size * tuned_accum_steps,
-                    'data_wait_pct': timing_metrics['data_wait_pct'],
-                    'transfer_pct': timing_metrics['transfer_pct'],
-                    'forward_pct': timing_metrics['forward_pct'],
-                    'backward_pct': timing_metrics['backward_pct'],
-                    'optim_pct': timing_metrics['optim_pct'],
-                    'gpu_util_est_pct': timing_metrics['gpu_util_est_pct'],
-                    'skipped_batches': ep_skip,
-                    'nan_loss_batches': n_nan_loss,
-                    'extreme_loss_batches': n_extreme,
-                    'nan_pred_batches': n_nan_pred,
-                    'nan_grad_batches': n_nan_grad,
-                    'best_stage_val_so_far': best_stage,
-                    'best_global_val_so_far': min(best_global_val, best_stage),
-                    'is_best_stage_epoch': False,
-                })
-                logging.error(
-                    f"{tag} Stage {stage} Ep {epoch+1}: validation collapsed to non-finite loss; "
-                    f"restoring best checkpoint for this stage."
+            stop_stage = False
+            if is_main_rank:
+                val_loss, mae, rmse, dir_acc = _validate(evaluate_model, eval_model)
+                epoch_seconds = time.perf_counter() - epoch_start
+                current_lr = optimizer.param_groups[0]['lr']
+                logging.info(
+                    f"{tag} Ep {epoch+1:3d} timing | data_wait={timing_metrics['data_wait_pct']:.1f}% "
+                    f"h2d={timing_metrics['transfer_pct']:.1f}% "
+                    f"fwd={timing_metrics['forward_pct']:.1f}% "
+                    f"bwd={timing_metrics['backward_pct']:.1f}% "
+                    f"gpu_util_est={timing_metrics['gpu_util_est_pct']:.1f}%"
                 )
+                logging.info(f"{tag} Ep {epoch+1:3d} | train={ep_loss:.5f} "
+                             f"val={val_loss:.5f} mae={mae:.5f} dir={dir_acc:.3f}")
+
+                # Periodic autoregressive validation (realistic, no teacher forcing)
+                if epoch % 3 == 0:
+                    ar_loss, ar_mae, ar_dir = _validate(evaluate_autoregressive, eval_model)
+                    logging.info(f"{tag} Ep {epoch+1:3d} | AR val={ar_loss:.5f} "
+                                 f"ar_mae={ar_mae:.5f} ar_dir={ar_dir:.3f}")
+
+                if not math.isfinite(val_loss):
+                    epoch_log_data.append({
+                        'horizon': horizon_name,
+                        'stage': stage,
+                        'stage_ratio': ratio,
+                        'epoch': epoch + 1,
+                        'n_sequences': len(stage_indices),
+                        'n_train_batches': stage_batches,
+                        'train_samples': ep_n,
+                        'train_loss': ep_loss,
+                        'val_loss': val_loss,
+                        'val_mae': mae,
+                        'val_rmse': rmse,
+                        'val_dir_acc': dir_acc,
+                        'ar_val_loss': ar_loss,
+                        'ar_val_mae': ar_mae,
+                        'ar_val_dir_acc': ar_dir,
+                        'learning_rate': current_lr,
+                        'epoch_seconds': epoch_seconds,
+                        'effective_batch_size': tuned_batch_size * tuned_accum_steps,
+                        'data_wait_pct': timing_metrics['data_wait_pct'],
+                        'transfer_pct': timing_metrics['transfer_pct'],
+                        'forward_pct': timing_metrics['forward_pct'],
+                        'backward_pct': timing_metrics['backward_pct'],
+                        'optim_pct': timing_metrics['optim_pct'],
+                        'gpu_util_est_pct': timing_metrics['gpu_util_est_pct'],
+                        'skipped_batches': ep_skip,
+                        'nan_loss_batches': n_nan_loss,
+                        'extreme_loss_batches': n_extreme,
+                        'nan_pred_batches': n_nan_pred,
+                        'nan_grad_batches': n_nan_grad,
+                        'best_stage_val_so_far': best_stage,
+                        'best_global_val_so_far': min(best_global_val, best_stage),
+                        'is_best_stage_epoch': False,
+                    })
+                    logging.error(
+                        f"{tag} Stage {stage} Ep {epoch+1}: validation collapsed to non-finite loss; "
+                        f"restoring best checkpoint for this stage."
+                    )
+                    stop_stage = True
+                else:
+                    is_best_stage_epoch = False
+                    if val_loss < best_stage:
+                        best_stage = val_loss
+                        is_best_stage_epoch = True
+                        torch.save(eval_model.state_dict(), ckpt_path)
+                        pat_ctr = 0
+                    else:
+                        pat_ctr += 1
+
+                    epoch_log_data.append({
+                        'horizon': horizon_name,
+                        'stage': stage,
+                        'stage_ratio': ratio,
+                        'epoch': epoch + 1,
+                        'n_sequences': len(stage_indices),
+                        'n_train_batches': stage_batches,
+                        'train_samples': ep_n,
+                        'train_loss': ep_loss,
+                        'val_loss': val_loss,
+                        'val_mae': mae,
+                        'val_rmse': rmse,
+                        'val_dir_acc': dir_acc,
+                        'ar_val_loss': ar_loss,
+                        'ar_val_mae': ar_mae,
+                        'ar_val_dir_acc': ar_dir,
+                        'learning_rate': current_lr,
+                        'epoch_seconds': epoch_seconds,
+                        'effective_batch_size': tuned_batch_size * tuned_accum_steps,
+                        'data_wait_pct': timing_metrics['data_wait_pct'],
+                        'transfer_pct': timing_metrics['transfer_pct'],
+                        'forward_pct': timing_metrics['forward_pct'],
+                        'backward_pct': timing_metrics['backward_pct'],
+                        'optim_pct': timing_metrics['optim_pct'],
+                        'gpu_util_est_pct': timing_metrics['gpu_util_est_pct'],
+                        'skipped_batches': ep_skip,
+                        'nan_loss_batches': n_nan_loss,
+                        'extreme_loss_batches': n_extreme,
+                        'nan_pred_batches': n_nan_pred,
+                        'nan_grad_batches': n_nan_grad,
+                        'best_stage_val_so_far': best_stage,
+                        'best_global_val_so_far': min(best_global_val, best_stage),
+                        'is_best_stage_epoch': is_best_stage_epoch,
+                    })
+
+                    if pat_ctr >= patience:
+                        logging.info(f"{tag} Early stop at epoch {epoch+1}")
+                        stop_stage = True
+
+                epochs_done += 1
+                if epoch_callback is not None and epoch_callback(epochs_done, val_loss):
+                    logging.info(f"{tag} Pruned after {epochs_done} epochs (val={val_loss:.5f})")
+                    pruned = stop_stage = True
+
+            if distributed:
+                stop_stage, pruned = _ddp_any(stop_stage, pruned)
+            if stop_stage:
                 break
+            if state_writer is not None:
+                state_writer.submit(_training_state(stage_idx, epoch + 1, 0), state_path)
+
+        if is_main_rank and os.path.exists(ckpt_path):
+            eval_model.load_state_dict(torch.load(ckpt_path, weights_only=True))
+        if distributed:
+            # Other ranks may not see rank 0's filesystem (multi-node); ship the weights instead.
+            _ddp_broadcast_state(eval_model)
+            if not is_main_rank:
+                if pruned:
+                    break
+                continue
 
-            is_best_stage_epoch = False
-            if val_loss < best_stage:
-                best_stage = val_loss
-                is_best_stage_epoch = True
-                torch.save(model.state_dict(), ckpt_path)
-                pat_ctr = 0
-            else:
-                pat_ctr += 1
-
-            epoch_log_data.append({
-                'horizon': horizon_name,
-                'stage': stage,
-                'stage_ratio': ratio,
-                'epoch': epoch + 1,
-                'n_sequences': len(stage_indices),
-                'n_train_batches': stage_batches,
-                'train_samples': ep_n,
-                'train_loss': ep_loss,
-                'val_loss': val_loss,
-                'val_mae': mae,
-                'val_rmse': rmse,
-                'val_dir_acc': dir_acc,
-                'ar_val_loss': ar_loss,
-                'ar_val_mae': ar_mae,
-                'ar_val_dir_acc': ar_dir,
-                'learning_rate': current_lr,
-                'epoch_seconds': epoch_seconds,
-                'effective_batch_size': tuned_batch_size * tuned_accum_steps,
-                'data_wait_pct': timing_metrics['data_wait_pct'],
-                'transfer_pct': timing_metrics['transfer_pct'],
-                'forward_pct': timing_metrics['forward_pct'],
-                'backward_pct': timing_metrics['backward_pct'],
-                'optim_pct': timing_metrics['optim_pct'],
-                'gpu_util_est_pct': timing_metrics['gpu_util_est_pct'],
-                'skipped_batches': ep_skip,
-                'nan_loss_batches': n_nan_loss,
-                'extreme_loss_batches': n_extreme,
-                'nan_pred_batches': n_nan_pred,
-                'nan_grad_batches': n_nan_grad,
-                'best_stage_val_so_far': best_stage,
-                'best_global_val_so_far': min(best_global_val, best_stage),
-                'is_best_stage_epoch': is_best_stage_epoch,
-            })
-
-            if pat_ctr >= patience:
-                logging.info(f"{tag} Early stop at epoch {epoch+1}")
-                break
-
-        if os.path.exists(ckpt_path):
-            model.load_state_dict(torch.load(ckpt_path, weights_only=True))
-
-        val_loss, mae, rmse, dir_acc = evaluate_model(
-            model, verify_loader, criterion, device, use_amp,
-            scale_t, mean_t, amp_dtype,
-            use_gpu_prefetch=enable_gpu_prefetch,
-            channels_last=channels_last)
+        val_loss, mae, rmse, dir_acc = _validate(evaluate_model, eval_model)
         logging.info(f"{tag} Stage {stage} Final | val={val_loss:.5f} mae={mae:.5f} "
                      f"rmse={rmse:.5f} dir={dir_acc:.4f}")
 
@@ -1968,6 +3100,15 @@ def train_single_horizon(
             best_global_val = val_loss
             if os.path.exists(ckpt_path):
                 shutil.copy(ckpt_path, os.path.join(horizon_output, 'best_model.pth'))
+                if horizon_set:
+                    export_horizon_checkpoints(eval_model, output_dir)
+
+        state_writer.submit(_training_state(stage_idx + 1, 0, 0, stage_state=False), state_path)
+        if pruned:
+            break
+
+    if not is_main_rank:
+        return
 
     pd.DataFrame(log_data).to_csv(
         os.path.join(log_dir, f'training_log_{horizon_name}.csv'), index=False)
@@ -1980,10 +3121,104 @@ def train_single_horizon(
     status = 'success' if math.isfinite(best_global_val) else 'failed'
     if status == 'failed':
         logging.error(f"{tag} COMPLETE | No finite validation checkpoint was produced.")
+    elif pruned:
+        status = 'pruned'
+        logging.info(f"{tag} PRUNED | Best Val Loss: {best_global_val:.5f}")
     else:
         logging.info(f"{tag} COMPLETE | Best Val Loss: {best_global_val:.5f}")
     results[horizon_name] = {'status': status, 'best_val_loss': best_global_val}
 
+    state_writer.close()
+    atomic_torch_save({
+        'version': TRAIN_STATE_VERSION,
+        'completed': True,
+        'result': results[horizon_name],
+    }, state_path)
+
+
+def _wrap_ddp(model):
+    # build_predictor ties decoder_gru_cell to the parallel GRU, so every
+    # parameter receives a gradient under teacher forcing.
+    return DistributedDataParallel(model)
+
+
+def _unwrap_model(model):
+    return model.module if isinstance(model, DistributedDataParallel) else model
+
+
+# Every tensor handed to a gloo collective stays referenced here until the process group
+# is destroyed (_ddp_worker).  A gloo thread that drops the last reference to a
+# Python-owned tensor needs the GIL, which destroy_process_group holds while it joins
+# that thread: the two deadlock.
+_DDP_HELD_TENSORS = []
+
+
+def _ddp_hold(tensor):
+    _DDP_HELD_TENSORS.append(tensor)
+    return tensor
+
+
+def _ddp_any(*flags):
+    """Logical OR of each flag across all ranks."""
+    t = _ddp_hold(torch.tensor([float(bool(f)) for f in flags]))
+    dist.all_reduce(t, op=dist.ReduceOp.MAX)
+    return tuple(bool(v) for v in t.tolist())
+
+
+def _ddp_agree(*flags):
+    """True, on every rank, when all ranks hold the same flags."""
+    local = [float(bool(f)) for f in flags]
+    t = _ddp_hold(torch.tensor(local + [-v for v in local]))
+    dist.all_reduce(t, op=dist.ReduceOp.MAX)
+    highest, lowest = t[:len(local)], -t[len(local):]
+    return bool((highest == lowest).all())
+
+
+def _ddp_sum(*values):
+    t = _ddp_hold(torch.tensor([float(v) for v in values], dtype=torch.float64))
+    dist.all_reduce(t, op=dist.ReduceOp.SUM)
+    return tuple(t.tolist())
+
+
+def _ddp_broadcast_state(module):
+    """Overwrite every rank's parameters/buffers with rank 0's, in place."""
+    for tensor in module.state_dict().values():
+        dist.broadcast(_ddp_hold(tensor), src=0)
+
+
+def _ddp_worker(local_rank, nprocs, node_rank, nnodes, run_plan, worker_kwargs, results_path):
+    """
+    One --ddp_cpu rank (mp.spawn target). Rendezvous is env:// (MASTER_ADDR /
+    MASTER_PORT); the shared tensors are re-mapped from worker_kwargs['array_dir'].
+    """
+    rank = node_rank * nprocs + local_rank
+    dist.init_process_group('gloo', rank=rank, world_size=nnodes * nprocs)
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // nprocs))
+    if rank != 0:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    shared_inputs = build_shared_inputs(open_array_maps(worker_kwargs['array_dir']))
+    results = {}
+    try:
+        for h_name, h_days in run_plan.items():
+            # The previous horizon's collectives are long finished; only the last ones
+            # need their tensors held through destroy_process_group.
+            _DDP_HELD_TENSORS.clear()
+            # No _safe wrapper: a rank that swallowed an exception would leave the
+            # others blocked in the next collective; let mp.spawn tear the group down.
+            train_single_horizon(
+                horizon_name=h_name, horizon=h_days, results=results, distributed=True,
+                **shared_inputs, **worker_kwargs,
+            )
+        if rank == 0:
+            with open(results_path, 'w') as f:
+                json.dump(results, f)
+        # Every rank leaves the last collective before any rank tears the group down.
+        dist.barrier()
+    finally:
+        dist.destroy_process_group()
+        _DDP_HELD_TENSORS.clear()
+
 
 def _train_single_horizon_safe(**kwargs):
     """Wrapper that prevents per-horizon crashes from dropping global results."""
@@ -2029,6 +3264,203 @@ def _train_single_horizon_safe(**kwargs):
             }
 
 
+# ============================================================
+# 10b. Incremental fine-tuning — TUNE-1 (--finetune_from)
+# ============================================================
+def finetune_single_horizon(
+    horizon_name, horizon,
+    # Shared tensors (CPU)
+    X_tensor, sym_tensor, regime_tensor,
+    Y_ret_tensor, Y_price_tensor, last_price_tensor,
+    row_pos, run_len, idx_to_date,
+    scaler_Y,
+    num_symbols, num_features, lookback, target_cols,
+    # Fine-tune config
+    finetune_from, since, epochs, learning_rate, holdout_days, batch_size,
+    device, use_amp, amp_dtype,
+    checkpoint_dir, output_dir, log_dir,
+    loader_kwargs, cpu_prefetch_queue,
+    results,
+    horizon_set=None,
+    horizon_weights=None,
+    array_dir=None,
+):
+    """
+        Continue <finetune_from>/<horizon_name>/best_model.pth on the windows
+        whose targets reach past `since` (the newly ingested bars).
+
+        A few constant low-LR epochs, no curriculum or batch-size tuning.  The
+        holdout is the `holdout_days` most recent anchor dates whose targets were
+        already known at `since`; the best epoch replaces
+        <output_dir>/<horizon_name>/best_model.pth only if its holdout loss does
+        not exceed the base model's.
+    """
+    tag = f"[{horizon_name}]"
+    base_path      = os.path.join(finetune_from, horizon_name, 'best_model.pth')
+    horizon_output = os.path.join(output_dir, horizon_name)
+    horizon_ckpt   = os.path.join(checkpoint_dir, horizon_name)
+    promoted_path  = os.path.join(horizon_output, 'best_model.pth')
+    os.makedirs(horizon_output, exist_ok=True)
+    os.makedirs(horizon_ckpt, exist_ok=True)
+
+    if not os.path.exists(base_path):
+        logging.error(f"{tag} No base checkpoint at {base_path}; run a full training first.")
+        results[horizon_name] = {'status': 'failed', 'best_val_loss': float('inf'), 'error': 'no_base_checkpoint'}
+        return
+
+    # ---- New windows (targets include a bar after `since`) vs recent realised holdout ----
+    valid_indices = horizon_valid_indices(row_pos, run_len, lookback, horizon)
+    target_end    = idx_to_date[valid_indices + horizon]
+    new_indices   = valid_indices[target_end > since]
+    seen_indices  = valid_indices[target_end <= since]
+    holdout_dates = np.unique(idx_to_date[seen_indices])[-holdout_days:]
+    holdout_indices = seen_indices[idx_to_date[seen_indices] >= holdout_dates[0]] if len(holdout_dates) else seen_indices
+    logging.info(f"{tag} Fine-tune windows: new={len(new_indices)} holdout={len(holdout_indices)} "
+                 f"(targets after {pd.Timestamp(since)})")
+
+    horizon_weights = dict(horizon_weights or {h: 1.0 for h in horizon_set}) if horizon_set else None
+    head_weights = horizon_weights or {horizon: 1.0}
+    model = build_predictor(
+        num_symbols, num_features, lookback, horizon, len(target_cols), horizon_set=horizon_set,
+    ).to(device)
+    model.load_state_dict(torch.load(base_path, map_location=device, weights_only=True))
+
+    def _publish(state_dict):
+        model.load_state_dict(state_dict)
+        atomic_torch_save(model.state_dict(), promoted_path)
+        if horizon_set:
+            export_horizon_checkpoints(model, output_dir)
+
+    same_dir = os.path.abspath(base_path) == os.path.abspath(promoted_path)
+    if len(new_indices) == 0 or len(holdout_indices) == 0:
+        if len(new_indices) == 0:
+            logging.info(f"{tag} No windows with new targets; keeping the base model.")
+        else:
+            logging.error(f"{tag} Empty holdout; refusing to promote without a regression check.")
+        if not same_dir:
+            _publish(model.state_dict())
+        results[horizon_name] = {
+            'status': 'success' if len(new_indices) == 0 else 'failed',
+            'best_val_loss': float('nan'), 'promoted': False, 'new_windows': int(len(new_indices)),
+        }
+        return
+
+    criterion = CombinedForecastLoss(alpha=0.7, beta=0.2, gamma=0.5)
+    scale_t = torch.tensor(scaler_Y.scale_.astype(np.float32), device=device)
+    mean_t  = torch.tensor(scaler_Y.mean_.astype(np.float32),  device=device)
+    collator = TemporalBatchCollator(
+        X_tensor=X_tensor,
+        sym_tensor=sym_tensor,
+        regime_tensor=regime_tensor,
+        Y_ret_tensor=Y_ret_tensor,
+        Y_price_tensor=Y_price_tensor,
+        last_price_tensor=last_price_tensor,
+        lookback=lookback,
+        forecast_horizon=horizon,
+        array_dir=array_dir,
+    )
+
+    def _loader(indices, shuffle):
+        return build_temporal_loader(
+            anchor_dataset=TemporalAnchorDataset(indices),
+            collator=collator,
+            batch_size=batch_size,
+            shuffle=shuffle,
+            drop_last=False,
+            loader_kwargs=loader_kwargs,
+            cpu_prefetch_queue=cpu_prefetch_queue,
+        )
+
+    train_loader   = _loader(new_indices, shuffle=True)
+    holdout_loader = _loader(holdout_indices, shuffle=False)
+
+    def _holdout_loss():
+        return evaluate_heads(
+            evaluate_model, model, holdout_loader, criterion, device, use_amp, scale_t, mean_t,
+            amp_dtype, head_weights=horizon_weights, tag=tag,
+        )[0]
+
+    base_val = _holdout_loss()
+    logging.info(f"{tag} Base model holdout val={base_val:.5f}")
+
+    optimizer = optim.AdamW(model.parameters(), lr=learning_rate, weight_decay=1e-4)
+    grad_scaler = torch.amp.GradScaler('cuda') if (use_amp and amp_dtype == torch.float16) else None
+    best_val, best_state = float('inf'), None
+    log_data = []
+    for epoch in range(epochs):
+        epoch_start = time.perf_counter()
+        model.train()
+        ep_n = ep_skip = 0
+        ep_loss_t = torch.zeros((), dtype=torch.float64, device=device)
+        for batch in train_loader:
+            x, sym, regime, y_ret, y_price, last_p = _move_batch_to_device(batch, device)
+            with torch.amp.autocast('cuda', enabled=use_amp, dtype=amp_dtype):
+                loss, _, _ = compute_forecast_loss(
+                    model(x, sym, regime, teacher_targets=y_ret),
+                    y_ret, y_price, last_p, criterion, scale_t, mean_t, head_weights,
+                )
+            if not torch.isfinite(loss):
+                ep_skip += 1
+                continue
+            optimizer.zero_grad(set_to_none=True)
+            if grad_scaler is not None:
+                grad_scaler.scale(loss).backward()
+                grad_scaler.unscale_(optimizer)
+                torch.nn.utils.clip_grad_norm_(model.parameters(), 1.0)
+                grad_scaler.step(optimizer)
+                grad_scaler.update()
+            else:
+                loss.backward()
+                torch.nn.utils.clip_grad_norm_(model.parameters(), 1.0)
+                optimizer.step()
+            ep_loss_t += loss.detach() * x.size(0)
+            ep_n += x.size(0)
+
+        ep_loss = ep_loss_t.item()
+        val_loss = _holdout_loss()
+        is_best = math.isfinite(val_loss) and val_loss < best_val
+        if is_best:
+            best_val = val_loss
+            best_state = {k: v.detach().clone() for k, v in model.state_dict().items()}
+        logging.info(f"{tag} Fine-tune ep {epoch+1}/{epochs} | train={ep_loss / max(ep_n, 1):.5f} "
+                     f"holdout={val_loss:.5f} (base {base_val:.5f})")
+        log_data.append({
+            'horizon': horizon_name,
+            'epoch': epoch + 1,
+            'new_windows': len(new_indices),
+            'holdout_windows': len(holdout_indices),
+            'train_samples': ep_n,
+            'train_loss': ep_loss / max(ep_n, 1),
+            'skipped_batches': ep_skip,
+            'holdout_val_loss': val_loss,
+            'base_val_loss': base_val,
+            'learning_rate': learning_rate,
+            'epoch_seconds': time.perf_counter() - epoch_start,
+            'is_best_epoch': is_best,
+        })
+
+    pd.DataFrame(log_data).to_csv(os.path.join(log_dir, f'finetune_log_{horizon_name}.csv'), index=False)
+
+    promoted = best_state is not None and best_val <= base_val
+    if best_state is not None:
+        atomic_torch_save(best_state, os.path.join(horizon_ckpt, 'finetune_candidate.pth'))
+    if promoted:
+        _publish(best_state)
+        logging.info(f"{tag} Promoted fine-tuned model: holdout {base_val:.5f} -> {best_val:.5f}")
+    else:
+        logging.warning(f"{tag} Fine-tuned holdout {best_val:.5f} regressed vs base {base_val:.5f}; "
+                        f"keeping the base model.")
+        if not same_dir:
+            _publish(torch.load(base_path, map_location=device, weights_only=True))
+    results[horizon_name] = {
+        'status': 'success',
+        'best_val_loss': best_val if promoted else base_val,
+        'base_val_loss': base_val,
+        'promoted': promoted,
+        'new_windows': int(len(new_indices)),
+    }
+
+
 # ============================================================
 # 11. Pipeline
 # ============================================================
@@ -2076,8 +3508,23 @@ def main():
     parser.add_argument("--device",             type=str,   default="cuda")
     parser.add_argument("--mixed_precision",    type=_str_to_bool, default=True)
     parser.add_argument("--iterative_training", type=_str_to_bool, default=True)
+    parser.add_argument("--shared_encoder",     type=_str_to_bool, default=False,
+                        help="Train all horizons in one data pass: one MultiHorizonPredictor at max(horizons) "
+                             "whose decoder prefixes serve every horizon; written to "
+                             f"<output_dir>/{SHARED_ENCODER_DIR}/ with per-horizon copies in "
+                             f"<output_dir>/{SHARED_ENCODER_DIR}/{{h}}d/")
+    parser.add_argument("--horizon_weights",    type=str,   default=None,
+                        help="Comma-separated loss weights aligned with --horizons for --shared_encoder; "
+                             "horizon h is scored on the first h decode steps (default: all 1.0)")
     parser.add_argument("--parallel_training",  type=_str_to_bool, default=False,
                         help="Deprecated. Ignored: training is always sequential for throughput stability")
+    parser.add_argument("--ddp_cpu",            type=int,   default=0,
+                        help="CPU data-parallel: launch N gloo DDP processes on this node (0 = off). "
+                             "Rendezvous via MASTER_ADDR/MASTER_PORT (default 127.0.0.1:29500)")
+    parser.add_argument("--ddp_nnodes",         type=int,   default=1,
+                        help="Number of nodes taking part in --ddp_cpu training")
+    parser.add_argument("--ddp_node_rank",      type=int,   default=0,
+                        help="Rank of this node (0 writes checkpoints and the summary)")
     parser.add_argument("--mode",               type=str,   default="high_throughput",
                         choices=["high_throughput", "low_memory"],
                         help="Runtime mode toggle")
@@ -2094,11 +3541,33 @@ def main():
     parser.add_argument("--profile_sync_timing", type=_str_to_bool, default=False,
                         help="Synchronize CUDA for more accurate per-stage timing (slower)")
     parser.add_argument("--checkpoint_dir",     type=str,   default="models/")
+    parser.add_argument("--resume",             type=_str_to_bool, default=False,
+                        help="Continue each horizon from <checkpoint_dir>/<horizon>/train_state.pt "
+                             "(finished horizons are skipped)")
+    parser.add_argument("--checkpoint_every",   type=int,   default=500,
+                        help="Batches between background resumable-state writes (0 = epoch ends only)")
     parser.add_argument("--log_dir",            type=str,   default="logs/")
     parser.add_argument("--output_dir",         type=str,   default="output_model/")
+    parser.add_argument("--cache_dir",          type=str,   default=None,
+                        help="Columnar cache of preprocessed arrays; reused (memory-mapped) when "
+                             "source files, feature schema and --verify_split are unchanged")
+    parser.add_argument("--feature_store",      type=str,   default=None,
+                        help="Feature store root (feature_store.py): the preprocessed rows for the "
+                             "current CSVs are memory-mapped from it, materialised on first use")
+    parser.add_argument("--finetune_from",      type=str,   default=None,
+                        help="Fine-tune the models in this output dir on newly ingested bars, reusing "
+                             "its scalers/symbol mapping, instead of training from scratch")
+    parser.add_argument("--finetune_since",     type=str,   default=None,
+                        help=f"Last date already trained on (default: {DATA_RANGE_FILE} in --finetune_from)")
+    parser.add_argument("--finetune_epochs",    type=int,   default=3)
+    parser.add_argument("--finetune_lr",        type=float, default=0.00005)
+    parser.add_argument("--finetune_holdout_days", type=int, default=20,
+                        help="Recent anchor dates (targets already known) used to gate promotion")
     args = parser.parse_args()
 
     device   = torch.device(args.device if torch.cuda.is_available() else 'cpu')
+    if args.ddp_cpu > 0:
+        device = torch.device('cpu')
     use_amp  = args.mixed_precision and device.type == 'cuda'
     amp_dtype = torch.bfloat16 if (use_amp and torch.cuda.is_bf16_supported()) else torch.float16
     is_iterative = args.iterative_training
@@ -2119,6 +3588,29 @@ def main():
         h = int(h.strip())
         horizons[f"{h}d"] = h
     logging.info(f"Horizons to train: {horizons}")
+    if args.horizon_weights:
+        weights = [float(w) for w in args.horizon_weights.split(',')]
+        if len(weights) != len(horizons):
+            raise ValueError("--horizon_weights must have one value per --horizons entry")
+        if min(weights) < 0 or max(weights) <= 0:
+            raise ValueError("--horizon_weights must be non-negative with at least one positive weight")
+    else:
+        weights = [1.0] * len(horizons)
+    # Zero-weight horizons are still served (prefixes) but neither trained on nor validated.
+    horizon_weights = {h: w for h, w in zip(horizons.values(), weights) if w > 0}
+
+    reference = finetune_since = None
+    if args.finetune_from:
+        if args.ddp_cpu > 0:
+            raise ValueError("--finetune_from runs in a single process; drop --ddp_cpu")
+        reference = load_shared_artefacts(args.finetune_from)
+        finetune_since = args.finetune_since or (reference['data_range'] or {}).get('last_date')
+        if finetune_since is None:
+            raise ValueError(f"{args.finetune_from} has no {DATA_RANGE_FILE}; pass --finetune_since")
+        finetune_since = pd.Timestamp(finetune_since)
+        if finetune_since.tzinfo is not None:
+            finetune_since = finetune_since.tz_convert('UTC').tz_localize(None)
+        logging.info(f"Fine-tuning {args.finetune_from} on bars after {finetune_since}")
 
     for d in [args.checkpoint_dir, args.log_dir, args.output_dir]:
         os.makedirs(d, exist_ok=True)
@@ -2129,7 +3621,9 @@ def main():
     is_windows = os.name == 'nt'
     if args.num_workers == -1:
         cpu_total = os.cpu_count() or 8
-        if args.mode == 'high_throughput':
+        if args.ddp_cpu > 0:
+            num_workers = 0  # every rank is already its own process; collation is index_select only
+        elif args.mode == 'high_throughput':
             num_workers = max(2, min(8, cpu_total // 2)) if is_windows else max(4, min(16, cpu_total // 2))
         else:
             num_workers = 0 if is_windows else 1
@@ -2167,115 +3661,41 @@ def main():
     # ================================================================
     # Shared data preparation (single pass, reused by all horizons)
     # ================================================================
-    logging.info("Loading datasets...")
-    metrics_df = pd.read_csv(args.dataset)
-    prices_df  = pd.read_csv(args.prices)
-    metrics_df['time'] = pd.to_datetime(metrics_df['time'], utc=True)
-    prices_df['time']  = pd.to_datetime(prices_df['time'],  utc=True)
-
-    df = pd.merge(metrics_df, prices_df, on=['symbol', 'time'], how='inner')
-    del metrics_df, prices_df  # free source DataFrames immediately
-    if df.empty:
-        raise ValueError("Merged dataset is empty — check 'time' and 'symbol' columns match.")
-    df = df.sort_values(['symbol', 'time']).reset_index(drop=True)
-
-    unique_symbols = df['symbol'].unique()
-    sym2id = {s: i for i, s in enumerate(unique_symbols)}
-    df['symbol_id'] = df['symbol'].map(sym2id)
-    with open(os.path.join(args.output_dir, 'symbol_mapping.json'), 'w') as f:
-        json.dump(sym2id, f, indent=4)
-
-    target_cols    = ['open', 'high', 'low', 'close']
-    raw_price_cols = [f'raw_{c}' for c in target_cols]
-    features = list(FEATURE_SCHEMA)
-    validate_feature_schema(features)
-
-    # ---- RAM-3: vectorised pandas preprocessing (no joblib workers) ----
-    logging.info("Preprocessing features (vectorised pandas)...")
-    df = _vectorised_preprocess(df, target_cols, raw_price_cols)
-
-    def _normalize_symbol_group(group: pd.DataFrame) -> pd.DataFrame:
-        norm = normalize_features(group)
-        norm.index = group.index
-        return norm[features]
-
-    normalized_features = df.groupby('symbol', group_keys=False).apply(_normalize_symbol_group)
-    df[features] = normalized_features[features]
-
-    df.replace([np.inf, -np.inf], np.nan, inplace=True)
-    df[features] = df.groupby('symbol')[features].ffill().bfill()
-    df[raw_price_cols] = df.groupby('symbol')[raw_price_cols].ffill().bfill()
-
-    for _symbol, grp in df.groupby('symbol', sort=False):
-        assert_sequence_integrity(grp[['time'] + features], seq_len=1)
-
-    # ---- RAM-2: cast ALL numeric data to float32 before tensor/scaler work ----
-    logging.info("Casting all numeric columns to float32...")
-    df[features]       = df[features].astype('float32')
-    df[raw_price_cols] = df[raw_price_cols].astype('float32')
-
-    with open(os.path.join(args.output_dir, 'features.json'), 'w') as f:
-        json.dump(features, f, indent=4)
-
-    # ---- Horizon-independent temporal split ----
-    all_dates = df['time'].drop_duplicates().sort_values().values
-    split_pos = max(1, int(len(all_dates) * (1.0 - args.verify_split)))
-    cutoff_date = pd.Timestamp(all_dates[min(split_pos, len(all_dates) - 1)], tz='UTC')
-    train_mask  = df['time'] < cutoff_date
-    logging.info(f"Train/val temporal cutoff: {cutoff_date}")
-
-    # ---- Volatility regimes ----
-    vol_col = 'volatility'
-    q33 = df.loc[train_mask, vol_col].quantile(0.33)
-    q66 = df.loc[train_mask, vol_col].quantile(0.66)
-    df['regime'] = 0
-    df.loc[df[vol_col] > q33, 'regime'] = 1
-    df.loc[df[vol_col] > q66, 'regime'] = 2
-
-    # ---- RAM-4: deferred sklearn import — keeps workers from loading full stack ----
-    def build_scalers(df, train_mask, features, target_cols, output_dir):
-        from sklearn.preprocessing import StandardScaler
-        import joblib as _joblib
-        scaler_X = StandardScaler()
-        scaler_X.fit(df.loc[train_mask, features].values)
-        df[features] = scaler_X.transform(df[features].values)
-        scaler_Y = StandardScaler()
-        scaler_Y.fit(df.loc[train_mask, target_cols].values)
-        df[target_cols] = scaler_Y.transform(df[target_cols].values)
-        _joblib.dump(scaler_X, os.path.join(output_dir, 'scaler_X.pkl'))
-        _joblib.dump(scaler_Y, os.path.join(output_dir, 'scaler_Y.pkl'))
-        logging.info("Scalers saved.")
-        return scaler_X, scaler_Y
-
-    scaler_X, scaler_Y = build_scalers(df, train_mask, features, target_cols, args.output_dir)
+    prepared = load_or_prepare_dataset(
+        args.dataset, args.prices, args.verify_split, cache_dir=args.cache_dir, reference=reference,
+        feature_store=args.feature_store,
+    )
+    write_shared_artefacts(args.output_dir, prepared)
+    if reference is None:
+        write_data_range(args.output_dir, prepared['time'], prepared['cutoff_date'])
+
+    # Spawned DataLoader workers / DDP ranks would otherwise each receive a pickled copy of the tensors.
+    spill_dir = None
+    if prepared.get('array_dir') is None and (num_workers > 0 or args.ddp_cpu > 0):
+        spill_dir = tempfile.mkdtemp(prefix='arrays_', dir=args.checkpoint_dir)
+        spill_arrays_to_disk(prepared, spill_dir)
+        logging.info(f"Shared tensors memory-mapped from {spill_dir}")
+    array_dir = prepared.get('array_dir')
+
+    sym2id      = prepared['sym2id']
+    features    = prepared['features']
+    target_cols = prepared['target_cols']
+    cutoff_date = prepared['cutoff_date']
+    scaler_Y    = prepared['scaler_Y']
 
     # ---- Shared tensors on CPU (read-only across threads) ----
-    # RAM note: only the flat [N_rows, F] tensors live here — no windows pre-expanded.
-    X_tensor          = torch.tensor(df[features].values,       dtype=torch.float32)
-    Y_ret_tensor      = torch.tensor(df[target_cols].values,    dtype=torch.float32)
-    Y_price_tensor    = torch.tensor(df[raw_price_cols].values, dtype=torch.float32)
-    last_price_tensor = Y_price_tensor
-    sym_tensor        = torch.tensor(df['symbol_id'].values,    dtype=torch.long)
-    regime_tensor     = torch.tensor(df['regime'].values,       dtype=torch.long)
-    idx_to_date       = df['time'].values
-    del df  # free the full DataFrame once tensors are built
-
-    # Pre-compute per-symbol index arrays (used by each horizon worker)
-    df_groups = []
-    # Reconstruct per-symbol index ranges from sym_tensor
-    sym_np = sym_tensor.numpy()
-    for sid in range(len(sym2id)):
-        df_groups.append(np.where(sym_np == sid)[0])
+    # from_numpy shares memory, so memory-mapped arrays are not copied here.
+    # Row layout + date ranks are horizon-independent; each horizon derives anchors/stages from them.
+    shared_inputs = build_shared_inputs(prepared)
+    del prepared
 
     # ================================================================
     # Launch training — sequential per horizon (throughput-optimized)
     # ================================================================
     results = {}
     shared_kwargs = dict(
-        X_tensor=X_tensor, sym_tensor=sym_tensor, regime_tensor=regime_tensor,
-        Y_ret_tensor=Y_ret_tensor, Y_price_tensor=Y_price_tensor,
-        last_price_tensor=last_price_tensor,
-        df_groups=df_groups, idx_to_date=idx_to_date, cutoff_date=cutoff_date,
+        **shared_inputs,
+        cutoff_date=cutoff_date,
         scaler_Y=scaler_Y, num_symbols=len(sym2id), num_features=len(features),
         lookback=lookback, target_cols=target_cols,
         batch_size=args.batch_size, epochs_per_stage=args.epochs_per_stage,
@@ -2297,13 +3717,99 @@ def main():
         profile_steps=args.profile_steps,
         profile_sync_timing=args.profile_sync_timing,
         results=results,
+        array_dir=array_dir,
+        resume=args.resume,
+        checkpoint_every=args.checkpoint_every,
     )
 
-    logging.info(f"Sequential training for {len(horizons)} horizons: {list(horizons.keys())}")
-    for h_name, h_days in horizons.items():
-        _train_single_horizon_safe(horizon_name=h_name, horizon=h_days, **shared_kwargs)
+    if args.shared_encoder:
+        # One model, one data pass: the max-horizon decode covers all shorter horizons,
+        # each scored on its prefix with --horizon_weights.
+        run_plan = {SHARED_ENCODER_DIR: max(horizons.values())}
+        shared_kwargs['horizon_set'] = sorted(horizons.values())
+        shared_kwargs['horizon_weights'] = horizon_weights
+        logging.info(f"Shared-encoder training for horizons (loss weights) {horizon_weights}")
+    else:
+        run_plan = horizons
+        logging.info(f"Sequential training for {len(horizons)} horizons: {list(horizons.keys())}")
+    if args.finetune_from:
+        finetune_kwargs = dict(
+            **{k: v for k, v in shared_inputs.items() if k != 'date_rank'},
+            scaler_Y=scaler_Y, num_symbols=len(sym2id), num_features=len(features),
+            lookback=lookback, target_cols=target_cols,
+            finetune_from=args.finetune_from,
+            since=np.datetime64(finetune_since.to_datetime64(), 'ns'),
+            epochs=args.finetune_epochs,
+            learning_rate=args.finetune_lr,
+            holdout_days=args.finetune_holdout_days,
+            batch_size=args.batch_size,
+            device=device, use_amp=use_amp, amp_dtype=amp_dtype,
+            checkpoint_dir=args.checkpoint_dir, output_dir=args.output_dir,
+            log_dir=args.log_dir, loader_kwargs=loader_kwargs,
+            cpu_prefetch_queue=args.cpu_prefetch_queue,
+            results=results,
+            horizon_set=shared_kwargs.get('horizon_set'),
+            horizon_weights=shared_kwargs.get('horizon_weights'),
+            array_dir=array_dir,
+        )
+        for h_name, h_days in run_plan.items():
+            try:
+                finetune_single_horizon(horizon_name=h_name, horizon=h_days, **finetune_kwargs)
+            except Exception as exc:
+                logging.exception(f"[{h_name}] Fine-tuning crashed; base model left in place.")
+                results[h_name] = {'status': 'failed', 'best_val_loss': float('inf'), 'error': type(exc).__name__}
+        # Advance the trained-through date only once every model has absorbed the new
+        # bars; otherwise the next run fine-tunes on the accumulated windows again.
+        if all(results.get(h, {}).get('status') == 'success'
+               and (results[h].get('promoted') or results[h].get('new_windows') == 0)
+               for h in run_plan):
+            write_data_range(args.output_dir, shared_inputs['idx_to_date'], cutoff_date)
+        elif os.path.abspath(args.output_dir) != os.path.abspath(args.finetune_from):
+            src = os.path.join(args.finetune_from, DATA_RANGE_FILE)
+            if os.path.exists(src):
+                shutil.copy(src, os.path.join(args.output_dir, DATA_RANGE_FILE))
+    elif args.ddp_cpu > 0:
+        world_size = args.ddp_cpu * args.ddp_nnodes
+        os.environ.setdefault('MASTER_ADDR', '127.0.0.1')
+        os.environ.setdefault('MASTER_PORT', '29500')
+        logging.info(
+            f"DDP (gloo) on CPU: {args.ddp_cpu} ranks x {args.ddp_nnodes} node(s) = {world_size} | "
+            f"effective_batch={args.batch_size * args.accum_steps * world_size} | "
+            f"rendezvous={os.environ['MASTER_ADDR']}:{os.environ['MASTER_PORT']}"
+        )
+        # Ranks rebuild the tensors from array_dir; only small config objects are pickled.
+        worker_kwargs = {
+            k: v for k, v in shared_kwargs.items() if k not in shared_inputs and k != 'results'
+        }
+        results_path = os.path.join(args.log_dir, 'ddp_results.json')
+        if os.path.exists(results_path):
+            os.remove(results_path)
+        try:
+            mp.spawn(
+                _ddp_worker,
+                args=(args.ddp_cpu, args.ddp_node_rank, args.ddp_nnodes, run_plan, worker_kwargs, results_path),
+                nprocs=args.ddp_cpu,
+                join=True,
+            )
+        except Exception:
+            logging.exception("DDP training failed.")
+        if os.path.exists(results_path):
+            with open(results_path) as f:
+                results.update(json.load(f))
+    else:
+        for h_name, h_days in run_plan.items():
+            _train_single_horizon_safe(horizon_name=h_name, horizon=h_days, **shared_kwargs)
+    if spill_dir is not None:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+    if args.ddp_cpu > 0 and args.ddp_node_rank != 0:
+        logging.info("DDP node finished; checkpoints and summary are written by node 0.")
+        return
+
+    if args.shared_encoder and results.get(SHARED_ENCODER_DIR, {}).get('status') == 'success':
+        with open(os.path.join(args.output_dir, SHARED_ENCODER_DIR, SHARED_ENCODER_CONFIG), 'w') as f:
+            json.dump({'horizons': shared_kwargs['horizon_set'], 'lookback': lookback}, f, indent=4)
 
-    for h_name in horizons:
+    for h_name in run_plan:
         if h_name not in results:
             logging.error(f"[{h_name}] No result produced by worker; marking horizon as failed.")
             results[h_name] = {
@@ -2319,22 +3825,40 @@ def main():
     print("\n" + "=" * 60)
     print("MULTI-HORIZON TRAINING COMPLETE")
     print("=" * 60)
-    for h_name in horizons:
+    for h_name in run_plan:
         r = results.get(h_name, {})
         status = r.get('status', 'unknown')
         val    = r.get('best_val_loss', float('inf'))
-        print(f"  {h_name:>4s}  status={status:<8s}  best_val_loss={val:.5f}")
+        line   = f"  {h_name:>4s}  status={status:<8s}  best_val_loss={val:.5f}"
+        if 'promoted' in r:
+            line += f"  promoted={r['promoted']}  new_windows={r['new_windows']}"
+        print(line)
     print(f"\nShared artefacts: {args.output_dir}")
     print(f"  scaler_X.pkl | scaler_Y.pkl | symbol_mapping.json | features.json")
-    for h_name in horizons:
-        print(f"  {h_name}/best_model.pth")
+    # List only checkpoints that exist (a failed run writes none).
+    candidates = list(run_plan) + ([os.path.join(SHARED_ENCODER_DIR, h) for h in horizons] if args.shared_encoder else [])
+    written = [name for name in candidates if os.path.exists(os.path.join(args.output_dir, name, 'best_model.pth'))]
+    for h_name in written:
+        note = "   (exported from the shared encoder)" if args.shared_encoder and h_name != SHARED_ENCODER_DIR else ""
+        print(f"  {h_name}/best_model.pth{note}")
+    if not written:
+        print("  (no model checkpoint was written)")
     print(f"\nInference example:")
-    print(f"  from train import predict, MultiMetricPredictor")
-    print(f"  model_7d = MultiMetricPredictor(..., forecast_horizon=7)")
-    print(f"  model_7d.load_state_dict(torch.load('output_model/7d/best_model.pth'))")
-    print(f"  df = predict(ohlc_history, symbol_id=0, regime_id=1,")
-    print(f"               model=model_7d, scaler_X=scaler_X, scaler_Y=scaler_Y,")
-    print(f"               feature_names=features, device=device)")
+    if args.shared_encoder:
+        print(f"  from train import predict_multi_horizon, MultiHorizonPredictor")
+        print(f"  model = MultiHorizonPredictor(..., horizons={shared_kwargs['horizon_set']})")
+        print(f"  model.load_state_dict(torch.load('{args.output_dir}/{SHARED_ENCODER_DIR}/best_model.pth'))")
+        print(f"  dfs = predict_multi_horizon(ohlc_history, symbol_id=0, regime_id=1,")
+        print(f"                              model=model, scaler_X=scaler_X, scaler_Y=scaler_Y,")
+        print(f"                              feature_names=features, device=device)")
+    else:
+        h_name, h_days = next(iter(horizons.items()))
+        print(f"  from train import predict, MultiMetricPredictor")
+        print(f"  model = MultiMetricPredictor(..., forecast_horizon={h_days})")
+        print(f"  model.load_state_dict(torch.load('{args.output_dir}/{h_name}/best_model.pth'))")
+        print(f"  df = predict(ohlc_history, symbol_id=0, regime_id=1,")
+        print(f"               model=model, scaler_X=scaler_X, scaler_Y=scaler_Y,")
+        print(f"               feature_names=features, device=device)")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,453 @@
+"""
+TRAINING PIPELINE BENCHMARK
+===========================
+CPU-only timings for the training pipeline on a synthetic symbol universe
+(no CSVs, no GPU required).
+
+  stage_setup   per-horizon anchor construction + curriculum stage selection,
+                legacy (per-symbol np.where / list.extend / np.isin per stage)
+                vs symbol_row_layout + CurriculumStageIndex (searchsorted).
+                Both paths are checked for identical anchor sets.
+
+  throughput    N timed training steps (after warm-up) through the real
+                input pipeline and model: memory-mapped synthetic arrays ->
+                TemporalBatchCollator -> build_temporal_loader (DataLoader
+                workers or AsyncBufferedLoader) -> MultiMetricPredictor ->
+                compute_forecast_loss -> AdamW.  One run per point of the
+                grid batch size x workers x stride x AMP (CPU bfloat16
+                autocast) x torch threads, each in a fresh process so peak
+                RSS is per configuration.  Reports samples/sec, step p50/p99,
+                the StepTiming split (data-wait %) and peak RSS.
+
+Results are printed and written as JSON so two commits can be compared.
+
+How to Run:
+-----------
+python train_bench.py \
+    --suite stage_setup,throughput \
+    --symbols 1410 \
+    --days 2500 \
+    --lookback 120 \
+    --horizons 7,14,30 \
+    --stage_ratios 0.1,0.2,0.5 \
+    --repeats 3 \
+    --batch_sizes 64,128 \
+    --workers 0,2 \
+    --strides 1 \
+    --amp off,on \
+    --threads 4 \
+    --steps 50 \
+    --output logs/bench/train_stage_setup.json
+"""
+
+import os
+import json
+import time
+import shutil
+import argparse
+import logging
+import tempfile
+import itertools
+import multiprocessing
+import concurrent.futures
+
+import numpy as np
+import pandas as pd
+
+from bench_inference import git_revision, peak_rss_mb, summarize_ms
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================================
+# 1. Synthetic universe
+# ============================================================
+def build_synthetic_index(num_symbols: int, num_days: int, seed: int = 0):
+    """
+    Row layout of the prepared dataset: sorted by (symbol, time), one row per
+    trading day.  Listing dates are staggered so symbols have uneven history,
+    like the real universe.
+    """
+    rng = np.random.default_rng(seed)
+    calendar = pd.bdate_range('2010-01-01', periods=num_days).to_numpy(dtype='datetime64[ns]')
+    first_day = rng.integers(0, max(1, num_days // 2), size=num_symbols)
+    first_day[: max(1, num_symbols // 4)] = 0  # a core of fully-listed symbols
+    lengths = num_days - first_day
+    sym_ids = np.repeat(np.arange(num_symbols, dtype=np.int64), lengths)
+    day_idx = np.concatenate([np.arange(f, num_days) for f in first_day])
+    return sym_ids, calendar[day_idx]
+
+
+# ============================================================
+# 2. Stage setup: legacy vs ranked
+# ============================================================
+def legacy_stage_setup(sym_ids, idx_to_date, cutoff, lookback, horizon, stage_ratios):
+    df_groups = [np.where(sym_ids == sid)[0] for sid in range(int(sym_ids.max()) + 1)]
+    valid_indices = []
+    for indices in df_groups:
+        if len(indices) >= lookback + horizon:
+            valid_indices.extend(indices[lookback - 1: len(indices) - horizon])
+    valid_indices = np.array(valid_indices)
+    train_indices = valid_indices[idx_to_date[valid_indices] < cutoff]
+
+    train_dates = np.sort(np.unique(idx_to_date[train_indices]))
+    stages = []
+    for ratio in stage_ratios:
+        num_dates = max(1, int(len(train_dates) * ratio))
+        stage_indices = np.array([], dtype=np.int64)
+        for _expand in range(num_dates, len(train_dates) + 1):
+            stage_dates = train_dates[-_expand:]
+            stage_indices = train_indices[np.isin(idx_to_date[train_indices], stage_dates)]
+            if len(stage_indices) > 0:
+                break
+        stages.append(stage_indices)
+    return stages
+
+
+def ranked_stage_setup(layout, date_rank, idx_to_date, cutoff, lookback, horizon, stage_ratios):
+    from train import horizon_valid_indices, CurriculumStageIndex
+
+    row_pos, run_len = layout
+    valid_indices = horizon_valid_indices(row_pos, run_len, lookback, horizon)
+    train_indices = valid_indices[idx_to_date[valid_indices] < cutoff]
+    stage_index = CurriculumStageIndex(train_indices, date_rank)
+    return [stage_index.select(ratio) for ratio in stage_ratios]
+
+
+def run_stage_setup_benchmark(num_symbols, num_days, lookback, horizons, stage_ratios,
+                              verify_split, repeats):
+    from train import symbol_row_layout
+
+    sym_ids, idx_to_date = build_synthetic_index(num_symbols, num_days)
+    all_dates = np.unique(idx_to_date)
+    cutoff = all_dates[max(1, int(len(all_dates) * (1.0 - verify_split)))]
+    logger.info("Synthetic universe: %d symbols x %d days = %d rows", num_symbols, num_days, len(sym_ids))
+
+    # Horizon-independent precompute, done once per run in train.main().
+    t0 = time.perf_counter()
+    layout = symbol_row_layout(sym_ids)
+    date_rank = np.unique(idx_to_date, return_inverse=True)[1].astype(np.int64)
+    precompute_s = time.perf_counter() - t0
+
+    report = {'rows': int(len(sym_ids)), 'precompute_s': precompute_s, 'horizons': {}}
+    for horizon in horizons:
+        legacy_t, ranked_t = [], []
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            legacy = legacy_stage_setup(sym_ids, idx_to_date, cutoff, lookback, horizon, stage_ratios)
+            legacy_t.append(time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            ranked = ranked_stage_setup(layout, date_rank, idx_to_date, cutoff, lookback, horizon, stage_ratios)
+            ranked_t.append(time.perf_counter() - t0)
+        identical = all(np.array_equal(a, b) for a, b in zip(legacy, ranked))
+        if not identical:
+            raise AssertionError(f"Stage anchors differ between legacy and ranked setup (horizon={horizon})")
+        report['horizons'][f"{horizon}d"] = {
+            'legacy_s': float(np.median(legacy_t)),
+            'ranked_s': float(np.median(ranked_t)),
+            'speedup': float(np.median(legacy_t) / max(np.median(ranked_t), 1e-12)),
+            'stage_sizes': [int(len(s)) for s in ranked],
+        }
+    return report
+
+
+# ============================================================
+# 3. Training throughput
+# ============================================================
+def build_synthetic_arrays(num_symbols: int, num_days: int, num_features: int, seed: int = 0) -> dict:
+    """
+    Flat arrays in prepare_training_dataset's layout: standardised features,
+    standardised returns and a per-symbol random-walk price path.
+    """
+    rng = np.random.default_rng(seed)
+    sym_ids, times = build_synthetic_index(num_symbols, num_days, seed)
+    n = len(sym_ids)
+    returns = (rng.standard_normal((n, 4)) * 0.01).astype(np.float32)
+    starts = np.flatnonzero(np.r_[True, sym_ids[1:] != sym_ids[:-1]])
+    lengths = np.diff(np.r_[starts, n])
+    log_price = np.cumsum(returns, axis=0, dtype=np.float64)
+    log_price -= np.repeat(log_price[starts] - returns[starts], lengths, axis=0)
+    return {
+        'X':         rng.standard_normal((n, num_features), dtype=np.float32),
+        'Y_ret':     returns / np.float32(0.01),
+        'Y_price':   (100.0 * np.exp(log_price)).astype(np.float32),
+        'symbol_id': sym_ids,
+        'regime':    rng.integers(0, 3, size=n, dtype=np.int64),
+        'time':      times,
+    }
+
+
+def run_throughput_config(config: dict, array_dir: str, num_symbols: int, model_cfg: dict,
+                          steps: int, warmup: int, seed: int) -> dict:
+    """One grid point; meant to run in its own process (see run_throughput_benchmark)."""
+    import torch
+    import torch.optim as optim
+    from train import (
+        StepTiming, TemporalAnchorDataset, TemporalBatchCollator, CombinedForecastLoss,
+        build_predictor, build_shared_inputs, build_temporal_loader, compute_forecast_loss,
+        horizon_valid_indices, open_array_maps,
+    )
+    from bench_inference import peak_rss_mb as _peak_rss_mb
+
+    torch.set_num_threads(config['threads'])
+    torch.manual_seed(seed)
+    lookback, horizon = model_cfg['lookback'], model_cfg['horizon']
+
+    shared = build_shared_inputs(open_array_maps(array_dir))
+    anchors = horizon_valid_indices(shared['row_pos'], shared['run_len'], lookback, horizon)
+    collator = TemporalBatchCollator(
+        X_tensor=shared['X_tensor'],
+        sym_tensor=shared['sym_tensor'],
+        regime_tensor=shared['regime_tensor'],
+        Y_ret_tensor=shared['Y_ret_tensor'],
+        Y_price_tensor=shared['Y_price_tensor'],
+        last_price_tensor=shared['last_price_tensor'],
+        lookback=lookback,
+        forecast_horizon=horizon,
+        array_dir=array_dir,
+    )
+    loader_kwargs = {'num_workers': config['num_workers'], 'pin_memory': False}
+    if config['num_workers'] > 0:
+        loader_kwargs['prefetch_factor'] = model_cfg['prefetch_factor']
+    loader = build_temporal_loader(
+        anchor_dataset=TemporalAnchorDataset(anchors, stride=config['stride']),
+        collator=collator,
+        batch_size=config['batch_size'],
+        shuffle=True,
+        drop_last=True,
+        loader_kwargs=loader_kwargs,
+        cpu_prefetch_queue=model_cfg['cpu_prefetch_queue'],
+    )
+
+    num_features = int(shared['X_tensor'].shape[1])
+    model = build_predictor(
+        num_symbols, num_features, lookback, horizon, int(shared['Y_ret_tensor'].shape[1]),
+        model_kwargs={k: model_cfg[k] for k in ('model_dim', 'num_heads', 'num_layers')},
+    )
+    model.train()
+    criterion = CombinedForecastLoss()
+    optimizer = optim.AdamW(model.parameters(), lr=0.0005, weight_decay=1e-4)
+    scale_t = torch.ones(shared['Y_ret_tensor'].shape[1])
+    mean_t = torch.zeros(shared['Y_ret_tensor'].shape[1])
+
+    def _batches(loader):
+        while True:
+            yield from loader
+
+    timing = StepTiming()
+    step_s = []
+    batches = _batches(loader)
+    t_start = None
+    for step in range(warmup + steps):
+        if step == warmup:
+            t_start = time.perf_counter()
+        t0 = time.perf_counter()
+        x, sym, regime, y_ret, y_price, last_p = next(batches)
+        t1 = time.perf_counter()
+        with torch.autocast('cpu', dtype=torch.bfloat16, enabled=config['amp']):
+            loss, _, _ = compute_forecast_loss(
+                model(x, sym, regime, teacher_targets=y_ret),
+                y_ret, y_price, last_p, criterion, scale_t, mean_t, {horizon: 1.0},
+            )
+        t2 = time.perf_counter()
+        optimizer.zero_grad(set_to_none=True)
+        loss.backward()
+        t3 = time.perf_counter()
+        torch.nn.utils.clip_grad_norm_(model.parameters(), 1.0)
+        optimizer.step()
+        t4 = time.perf_counter()
+        if step >= warmup:
+            timing.data_wait_s += t1 - t0
+            timing.forward_s += t2 - t1
+            timing.backward_s += t3 - t2
+            timing.optim_s += t4 - t3
+            timing.batches += 1
+            step_s.append(t4 - t0)
+    wall_s = time.perf_counter() - t_start
+    del batches, loader  # joins DataLoader workers so RUSAGE_CHILDREN includes them
+
+    split = timing.as_dict()
+    return dict(
+        config,
+        anchors=int(len(anchors)),
+        steps=steps,
+        samples_per_sec=steps * config['batch_size'] / max(wall_s, 1e-12),
+        step=summarize_ms(step_s),
+        data_wait_pct=split['data_wait_pct'],
+        forward_pct=split['forward_pct'],
+        backward_pct=split['backward_pct'],
+        optim_pct=split['optim_pct'],
+        peak_rss_mb=_peak_rss_mb(),
+        workers_peak_rss_mb=_peak_children_rss_mb(),
+    )
+
+
+def _peak_children_rss_mb() -> float:
+    """Largest RSS among terminated child processes (DataLoader workers)."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return float('nan')
+    return resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024.0
+
+
+def run_throughput_benchmark(num_symbols, num_days, num_features, model_cfg, grid, steps, warmup, seed):
+    arrays = build_synthetic_arrays(num_symbols, num_days, num_features, seed)
+    rows = int(len(arrays['symbol_id']))
+    logger.info("Throughput universe: %d symbols x %d days x %d features = %d rows",
+                num_symbols, num_days, num_features, rows)
+    array_dir = tempfile.mkdtemp(prefix='train_bench_arrays_')
+    try:
+        from train import spill_arrays_to_disk
+        spill_arrays_to_disk(arrays, array_dir)
+        del arrays
+
+        configs = [
+            {'batch_size': b, 'num_workers': w, 'stride': s, 'amp': a, 'threads': t}
+            for b, w, s, a, t in itertools.product(
+                grid['batch_sizes'], grid['workers'], grid['strides'], grid['amp'], grid['threads'])
+        ]
+        results = []
+        ctx = multiprocessing.get_context('spawn')
+        for config in configs:
+            # Fresh process per configuration: peak RSS is a process high-water mark.
+            with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                result = pool.submit(
+                    run_throughput_config, config, array_dir, num_symbols, model_cfg, steps, warmup, seed,
+                ).result()
+            logger.info("%s -> %.1f samples/s (data wait %.1f%%)",
+                        config, result['samples_per_sec'], result['data_wait_pct'])
+            results.append(result)
+    finally:
+        shutil.rmtree(array_dir, ignore_errors=True)
+    return {
+        'rows': rows,
+        'universe': {'symbols': num_symbols, 'days': num_days, 'features': num_features},
+        'model': model_cfg,
+        'warmup_steps': warmup,
+        'configs': results,
+    }
+
+
+# ============================================================
+# 4. Entry point
+# ============================================================
+def _int_list(s):
+    return [int(v) for v in s.split(',')]
+
+
+def _on_off_list(s):
+    values = []
+    for v in s.split(','):
+        v = v.strip().lower()
+        if v not in {'on', 'off'}:
+            raise argparse.ArgumentTypeError(f"Expected on/off values, got: {v}")
+        values.append(v == 'on')
+    return values
+
+
+def main():
+    from feature_pipeline import FEATURE_SCHEMA
+
+    parser = argparse.ArgumentParser(description="Training pipeline benchmark (CPU, synthetic data)")
+    parser.add_argument("--suite",        type=str,   default="stage_setup,throughput",
+                        help="Comma-separated: stage_setup, throughput")
+    parser.add_argument("--symbols",      type=int,   default=1410,
+                        help="Universe size (1410 = output_model/symbol_mapping.json)")
+    parser.add_argument("--days",         type=int,   default=2500)
+    parser.add_argument("--lookback",     type=int,   default=120)
+    parser.add_argument("--horizons",     type=str,   default="7,14,30")
+    parser.add_argument("--stage_ratios", type=str,   default="0.1,0.2,0.5")
+    parser.add_argument("--verify_split", type=float, default=0.15)
+    parser.add_argument("--repeats",      type=int,   default=3)
+    # --- throughput suite ---
+    parser.add_argument("--tp_symbols",   type=int,   default=200,
+                        help="Universe size for the throughput suite")
+    parser.add_argument("--tp_days",      type=int,   default=1000)
+    parser.add_argument("--features",     type=int,   default=len(FEATURE_SCHEMA))
+    parser.add_argument("--horizon",      type=int,   default=7)
+    parser.add_argument("--model_dim",    type=int,   default=128)
+    parser.add_argument("--num_heads",    type=int,   default=4)
+    parser.add_argument("--num_layers",   type=int,   default=2)
+    parser.add_argument("--batch_sizes",  type=_int_list, default=[64, 128])
+    parser.add_argument("--workers",      type=_int_list, default=[0, 2])
+    parser.add_argument("--strides",      type=_int_list, default=[1])
+    parser.add_argument("--amp",          type=_on_off_list, default=[False, True],
+                        help="CPU bfloat16 autocast: off,on")
+    parser.add_argument("--threads",      type=_int_list, default=[os.cpu_count() or 1])
+    parser.add_argument("--prefetch_factor",    type=int, default=4)
+    parser.add_argument("--cpu_prefetch_queue", type=int, default=4)
+    parser.add_argument("--steps",        type=int,   default=50)
+    parser.add_argument("--warmup",       type=int,   default=5)
+    parser.add_argument("--seed",         type=int,   default=0)
+    parser.add_argument("--output",       type=str,   default=None,
+                        help="JSON output path (default: logs/bench/train_<git sha>.json)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    suites = {s.strip() for s in args.suite.split(',') if s.strip()}
+    unknown = suites - {'stage_setup', 'throughput'}
+    if unknown:
+        parser.error(f"unknown --suite entries: {sorted(unknown)}")
+
+    revision = git_revision()
+    report = {'revision': revision}
+    if 'stage_setup' in suites:
+        report['stage_setup'] = run_stage_setup_benchmark(
+            num_symbols=args.symbols,
+            num_days=args.days,
+            lookback=args.lookback,
+            horizons=[int(h) for h in args.horizons.split(',')],
+            stage_ratios=[float(r) for r in args.stage_ratios.split(',')],
+            verify_split=args.verify_split,
+            repeats=args.repeats,
+        )
+    if 'throughput' in suites:
+        report['throughput'] = run_throughput_benchmark(
+            num_symbols=args.tp_symbols,
+            num_days=args.tp_days,
+            num_features=args.features,
+            model_cfg={
+                'lookback': args.lookback, 'horizon': args.horizon,
+                'model_dim': args.model_dim, 'num_heads': args.num_heads, 'num_layers': args.num_layers,
+                'prefetch_factor': args.prefetch_factor, 'cpu_prefetch_queue': args.cpu_prefetch_queue,
+            },
+            grid={
+                'batch_sizes': args.batch_sizes, 'workers': args.workers, 'strides': args.strides,
+                'amp': args.amp, 'threads': args.threads,
+            },
+            steps=args.steps,
+            warmup=args.warmup,
+            seed=args.seed,
+        )
+    report['peak_rss_mb'] = peak_rss_mb()
+
+    if 'stage_setup' in report:
+        stage = report['stage_setup']
+        print(f"\nStage setup — {args.symbols} symbols x {args.days} days ({stage['rows']} rows)")
+        print(f"  one-off precompute (row layout + date ranks): {stage['precompute_s'] * 1000:.1f} ms")
+        for h_name, r in stage['horizons'].items():
+            print(f"  {h_name:>4s}  legacy={r['legacy_s'] * 1000:9.1f} ms  "
+                  f"ranked={r['ranked_s'] * 1000:8.1f} ms  speedup={r['speedup']:6.1f}x")
+    if 'throughput' in report:
+        tp = report['throughput']
+        print(f"\nThroughput — {args.tp_symbols} symbols x {args.tp_days} days x {args.features} features "
+              f"({tp['rows']} rows), {args.steps} steps after {args.warmup} warm-up")
+        print(f"  {'batch':>5s} {'work':>4s} {'strd':>4s} {'amp':>3s} {'thr':>3s} "
+              f"{'samples/s':>10s} {'p50 ms':>8s} {'wait%':>6s} {'rss MB':>8s} {'wrk MB':>7s}")
+        for r in tp['configs']:
+            print(f"  {r['batch_size']:5d} {r['num_workers']:4d} {r['stride']:4d} "
+                  f"{'on' if r['amp'] else 'off':>3s} {r['threads']:3d} {r['samples_per_sec']:10.1f} "
+                  f"{r['step']['p50_ms']:8.1f} {r['data_wait_pct']:6.1f} {r['peak_rss_mb']:8.1f} "
+                  f"{r['workers_peak_rss_mb']:7.1f}")
+
+    output = args.output or os.path.join('logs', 'bench', f"train_{revision}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWritten: {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,429 @@
+"""
+HYPERPARAMETER SWEEP
+====================
+Random search over train_single_horizon settings, run as a process pool over
+one shared memory-mapped dataset, with asynchronous successive halving (ASHA)
+pruning on the per-epoch validation loss.
+
+  search space  model_dim / num_heads / num_layers, lookback, stride,
+                stage_ratios, learning_rate and the CombinedForecastLoss
+                weights (loss_alpha / loss_beta / loss_gamma).  DEFAULT_SPACE
+                below, or a JSON file {"param": [choices, ...]} via --space.
+
+  pruning       Rungs at min_epochs * reduction_factor**k validated epochs.
+                A trial reaching a rung continues only if its best val loss so
+                far is in the top 1/reduction_factor of all trials that reached
+                that rung (decided once at least reduction_factor have).
+
+  store         SQLite (--db): sweeps, trials (params, status, best val loss)
+                and every reported epoch.  Trial parameters are derived from
+                (--seed, trial id), so re-running the same command resumes the
+                sweep: complete/pruned trials are skipped, others rerun.
+
+The dataset is prepared once (through --cache_dir when given, otherwise a
+spill dir under the sweep directory); trials re-open it as memory maps.
+
+How to Run:
+-----------
+python train_sweep.py \
+    --dataset metrics.csv \
+    --prices stock_prices.csv \
+    --cache_dir cache/dataset \
+    --name size_and_loss \
+    --horizon 7 \
+    --trials 32 \
+    --parallel 4 \
+    --epochs_per_stage 6
+
+python train_sweep.py --name size_and_loss --report_only true   # leaderboard
+"""
+
+import os
+import json
+import math
+import shutil
+import sqlite3
+import argparse
+import logging
+import concurrent.futures
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SPACE = {
+    'learning_rate': [0.0001, 0.0003, 0.0005, 0.001],
+    'model_dim':     [64, 128, 192],
+    'num_heads':     [2, 4, 8],
+    'num_layers':    [1, 2, 3],
+    'lookback':      [60, 90, 120],
+    'stride':        [1, 2, 3],
+    'stage_ratios':  ['0.1,0.2,0.5', '0.2,0.5,1.0', '0.5,1.0'],
+    'loss_alpha':    [0.5, 0.7, 0.9],
+    'loss_beta':     [0.1, 0.2, 0.4],
+    'loss_gamma':    [0.25, 0.5, 1.0],
+}
+MODEL_PARAMS = {'model_dim': 'model_dim', 'num_heads': 'num_heads', 'num_layers': 'num_layers'}
+LOSS_PARAMS  = {'loss_alpha': 'alpha', 'loss_beta': 'beta', 'loss_gamma': 'gamma'}
+FINISHED_STATUSES = ('complete', 'pruned')
+
+
+# ============================================================
+# 1. SQLite store
+# ============================================================
+class SweepStore:
+    """
+    Sweep / trial / epoch records.  One connection per process; WAL mode so
+    the pool's trials can write while others read rung losses.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sweeps (
+            name      TEXT PRIMARY KEY,
+            created   TEXT NOT NULL,
+            config    TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS trials (
+            sweep         TEXT NOT NULL,
+            trial_id      INTEGER NOT NULL,
+            params        TEXT NOT NULL,
+            status        TEXT NOT NULL,
+            best_val_loss REAL,
+            epochs        INTEGER,
+            started       TEXT,
+            finished      TEXT,
+            error         TEXT,
+            PRIMARY KEY (sweep, trial_id)
+        );
+        CREATE TABLE IF NOT EXISTS epochs (
+            sweep     TEXT NOT NULL,
+            trial_id  INTEGER NOT NULL,
+            step      INTEGER NOT NULL,
+            val_loss  REAL NOT NULL,
+            PRIMARY KEY (sweep, trial_id, step)
+        );
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(self.SCHEMA)
+        self.conn.commit()
+
+    @staticmethod
+    def _now():
+        return pd.Timestamp.now(tz='UTC').isoformat()
+
+    def ensure_sweep(self, name: str, config: dict):
+        """Register the sweep, or check that a resumed one has the same config."""
+        row = self.conn.execute("SELECT config FROM sweeps WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            with self.conn:
+                self.conn.execute("INSERT INTO sweeps VALUES (?, ?, ?)",
+                                  (name, self._now(), json.dumps(config, sort_keys=True)))
+        elif json.loads(row[0]) != json.loads(json.dumps(config, sort_keys=True)):
+            raise ValueError(f"Sweep '{name}' already exists with a different configuration; "
+                             f"pick a new --name to compare against it.")
+
+    def trial_statuses(self, sweep: str) -> dict:
+        rows = self.conn.execute("SELECT trial_id, status FROM trials WHERE sweep = ?", (sweep,))
+        return dict(rows.fetchall())
+
+    def start_trial(self, sweep: str, trial_id: int, params: dict):
+        with self.conn:
+            self.conn.execute("DELETE FROM epochs WHERE sweep = ? AND trial_id = ?", (sweep, trial_id))
+            self.conn.execute(
+                "INSERT OR REPLACE INTO trials (sweep, trial_id, params, status, started) "
+                "VALUES (?, ?, ?, 'running', ?)",
+                (sweep, trial_id, json.dumps(params, sort_keys=True), self._now()),
+            )
+
+    def finish_trial(self, sweep: str, trial_id: int, status: str, best_val_loss=None, error=None):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE trials SET status = ?, best_val_loss = ?, finished = ?, error = ?, "
+                "epochs = (SELECT MAX(step) FROM epochs WHERE sweep = ? AND trial_id = ?) "
+                "WHERE sweep = ? AND trial_id = ?",
+                (status, best_val_loss, self._now(), error, sweep, trial_id, sweep, trial_id),
+            )
+
+    def record_epoch(self, sweep: str, trial_id: int, step: int, val_loss: float):
+        # NaN would be stored as NULL; treat it as the worst possible loss instead.
+        val_loss = float(val_loss) if math.isfinite(val_loss) else float('inf')
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO epochs VALUES (?, ?, ?, ?)",
+                              (sweep, trial_id, step, val_loss))
+
+    def rung_losses(self, sweep: str, step: int) -> dict:
+        """{trial_id: best val loss up to `step`} for trials that reached `step`."""
+        rows = self.conn.execute(
+            "SELECT trial_id, MIN(val_loss) FROM epochs WHERE sweep = ? AND step <= ? "
+            "GROUP BY trial_id HAVING MAX(step) >= ?",
+            (sweep, step, step),
+        )
+        return dict(rows.fetchall())
+
+    def leaderboard(self, sweep: str) -> pd.DataFrame:
+        df = pd.read_sql_query(
+            "SELECT trial_id, status, best_val_loss, epochs, params, started, finished, error "
+            "FROM trials WHERE sweep = ? ORDER BY best_val_loss IS NULL, best_val_loss",
+            self.conn, params=(sweep,),
+        )
+        if df.empty:
+            return df
+        params = pd.DataFrame([json.loads(p) for p in df.pop('params')], index=df.index)
+        return pd.concat([df, params], axis=1)
+
+    def close(self):
+        self.conn.close()
+
+
+# ============================================================
+# 2. Asynchronous successive halving
+# ============================================================
+class SuccessiveHalvingPruner:
+    def __init__(self, store: SweepStore, sweep: str, min_epochs: int = 1, reduction_factor: int = 3):
+        if reduction_factor < 2:
+            raise ValueError("reduction_factor must be >= 2")
+        self.store = store
+        self.sweep = sweep
+        self.min_epochs = max(1, int(min_epochs))
+        self.reduction_factor = int(reduction_factor)
+
+    def is_rung(self, step: int) -> bool:
+        r = step / self.min_epochs
+        if r < 1 or r != int(r):
+            return False
+        r = int(r)
+        while r % self.reduction_factor == 0:
+            r //= self.reduction_factor
+        return r == 1
+
+    def report(self, trial_id: int, step: int, val_loss: float) -> bool:
+        """Record an epoch; True when the trial should stop here."""
+        self.store.record_epoch(self.sweep, trial_id, step, val_loss)
+        if not self.is_rung(step):
+            return False
+        losses = self.store.rung_losses(self.sweep, step)
+        if len(losses) < self.reduction_factor:
+            return False
+        keep = max(1, len(losses) // self.reduction_factor)
+        threshold = sorted(losses.values())[keep - 1]
+        return losses[trial_id] > threshold
+
+
+# ============================================================
+# 3. Trials
+# ============================================================
+def load_space(path: str = None) -> dict:
+    if path is None:
+        return dict(DEFAULT_SPACE)
+    with open(path) as f:
+        space = json.load(f)
+    if not isinstance(space, dict) or not all(isinstance(v, list) and v for v in space.values()):
+        raise ValueError(f"{path}: expected {{\"param\": [choice, ...]}}")
+    unknown = set(space) - set(DEFAULT_SPACE)
+    if unknown:
+        raise ValueError(f"{path}: unknown sweep parameters {sorted(unknown)}")
+    return space
+
+
+def sample_params(space: dict, seed: int, trial_id: int) -> dict:
+    """Deterministic in (seed, trial_id), so a resumed sweep regenerates the same trials."""
+    rng = np.random.default_rng([seed, trial_id])
+    params = {}
+    for name in sorted(space):
+        choice = space[name][int(rng.integers(len(space[name])))]
+        params[name] = choice.item() if isinstance(choice, np.generic) else choice
+    if 'model_dim' in params and 'num_heads' in params:
+        # nn.TransformerEncoderLayer needs model_dim divisible by num_heads.
+        heads = [h for h in space.get('num_heads', [params['num_heads']]) if params['model_dim'] % h == 0]
+        if params['model_dim'] % params['num_heads'] != 0 and heads:
+            params['num_heads'] = heads[int(rng.integers(len(heads)))]
+    return params
+
+
+def trial_kwargs(params: dict, base_kwargs: dict) -> dict:
+    """Map sampled params onto train_single_horizon keyword arguments."""
+    kwargs = dict(base_kwargs)
+    if 'stage_ratios' in params:
+        ratios = [float(r) for r in str(params['stage_ratios']).split(',')]
+        kwargs.update(stage_ratios=ratios, stages=len(ratios))
+    for name in ('learning_rate', 'lookback', 'stride'):
+        if name in params:
+            kwargs[name] = params[name]
+    kwargs['model_kwargs'] = {arg: params[p] for p, arg in MODEL_PARAMS.items() if p in params}
+    kwargs['loss_kwargs']  = {arg: params[p] for p, arg in LOSS_PARAMS.items() if p in params}
+    return kwargs
+
+
+def run_trial(db_path, sweep, trial_id, params, base_kwargs, trial_dir,
+              min_epochs, reduction_factor, threads):
+    """Pool worker: one train_single_horizon run reporting to the pruner."""
+    import torch
+    from train import build_shared_inputs, open_array_maps, train_single_horizon
+
+    torch.set_num_threads(max(1, threads))
+    store = SweepStore(db_path)
+    pruner = SuccessiveHalvingPruner(store, sweep, min_epochs, reduction_factor)
+    store.start_trial(sweep, trial_id, params)
+    horizon_name = f"{base_kwargs['horizon']}d"
+    results = {}
+    try:
+        kwargs = trial_kwargs(params, base_kwargs)
+        for sub in ('checkpoints', 'output', 'logs'):
+            os.makedirs(os.path.join(trial_dir, sub), exist_ok=True)
+        train_single_horizon(
+            horizon_name=horizon_name,
+            results=results,
+            checkpoint_dir=os.path.join(trial_dir, 'checkpoints'),
+            output_dir=os.path.join(trial_dir, 'output'),
+            log_dir=os.path.join(trial_dir, 'logs'),
+            epoch_callback=lambda step, val_loss: pruner.report(trial_id, step, val_loss),
+            **build_shared_inputs(open_array_maps(kwargs['array_dir'])),
+            **kwargs,
+        )
+        result = results.get(horizon_name, {'status': 'failed', 'best_val_loss': float('inf')})
+        best = result['best_val_loss']
+        status = {'success': 'complete'}.get(result['status'], result['status'])
+        store.finish_trial(sweep, trial_id, status, best if math.isfinite(best) else None)
+        return trial_id, status, best
+    except Exception as exc:
+        logging.exception(f"[trial {trial_id}] crashed")
+        store.finish_trial(sweep, trial_id, 'failed', error=f"{type(exc).__name__}: {exc}")
+        return trial_id, 'failed', float('inf')
+    finally:
+        store.close()
+
+
+# ============================================================
+# 4. Entry point
+# ============================================================
+def print_leaderboard(store: SweepStore, sweep: str, top: int):
+    board = store.leaderboard(sweep)
+    if board.empty:
+        print(f"No trials recorded for sweep '{sweep}'.")
+        return
+    counts = board['status'].value_counts().to_dict()
+    print(f"\nSweep '{sweep}' — {len(board)} trials {counts}")
+    cols = ['trial_id', 'status', 'best_val_loss', 'epochs'] + [
+        c for c in board.columns if c in DEFAULT_SPACE
+    ]
+    with pd.option_context('display.width', 200, 'display.max_columns', None):
+        print(board[cols].head(top).to_string(index=False))
+
+
+def main():
+    from train import _str_to_bool
+
+    parser = argparse.ArgumentParser(description="Parallel hyperparameter sweep with ASHA pruning")
+    parser.add_argument("--dataset",          type=str,   default="metrics.csv")
+    parser.add_argument("--prices",           type=str,   default="stock_prices.csv")
+    parser.add_argument("--verify_split",     type=float, default=0.15)
+    parser.add_argument("--cache_dir",        type=str,   default=None)
+    parser.add_argument("--name",             type=str,   default="default",
+                        help="Sweep name; re-running with the same name resumes it")
+    parser.add_argument("--sweep_dir",        type=str,   default="sweeps/")
+    parser.add_argument("--db",               type=str,   default=None,
+                        help="SQLite store (default: <sweep_dir>/sweeps.db)")
+    parser.add_argument("--space",            type=str,   default=None,
+                        help="JSON search space {param: [choices]} (default: DEFAULT_SPACE)")
+    parser.add_argument("--trials",           type=int,   default=24)
+    parser.add_argument("--parallel",         type=int,   default=2)
+    parser.add_argument("--seed",             type=int,   default=0)
+    parser.add_argument("--min_epochs",       type=int,   default=1,
+                        help="First successive-halving rung (validated epochs)")
+    parser.add_argument("--reduction_factor", type=int,   default=3)
+    parser.add_argument("--horizon",          type=int,   default=7)
+    parser.add_argument("--batch_size",       type=int,   default=128)
+    parser.add_argument("--epochs_per_stage", type=int,   default=6)
+    parser.add_argument("--patience",         type=int,   default=3)
+    parser.add_argument("--device",           type=str,   default="cpu")
+    parser.add_argument("--top",              type=int,   default=10)
+    parser.add_argument("--report_only",      type=_str_to_bool, default=False)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    os.makedirs(args.sweep_dir, exist_ok=True)
+    db_path = args.db or os.path.join(args.sweep_dir, 'sweeps.db')
+    store = SweepStore(db_path)
+    if args.report_only:
+        print_leaderboard(store, args.name, args.top)
+        return
+
+    import torch
+    from train import load_or_prepare_dataset, spill_arrays_to_disk
+
+    space = load_space(args.space)
+    store.ensure_sweep(args.name, {
+        'space': space, 'seed': args.seed, 'horizon': args.horizon,
+        'batch_size': args.batch_size, 'epochs_per_stage': args.epochs_per_stage,
+        'patience': args.patience, 'min_epochs': args.min_epochs,
+        'reduction_factor': args.reduction_factor,
+        'dataset': os.path.abspath(args.dataset), 'prices': os.path.abspath(args.prices),
+        'verify_split': args.verify_split,
+    })
+    done = {t for t, s in store.trial_statuses(args.name).items() if s in FINISHED_STATUSES}
+    pending = [t for t in range(args.trials) if t not in done]
+    logging.info(f"Sweep '{args.name}': {len(done)} finished, {len(pending)} to run ({args.parallel} at a time)")
+
+    sweep_root = os.path.join(args.sweep_dir, args.name)
+    spill_dir = None
+    if pending:
+        prepared = load_or_prepare_dataset(args.dataset, args.prices, args.verify_split, cache_dir=args.cache_dir)
+        if prepared.get('array_dir') is None:
+            spill_dir = os.path.join(sweep_root, 'arrays')
+            spill_arrays_to_disk(prepared, spill_dir)
+
+        device = torch.device(args.device if torch.cuda.is_available() else 'cpu')
+        base_kwargs = dict(
+            horizon=args.horizon,
+            cutoff_date=prepared['cutoff_date'],
+            scaler_Y=prepared['scaler_Y'],
+            num_symbols=len(prepared['sym2id']),
+            num_features=len(prepared['features']),
+            target_cols=prepared['target_cols'],
+            lookback=120, stride=1, learning_rate=0.0005,
+            stages=3, stage_ratios=[0.1, 0.2, 0.5],
+            batch_size=args.batch_size,
+            epochs_per_stage=args.epochs_per_stage,
+            patience=args.patience,
+            is_iterative=True,
+            accum_steps=1,
+            mode='low_memory',
+            auto_batch_size_enabled=False,
+            min_batch_size=args.batch_size,
+            max_batch_size=args.batch_size,
+            device=device, use_amp=device.type == 'cuda', amp_dtype=torch.float16,
+            enable_gpu_prefetch=device.type == 'cuda',
+            channels_last=False,
+            loader_kwargs={'num_workers': 0, 'pin_memory': False},
+            cpu_prefetch_queue=2,
+            profile=False, profile_steps=0, profile_sync_timing=False,
+            array_dir=prepared['array_dir'],
+        )
+        del prepared
+
+        threads = max(1, (os.cpu_count() or 1) // max(1, args.parallel))
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max(1, args.parallel)) as pool:
+            futures = [
+                pool.submit(
+                    run_trial, db_path, args.name, t, sample_params(space, args.seed, t), base_kwargs,
+                    os.path.join(sweep_root, f"trial_{t:04d}"),
+                    args.min_epochs, args.reduction_factor, threads,
+                )
+                for t in pending
+            ]
+            for fut in concurrent.futures.as_completed(futures):
+                trial_id, status, best = fut.result()
+                logging.info(f"[trial {trial_id}] {status} best_val_loss={best:.5f}")
+
+    if spill_dir is not None:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+    print_leaderboard(store, args.name, args.top)
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
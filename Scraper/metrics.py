@@ -1,112 +1,17 @@
 import pandas as pd
 import numpy as np
 import os
+import sys
+import argparse
+import csv
+
+# The indicator engine lives in Backend/ so the scraper, the API and training share one implementation.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Backend'))
+from indicator_engine import calculate_indicators  # noqa: E402
 
 # Suppress runtime warnings for expected division by zero (handled later by fillna)
 np.seterr(divide='ignore', invalid='ignore')
 
-# DESIGN CHOICE: Group processing ensures indicators do not bleed across different symbols.
-# Default windows (14 for RSI/ATR, 20/50 for MA) are used as standard quantitative baselines.
-def calculate_indicators(group):
-    # Ensure sequential data
-    group = group.sort_values('time')
-    
-    close = group['close']
-    high = group['high']
-    low = group['low']
-    volume = group['volume']
-
-    # 1. Trend Indicators
-    group['MA20'] = close.rolling(window=20).mean()
-    group['MA50'] = close.rolling(window=50).mean()
-    group['EMA20'] = close.ewm(span=20, adjust=False).mean()
-    
-    # 2. Momentum Indicators
-    delta = close.diff()
-    gain = delta.clip(lower=0)
-    loss = -1 * delta.clip(upper=0)
-    
-    # Standard RSI uses Wilder's Smoothing (alpha=1/window)
-    avg_gain = gain.ewm(alpha=1/14, min_periods=14, adjust=False).mean()
-    avg_loss = loss.ewm(alpha=1/14, min_periods=14, adjust=False).mean()
-    
-    # Safe RSI calculation to prevent div by zero
-    rs = np.where(avg_loss == 0, 0, avg_gain / avg_loss)
-    rsi = np.where(avg_loss == 0, 100, 100 - (100 / (1 + rs)))
-    group['RSI'] = rsi
-    
-    # MACD (Standard 12-day EMA - 26-day EMA)
-    ema12 = close.ewm(span=12, adjust=False).mean()
-    ema26 = close.ewm(span=26, adjust=False).mean()
-    group['MACD'] = ema12 - ema26
-    
-    # 3. Volatility Indicators
-    group['Rolling_Vol_20d_std'] = close.rolling(window=20).std()
-    
-    # Average True Range (ATR)
-    prev_close = close.shift(1)
-    tr = pd.concat([high - low, (high - prev_close).abs(), (low - prev_close).abs()], axis=1).max(axis=1)
-    group['ATR'] = tr.ewm(alpha=1/14, min_periods=14, adjust=False).mean()
-    
-    # 4. Volume Indicators
-    group['Volume_MA20'] = volume.rolling(window=20).mean()
-    # fill_method=None prevents pandas deprecation warnings
-    group['Volume_Change_pct'] = volume.pct_change(fill_method=None) 
-    
-    # 5. Performance Indicators
-    group['Daily_Return_1d'] = close.pct_change(periods=1, fill_method=None)
-    group['Daily_Return_5d'] = close.pct_change(periods=5, fill_method=None)
-    
-    # Safe cumulative return
-    first_close = close.iloc[0] if len(close) > 0 else 1
-    group['Cumulative_Return'] = np.where(first_close == 0, 0, (close / first_close) - 1)
-    
-    group['Daily_Range'] = high - low
-    
-    # 6. Correlation
-    group['Vol_Close_Corr_20d'] = close.rolling(window=20).corr(volume)
-    
-    # 7. AI "Texture" Indicators (Page 6)
-    # Bollinger Bands (20-day, 2 Standard Deviations)
-    bb_mavg = close.rolling(window=20).mean()
-    bb_std = close.rolling(window=20).std()
-    bb_hband = bb_mavg + (2 * bb_std)
-    bb_lband = bb_mavg - (2 * bb_std)
-    # DESIGN CHOICE: BBW normalized by middle band to provide absolute compression metric
-    group['BB_Width'] = np.where(bb_mavg == 0, 0, (bb_hband - bb_lband) / bb_mavg)
-    
-    # Average Directional Index (ADX)
-    up_move = high - high.shift(1)
-    down_move = low.shift(1) - low
-    
-    plus_dm = pd.Series(np.where((up_move > down_move) & (up_move > 0), up_move, 0), index=close.index)
-    minus_dm = pd.Series(np.where((down_move > up_move) & (down_move > 0), down_move, 0), index=close.index)
-    
-    atr14 = group['ATR']  # Reuse computed ATR
-    
-    # Prevent div by zero in ADX components
-    safe_atr = np.where(atr14 == 0, np.nan, atr14)
-    plus_di14 = 100 * (plus_dm.ewm(alpha=1/14, min_periods=14, adjust=False).mean() / safe_atr)
-    minus_di14 = 100 * (minus_dm.ewm(alpha=1/14, min_periods=14, adjust=False).mean() / safe_atr)
-    
-    di_sum = (plus_di14 + minus_di14).abs()
-    dx = np.where(di_sum == 0, 0, 100 * (plus_di14 - minus_di14).abs() / di_sum)
-    group['ADX'] = pd.Series(dx, index=close.index).ewm(alpha=1/14, min_periods=14, adjust=False).mean()
-    
-    # On-Balance Volume (OBV)
-    obv_change = np.where(close > prev_close, volume, np.where(close < prev_close, -volume, 0))
-    obv = pd.Series(obv_change, index=close.index).cumsum()
-    # DESIGN CHOICE: OBV slope approximated via 5-day simple moving difference
-    group['OBV_Slope_5d'] = obv.diff(periods=5) / 5
-    
-    # 8. Time-Series "Memory" Features (Page 7)
-    group['Lagged_Return_t1'] = group['Daily_Return_1d'].shift(1)
-    group['Lagged_Return_t3'] = group['Daily_Return_1d'].shift(3)
-    group['Lagged_Return_t5'] = group['Daily_Return_1d'].shift(5)
-    group['Dist_from_MA50'] = np.where(close == 0, 0, (close - group['MA50']) / close)
-
-    return group
-
 def generate_mock_data(filepath):
     """Creates a sample dataset if no input file is found to ensure script execution."""
     dates = pd.date_range(start="2024-01-01", periods=100)
@@ -130,54 +35,167 @@ def generate_mock_data(filepath):
     df.to_csv(filepath, index=False)
     print(f"Generated sample data at {filepath}")
 
-if __name__ == "__main__":
-    input_file = "stock_prices.csv"
-    output_file = "metrics.csv"
-    
-    if not os.path.exists(input_file):
-        generate_mock_data(input_file)
-        
-    print(f"Loading data from {input_file}...")
-    df = pd.read_csv(input_file)
+BASE_COLS = ['time', 'symbol', 'open', 'high', 'low', 'close', 'volume']
+NUM_COLS = ['open', 'high', 'low', 'close', 'volume']
+
+
+def prepare_prices(df):
+    """Parse time / numeric columns and put the database column order first."""
     df['time'] = pd.to_datetime(df['time'])
-    
-    # Enforce numeric types to prevent `.apply()` failing on dirty data across 1600 stocks
-    num_cols = ['open', 'high', 'low', 'close', 'volume']
-    for col in num_cols:
+
+    # Enforce numeric types to prevent the indicator build failing on dirty data across 1600 stocks
+    for col in NUM_COLS:
         if col in df.columns:
             df[col] = pd.to_numeric(df[col], errors='coerce')
-    
+
     # --- FIX 1: Enforce correct column order on the original input data ---
     # This ensures that when the database copies 'stock_prices.csv', it finds 'time' first.
-    base_cols = ['time', 'symbol', 'open', 'high', 'low', 'close', 'volume']
     # Safely order base columns, appending any unexpected extra columns to the end
-    ordered_input_cols = [c for c in base_cols if c in df.columns] + [c for c in df.columns if c not in base_cols]
-    df = df[ordered_input_cols]
-    
-    # Overwrite the input file so the database importer uses the corrected layout
-    df.to_csv(input_file, index=False)
-    print(f"Re-saved {input_file} with corrected column order ('time', 'symbol', ...)")
+    ordered_input_cols = [c for c in BASE_COLS if c in df.columns] + [c for c in df.columns if c not in BASE_COLS]
+    return df[ordered_input_cols]
 
-    print(f"Calculating indicators for {df['symbol'].nunique()} distinct symbols...")
-    # Process each symbol independently
-    metrics_df = df.groupby('symbol', group_keys=False).apply(calculate_indicators)
-    
+
+def finalize_metrics(metrics_df):
+    """Indicator frame -> metrics table rows: source fields dropped, inf/NaN -> 0, 4 decimals."""
     # --- REMOVE SOURCE FIELDS ---
     # Drop the original price and volume columns, keeping only time, symbol, and new indicators
-    metrics_df.drop(columns=num_cols, inplace=True, errors='ignore')
-    
+    metrics_df.drop(columns=NUM_COLS, inplace=True, errors='ignore')
+
     # --- GLOBAL ERROR HANDLING ---
     # Convert all infinite values (from division by zero) to NaN, then replace all NaNs with 0
     metrics_df.replace([np.inf, -np.inf], np.nan, inplace=True)
     metrics_df.fillna(0, inplace=True)
-    
+
     # Round to 4 decimal places to keep the CSV clean for downstream ML tasks
     metrics_df = metrics_df.round(4)
-    
+
     # --- FIX 2: Enforce correct column order on the metrics output data ---
     # Guarantee that 'time' and 'symbol' are the first two columns.
     final_cols = ['time', 'symbol'] + [col for col in metrics_df.columns if col not in ['time', 'symbol']]
-    metrics_df = metrics_df[final_cols]
+    return metrics_df[final_cols]
+
+
+def iter_symbol_blocks(input_file, chunk_rows):
+    """
+    Read a symbol-contiguous price CSV (the layout Scraper/data.py writes)
+    in chunks of about ``chunk_rows`` rows and yield frames that hold only
+    complete symbols.  The trailing symbol of each chunk is carried into
+    the next one, so a frame is at most chunk_rows plus one symbol's history.
+    """
+    seen = set()
+    carry = None
+    reader = pd.read_csv(input_file, chunksize=chunk_rows)
+
+    def complete(block):
+        symbols = block['symbol'].to_numpy()
+        heads = symbols[np.flatnonzero(np.r_[True, symbols[1:] != symbols[:-1]])]
+        if len(set(heads)) != len(heads) or seen.intersection(heads):
+            raise ValueError(f"{input_file} is not symbol-contiguous; sort it by symbol or run without --stream")
+        seen.update(heads)
+        return block.copy()
+
+    for chunk in reader:
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        symbols = chunk['symbol'].to_numpy()
+        tail_start = int(np.flatnonzero(np.r_[True, symbols[1:] != symbols[:-1]])[-1])
+        carry = chunk.iloc[tail_start:]
+        if tail_start:
+            yield complete(chunk.iloc[:tail_start])
+    if carry is not None and len(carry):
+        yield complete(carry)
+
+
+def reorder_input_columns(input_file, chunk_rows):
+    """
+    Streaming counterpart of the input re-save: rewrites ``input_file`` with
+    BASE_COLS first, as raw text and chunk by chunk, only when its header is
+    out of order.
+    """
+    with open(input_file, newline='') as f:
+        header = next(csv.reader(f))
+    ordered = [c for c in BASE_COLS if c in header] + [c for c in header if c not in BASE_COLS]
+    if header == ordered:
+        return False
+
+    tmp_file = input_file + '.tmp'
+    reader = pd.read_csv(input_file, chunksize=chunk_rows, dtype=str, keep_default_na=False)
+    for i, chunk in enumerate(reader):
+        chunk[ordered].to_csv(tmp_file, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+    os.replace(tmp_file, input_file)
+    return True
+
+
+def stream_metrics(input_file, output_file, chunk_rows, workers=1):
+    """
+    Bounded-memory metrics build: indicators per block of complete symbols,
+    appended to the output as each block finishes.  Produces the same rows,
+    in the same order, as the in-memory build.
+    """
+    if reorder_input_columns(input_file, chunk_rows):
+        print(f"Re-saved {input_file} with corrected column order ('time', 'symbol', ...)")
+
+    tmp_file = output_file + '.tmp'
+    rows = symbols = 0
+    try:
+        for i, block in enumerate(iter_symbol_blocks(input_file, chunk_rows)):
+            block = prepare_prices(block)
+            metrics_df = finalize_metrics(calculate_indicators(block, workers=workers))
+            metrics_df.to_csv(tmp_file, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+            rows += len(metrics_df)
+            symbols += block['symbol'].nunique()
+            print(f"  block {i + 1}: {len(metrics_df):,} rows ({rows:,} rows / {symbols} symbols so far)")
+            del block, metrics_df
+    except BaseException:
+        # Leave the previous metrics.csv untouched rather than a partial one.
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+    # A header-only input yields no blocks and so no tmp file; keep the previous output then.
+    if rows:
+        os.replace(tmp_file, output_file)
+    return rows, symbols
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build metrics.csv from stock_prices.csv")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Processes for the indicator build; symbols are split across them and "
+                             "share the price / indicator panels through shared memory")
+    parser.add_argument("--stream", action="store_true",
+                        help="Bounded-memory mode: read the (symbol-contiguous) price file in chunks "
+                             "and append each block's metrics to the output")
+    parser.add_argument("--chunk_rows", type=int, default=250_000,
+                        help="Rows read per chunk in --stream mode and when re-saving the input")
+    args = parser.parse_args()
+
+    input_file = "stock_prices.csv"
+    output_file = "metrics.csv"
+    
+    if not os.path.exists(input_file):
+        generate_mock_data(input_file)
+
+    if args.stream:
+        print(f"Streaming {input_file} in chunks of {args.chunk_rows:,} rows...")
+        rows, symbols = stream_metrics(input_file, output_file, args.chunk_rows, workers=args.workers)
+        if not rows:
+            print(f"{input_file} has no price rows; left {output_file} unchanged.")
+            sys.exit(0)
+        print(f"Successfully computed indicators for {symbols} symbols ({rows:,} rows) and saved to {output_file}.")
+        sys.exit(0)
+        
+    # The database importer needs 'time', 'symbol', ... first; the file is only rewritten when it is not.
+    if reorder_input_columns(input_file, args.chunk_rows):
+        print(f"Re-saved {input_file} with corrected column order ('time', 'symbol', ...)")
+
+    print(f"Loading data from {input_file}...")
+    df = prepare_prices(pd.read_csv(input_file))
+
+    print(f"Calculating indicators for {df['symbol'].nunique()} distinct symbols ({args.workers} worker(s))...")
+    # DESIGN CHOICE: All symbols are computed together on a [days x symbols] panel; every window
+    # and EWM runs per column, so indicators never bleed across symbols and the columns can be
+    # split across worker processes without any exchange between them.
+    metrics_df = finalize_metrics(calculate_indicators(df, workers=args.workers))
     
     metrics_df.to_csv(output_file, index=False)
-    print(f"Successfully computed indicators and saved to {output_file} with corrected column order.")
\ No newline at end of file
+    print(f"Successfully computed indicators and saved to {output_file} with corrected column order.")